@@ -0,0 +1,52 @@
+"""Compares the confirmation parser against re.findall with the default pattern.
+
+Run from the repository root: python benchmarks/bench_confirmation_parser.py
+"""
+
+import re
+import sys
+import timeit
+
+sys.path.append("src")
+from confirmation_parser import ConfirmationParser, DEFAULT_CONFIRMATION_PATTERN
+
+TYPICAL = [
+    "u/digitalmayhap 1 2",
+    "u/DigitalMayhap \\- 1 - 2\n\nu/YarnSwapper 0 1\n\nThanks both!",
+    "Got a lovely letter from u/penpal_123 this week, 0 1. Can't wait to write back!",
+    "Thank you so much! It was wonderful hearing from you, the stamps were great.",
+    "\n".join(f"u/penpal{index} {index % 3} {index % 5}" for index in range(20)),
+]
+PATHOLOGICAL = {
+    "whitespace runs": ("u/abc" + " " * 2500 + "1" + " " * 2500) * 2,
+    "dash runs": "u/abc 1" + " " * 3000 + "-" + " " * 3000 + "x",
+    "many mentions": "u/abc " * 1600,
+    "long names": ("u/" + "a" * 4000 + " ") * 2,
+}
+
+
+def per_call(function, body, number):
+    return timeit.timeit(lambda: function(body), number=number) / number
+
+
+def main():
+    regex = re.compile(DEFAULT_CONFIRMATION_PATTERN)
+    parser = ConfirmationParser(DEFAULT_CONFIRMATION_PATTERN)
+    for body in TYPICAL + list(PATHOLOGICAL.values()):
+        assert parser.findall(body) == regex.findall(body)[:50]
+
+    corpus = TYPICAL * 200
+    regex_time = timeit.timeit(lambda: [regex.findall(c) for c in corpus], number=5)
+    parser_time = timeit.timeit(lambda: [parser.findall(c) for c in corpus], number=5)
+    comments = len(corpus) * 5
+    print(f"typical comments ({comments}):")
+    print(f"  regex:  {regex_time / comments * 1e6:.2f} us/comment")
+    print(f"  parser: {parser_time / comments * 1e6:.2f} us/comment")
+    for name, body in PATHOLOGICAL.items():
+        print(f"{name} ({len(body)} characters):")
+        print(f"  regex:  {per_call(regex.findall, body, 3) * 1e3:.2f} ms")
+        print(f"  parser: {per_call(parser.findall, body, 3) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Compares the flair ladder lookup against the old linear template scan.
+
+Run from the repository root: python benchmarks/bench_flair_ladder.py
+"""
+
+import sys
+import timeit
+
+sys.path.append("src")
+from flair_ladder import FlairLadder
+
+TIERS = 60
+TIER_SIZE = 25
+MODS = [f"moderator{index}" for index in range(25)]
+
+
+def linear_find(flair_templates, current_mods, total_count, user):
+    for (min_count, max_count), template in flair_templates.items():
+        if min_count <= total_count <= max_count:
+            if template["mod_only"] == (user in current_mods):
+                return template
+    return None
+
+
+def main():
+    ranged_templates = [
+        (tier * TIER_SIZE, tier * TIER_SIZE + TIER_SIZE - 1, {"mod_only": False})
+        for tier in range(TIERS)
+    ]
+    flair_templates = {
+        (min_count, max_count): template
+        for min_count, max_count, template in ranged_templates
+    }
+    ladder = FlairLadder(ranged_templates)
+    mod_set = {mod.lower() for mod in MODS}
+    totals = range(0, TIERS * TIER_SIZE, 7)
+
+    linear = timeit.timeit(
+        lambda: [
+            linear_find(flair_templates, MODS, total, "penpal") for total in totals
+        ],
+        number=200,
+    )
+    bisected = timeit.timeit(
+        lambda: [ladder.find(total, "penpal" in mod_set) for total in totals],
+        number=200,
+    )
+    lookups = 200 * len(totals)
+    print(f"{TIERS} tiers, {len(MODS)} moderators, {lookups} lookups")
+    print(f"linear scan: {linear / lookups * 1e6:.2f} us/lookup")
+    print(f"flair ladder: {bisected / lookups * 1e6:.2f} us/lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""Measures the bot's real handlers against FakeReddit, an in-memory Reddit.
+
+Each case runs unmodified bot code against the settings recorded in
+tests/cassettes/load_settings.json plus synthetic users, flair and
+confirmation threads, with --latency seconds added to every API request:
+
+- settings_load: Settings for the subreddit, built from scratch
+- increment_flair_cold / increment_flair_warm: one flair increment for a
+  user the flair ledger hasn't seen, and for one it has
+- post_monthly_submission: a new monthly thread replacing last month's
+- handle_confirmation_thread_comment: comments confirming 1 to 3 users
+- handle_catchup: catching up on a thread of unprocessed comments
+
+The last two import main.py, so they need its dependencies installed and
+are reported as skipped otherwise. For each case the throughput, API calls
+per item, p50/p99 latency per operation, CPU time and peak traced memory,
+FakeReddit's own included, are printed and written to a JSON file named after the current commit, and
+--compare prints the change against an earlier results file.
+
+Run from the repository root: python benchmarks/bench_handlers.py
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+STATE_DIRECTORY = tempfile.mkdtemp(prefix="penpal-bench-")
+SUBREDDIT_NAME = "penpalbotdev"
+for name, value in {
+    "DEV": "1",
+    "SECRETS": json.dumps(
+        {
+            "REDDIT_CLIENT_ID": "bench",
+            "REDDIT_CLIENT_SECRET": "bench",
+            "REDDIT_USER_AGENT": "penpal confirmation bot benchmark",
+            "REDDIT_USERNAME": "PenPalConfirmationBo",
+            "REDDIT_PASSWORD": "bench",
+            "PUSHOVER_APP_TOKEN": "bench",
+            "PUSHOVER_USER_TOKEN": "bench",
+        }
+    ),
+    "SUBREDDIT_NAME": SUBREDDIT_NAME,
+    "BOT_STATE_DB": os.path.join(STATE_DIRECTORY, "bot_state.db"),
+    "JOURNAL_PATH": os.path.join(STATE_DIRECTORY, "bot_journal.jsonl"),
+    "LOG_PATH": os.path.join(STATE_DIRECTORY, "log.txt"),
+    "PUSHOVER_STATE_PATH": "",
+    "praw_check_for_updates": "False",
+}.items():
+    # anything already set, e.g. FLAIR_BATCH_WINDOW, is benchmarked as given
+    os.environ.setdefault(name, value)
+
+sys.path.append("benchmarks")
+sys.path.append("src")
+from fake_reddit import FakeReddit, FakeRedditAdapter, mounted
+from praw import models, Reddit
+from api_scheduler import ApiScheduler, ScheduledRequestor
+from helpers_flair import increment_flair
+from helpers_submission import post_monthly_submission
+from logger import LOGGER
+from settings import Settings
+
+CASSETTE = "tests/cassettes/load_settings.json"
+RESULTS_DIRECTORY = "bench_results"
+FLAIR_TEXT = "📧 Emails: {E} | 📬 Letters: {L}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--comments", type=int, default=200)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--output", help="defaults to bench_results/<commit>.json")
+    parser.add_argument("--compare", help="an earlier results file")
+    options = parser.parse_args()
+    random.seed(1)
+    _quiet_screen_logging()
+
+    # a rate limit high enough that prawcore never paces requests, the API calls per item show what Reddit's allows
+    backend = FakeReddit(rate_limit=10**7)
+    backend.seed_from_cassette(CASSETTE)
+    adapter = FakeRedditAdapter(backend, options.latency)
+    results = {
+        "commit": _commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "latency": options.latency,
+        "comments": options.comments,
+        "python": sys.version.split()[0],
+        "cases": {},
+    }
+    with mounted(adapter):
+        bot = Reddit(
+            requestor_class=ScheduledRequestor,
+            requestor_kwargs={"scheduler": ApiScheduler()},
+            client_id="bench",
+            client_secret="bench",
+            user_agent="penpal confirmation bot benchmark",
+            username=backend.bot_name,
+            password="bench",
+        )
+        bench = Bench(backend, bot, options)
+        for name, case in bench.cases():
+            results["cases"][name] = case()
+            _print_case(name, results["cases"][name])
+
+    output = options.output or os.path.join(
+        RESULTS_DIRECTORY, f"{results['commit'] or 'results'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {output}")
+    if options.compare:
+        with open(options.compare, "r", encoding="utf-8") as file:
+            _print_comparison(json.load(file), results)
+
+
+class Bench:
+    def __init__(self, backend: FakeReddit, bot: Reddit, options):
+        self.BACKEND = backend
+        self.BOT = bot
+        self.OPTIONS = options
+        self.settings = None
+        self.main = None
+        self._users = 0
+
+    def cases(self):
+        return [
+            ("settings_load", self.settings_load),
+            ("increment_flair_cold", lambda: self.increment_flair(warm=False)),
+            ("increment_flair_warm", lambda: self.increment_flair(warm=True)),
+            ("post_monthly_submission", self.post_monthly_submission),
+            ("handle_confirmation_thread_comment", self.confirmation_comments),
+            ("handle_catchup", self.catchup),
+        ]
+
+    def settings_load(self) -> dict:
+        def load():
+            Settings._instances.pop(SUBREDDIT_NAME, None)
+            self.settings = Settings(self.BOT, SUBREDDIT_NAME)
+
+        return self.measure(lambda: [load] * 10, "loads")
+
+    def increment_flair(self, warm: bool) -> dict:
+        def setup():
+            redditors = [
+                models.Redditor(self.BOT, _data=self.new_user())
+                for _ in range(self.OPTIONS.comments)
+            ]
+            if warm:
+                # the first increment puts the user in the flair ledger
+                for redditor in redditors:
+                    increment_flair(self.settings, redditor, 1, 0)
+            return [
+                lambda redditor=redditor: increment_flair(self.settings, redditor, 1, 1)
+                for redditor in redditors
+            ]
+
+        return self.measure(setup, "confirmations")
+
+    def post_monthly_submission(self) -> dict:
+        def last_months_thread():
+            for submission in self.BACKEND.submissions.values():
+                submission["stickied"] = False
+            self.BACKEND.add_submission(
+                "Last month's confirmation thread",
+                created_utc=time.time() - timedelta(days=40).total_seconds(),
+            )
+
+        return self.measure(
+            lambda: [lambda: post_monthly_submission(self.settings)] * 10,
+            "submissions",
+            before_each=last_months_thread,
+        )
+
+    def confirmation_comments(self) -> dict:
+        main = self.import_main()
+        if isinstance(main, str):
+            return {"skipped": main}
+        confirmations = []
+
+        def setup():
+            thread = self.new_thread()
+            comments = [
+                self.new_comment(thread, confirmations)
+                for _ in range(self.OPTIONS.comments)
+            ]
+            return [
+                lambda comment=comment: main.handle_confirmation_thread_comment(comment)
+                for comment in comments
+            ]
+
+        result = self.measure(setup, "comments")
+        # measure sets up twice, once for timing and once for memory
+        result["confirmations_per_comment"] = round(
+            len(confirmations) / (2 * self.OPTIONS.comments), 2
+        )
+        result["api_calls_per_confirmation"] = round(
+            result["api_calls_per_operation"] / result["confirmations_per_comment"], 2
+        )
+        return result
+
+    def catchup(self) -> dict:
+        main = self.import_main()
+        if isinstance(main, str):
+            return {"skipped": main}
+
+        def unprocessed_thread():
+            thread = self.new_thread()
+            for _ in range(self.OPTIONS.comments):
+                self.new_comment(thread, [])
+
+        result = self.measure(
+            lambda: [main.handle_catchup] * 3,
+            "catchups",
+            before_each=unprocessed_thread,
+        )
+        result["comments_per_second"] = round(
+            result["catchups_per_second"] * self.OPTIONS.comments, 1
+        )
+        return result
+
+    def measure(self, setup, unit: str, before_each=None) -> dict:
+        """Times the operations setup returns one by one, then runs a fresh set under tracemalloc.
+
+        Only the operations are counted: API calls made by setup and
+        before_each are left out.
+        """
+        operations = setup()
+        calls_before = sum(self.BACKEND.CALLS.values())
+        durations = []
+        cpu_started_at = time.process_time()
+        for operation in operations:
+            if before_each:
+                before_each()
+            started_at = time.perf_counter()
+            operation()
+            durations.append(time.perf_counter() - started_at)
+        cpu_seconds = time.process_time() - cpu_started_at
+        api_calls = sum(self.BACKEND.CALLS.values()) - calls_before
+
+        operations = setup()
+        tracemalloc.start()
+        for operation in operations:
+            if before_each:
+                before_each()
+            operation()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        elapsed = sum(durations)
+        return {
+            unit: len(durations),
+            f"{unit}_per_second": round(len(durations) / elapsed, 1),
+            "api_calls_per_operation": round(api_calls / len(durations), 2),
+            "p50_ms": round(_percentile(durations, 0.5) * 1000, 2),
+            "p99_ms": round(_percentile(durations, 0.99) * 1000, 2),
+            "cpu_ms_per_operation": round(cpu_seconds / len(durations) * 1000, 2),
+            "peak_memory_kb": round(peak_memory / 1024),
+        }
+
+    def import_main(self):
+        """Imports main.py, which loads its own settings, or returns why it can't be."""
+        if self.main is None:
+            # main.py creates the subreddit's Settings itself, the way the bot starts
+            Settings._instances.pop(SUBREDDIT_NAME, None)
+            try:
+                import main
+            except ImportError as ex:
+                self.main = f"main.py can't be imported: {ex}"
+            else:
+                self.main = main
+                self.settings = main.SETTINGS
+        return self.main
+
+    def new_user(self) -> dict:
+        self._users += 1
+        name = f"penpal_{self._users}"
+        if random.random() < 0.8:
+            emails, letters = random.randint(0, 40), random.randint(0, 40)
+            return self.BACKEND.add_user(name, FLAIR_TEXT.format(E=emails, L=letters))
+        return self.BACKEND.add_user(name)
+
+    def new_thread(self) -> dict:
+        for submission in self.BACKEND.submissions.values():
+            submission["stickied"] = False
+        return self.BACKEND.add_submission("Confirmation thread")
+
+    def new_comment(self, thread: dict, confirmations: list) -> models.Comment:
+        """Adds a comment confirming 1 to 3 users, most of whom have confirmed before."""
+        users = list(self.BACKEND.users.values())
+        if len(users) < self.OPTIONS.users:
+            users += [self.new_user() for _ in range(self.OPTIONS.users - len(users))]
+        author, *mentioned = random.sample(users, random.randint(2, 4))
+        confirmations += mentioned
+        body = "\n\n".join(
+            f"u/{user['name']} {random.randint(0, 2)} {random.randint(1, 2)}"
+            for user in mentioned
+        )
+        data = self.BACKEND.add_comment(thread["id"], author["name"], body)
+        # what the comment stream would hand the handler
+        return models.Comment(self.BOT, _data=dict(data))
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def _commit() -> str | None:
+    try:
+        return (
+            subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True,
+                check=True,
+                text=True,
+            ).stdout.strip()
+            or None
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _quiet_screen_logging() -> None:
+    """Keeps the bot logging to its file while the benchmark prints, so the cost of logging is still counted."""
+    handlers = list(LOGGER.handlers)
+    for handler in LOGGER.handlers:
+        handlers += getattr(getattr(handler, "listener", None), "handlers", ())
+    for handler in handlers:
+        if type(handler) is logging.StreamHandler:
+            handler.setStream(open(os.devnull, "w", encoding="utf-8"))
+
+
+def _print_case(name: str, result: dict) -> None:
+    if "skipped" in result:
+        print(f"{name}: skipped, {result['skipped']}")
+        return
+    print(f"{name}: " + ", ".join(f"{key} {value}" for key, value in result.items()))
+
+
+def _print_comparison(previous: dict, current: dict) -> None:
+    print(
+        f"Compared with {previous.get('commit')} at {previous.get('latency')}s latency:"
+    )
+    for name, result in current["cases"].items():
+        before = previous.get("cases", {}).get(name)
+        if not before or "skipped" in result or "skipped" in before:
+            continue
+        changes = [
+            f"{key} {before[key]} -> {value} ({(value - before[key]) / before[key]:+.0%})"
+            for key, value in result.items()
+            if isinstance(value, (int, float)) and before.get(key)
+        ]
+        print(f"{name}: " + ", ".join(changes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compares how long the comment handling thread spends logging, with and without LOG_ASYNC.
+
+Each simulated comment logs what the bot logs for a comment with two
+confirmations. Run from the repository root: python benchmarks/bench_logging.py
+"""
+
+import io
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append("src")
+from logger import configure_logger
+
+COMMENTS = 5000
+
+
+def log_comment(loggr: logging.Logger, index: int) -> None:
+    comment_id = f"c{index}"
+    loggr.info(
+        "Processing new comment https://reddit.com%s",
+        f"/r/penpals/comments/abc/_/{comment_id}/",
+        extra={"comment_id": comment_id},
+    )
+    for mentioned_name in ("digitalmayhap", "yarnswapper"):
+        loggr.info(
+            "Updated %s to %s for %s",
+            "📧 Emails: 1 | 📬 Letters: 2",
+            "📧 Emails: 2 | 📬 Letters: 2",
+            mentioned_name,
+            extra={
+                "comment_id": comment_id,
+                "mentioned_user": mentioned_name,
+                "old_flair": "📧 Emails: 1 | 📬 Letters: 2",
+                "new_flair": "📧 Emails: 2 | 📬 Letters: 2",
+            },
+        )
+    loggr.info(
+        "Handled comment %s in %.1f ms",
+        comment_id,
+        12.5,
+        extra={"comment_id": comment_id, "elapsed_ms": 12.5},
+    )
+
+
+def measure(name: str, directory: Path, **options) -> float:
+    loggr = logging.getLogger(f"bench-{name}")
+    loggr.propagate = False
+    configure_logger(
+        loggr, str(directory / f"{name}.log"), stream=io.StringIO(), **options
+    )
+    started = time.perf_counter()
+    for index in range(COMMENTS):
+        log_comment(loggr, index)
+    elapsed = time.perf_counter() - started
+    for handler in loggr.handlers:
+        if getattr(handler, "listener", None):
+            handler.listener.stop()
+        handler.close()
+    return elapsed / COMMENTS * 1e6
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        for json_lines in (False, True):
+            sync_time = measure(f"sync-{json_lines}", directory, json_lines=json_lines)
+            async_time = measure(
+                f"async-{json_lines}", directory, json_lines=json_lines, async_mode=True
+            )
+            print(
+                f"{'json' if json_lines else 'text'}: "
+                f"{sync_time:.1f} us per comment inline, "
+                f"{async_time:.1f} us with LOG_ASYNC=1 ({sync_time / async_time:.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compares confirmation throughput with 1, 2, 4 and 8 shard worker processes.
+
+Each simulated confirmation sleeps for a flair read and a flair write, the
+two Reddit requests increment_flair makes on a ledger miss, so the numbers
+show how far spreading users over processes hides API latency.
+
+Run from the repository root: python benchmarks/bench_shards.py
+"""
+
+import random
+import sys
+import threading
+import time
+
+sys.path.append("src")
+from shard_pool import ShardPool
+
+COMMENTS = 200
+USERS = 200
+REQUEST_LATENCY = 0.02
+SHARD_COUNTS = [1, 2, 4, 8]
+
+
+class SimulatedShard:
+    def __init__(self, index):
+        self.totals = {}
+
+    def confirm(self, matches):
+        results = []
+        for name, count in matches:
+            time.sleep(REQUEST_LATENCY)  # flair read
+            self.totals[name] = self.totals.get(name, 0) + count
+            time.sleep(REQUEST_LATENCY)  # flair write
+            results.append((name, self.totals[name]))
+        return results
+
+
+def run(shards, comments):
+    pool = ShardPool(shards, SimulatedShard, max_queued=COMMENTS)
+    done = threading.Semaphore(0)
+    totals = {}
+
+    def collect(shard_results):
+        for rows in shard_results:
+            for name, total in rows:
+                totals[name] = max(totals.get(name, 0), total)
+        done.release()
+
+    started_at = time.perf_counter()
+    for names in comments:
+        pool.submit(
+            names,
+            lambda positions, names=names: (
+                [(names[position], 1) for position in positions],
+            ),
+            collect,
+        )
+    for _ in comments:
+        done.acquire()
+    elapsed = time.perf_counter() - started_at
+    pool.stop()
+    return elapsed, totals
+
+
+def main():
+    random.seed(1)
+    users = [f"penpal{index}" for index in range(USERS)]
+    comments = [random.sample(users, random.randint(1, 3)) for _ in range(COMMENTS)]
+    expected = {}
+    for names in comments:
+        for name in names:
+            expected[name] = expected.get(name, 0) + 1
+
+    confirmations = sum(len(names) for names in comments)
+    print(
+        f"{COMMENTS} comments, {confirmations} confirmations, {USERS} users, "
+        f"{REQUEST_LATENCY * 1000:.0f} ms per request"
+    )
+    for shards in SHARD_COUNTS:
+        elapsed, totals = run(shards, comments)
+        assert totals == expected, "a user's total was lost or double counted"
+        print(f"{shards} shard(s): {elapsed:.2f}s, {COMMENTS / elapsed:.1f} comments/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,800 @@
+"""An in-memory stand-in for the parts of Reddit's API the bot uses.
+
+FakeReddit keeps users, flair, wiki pages, flair templates, submissions,
+comments and mail in memory, and answers requests in the shapes praw
+parses. The subreddit's settings can be seeded from a recorded cassette,
+so the bot loads the same wiki pages and flair templates it does in the
+tests. FakeRedditAdapter plugs it into praw's requests session with added
+latency, the way the tests plug in Betamax, and FakeRedditServer serves it
+over HTTP for a bot running in its own process.
+"""
+
+import csv
+import itertools
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import prawcore
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+sys.path.append("src")
+from metrics import endpoint_label
+
+# fullname prefixes Reddit uses for each kind of thing
+COMMENT, ACCOUNT, SUBMISSION, MESSAGE, SUBREDDIT = "t1", "t2", "t3", "t4", "t5"
+# top level comments Reddit returns with a submission before the rest become a "more" stub
+COMMENT_LIMIT = 200
+
+
+class FakeReddit:
+    """Reddit's API for one subreddit, moderated by the bot, held in memory.
+
+    handle(method, path, params, data) returns (status, body, headers) for
+    a request, with the X-Ratelimit headers Reddit sends. Every request is
+    counted in CALLS by method and endpoint, labelled like the
+    reddit_api_requests_total metric. When more than rate_limit requests
+    arrive within rate_window seconds, further requests get a 429 if
+    enforce_rate_limit is set.
+    """
+
+    def __init__(
+        self,
+        subreddit_name: str = "penpalbotdev",
+        bot_name: str = "PenPalConfirmationBo",
+        rate_limit: int = 1000,
+        rate_window: int = 600,
+        enforce_rate_limit: bool = False,
+    ):
+        self.SUBREDDIT_NAME = subreddit_name
+        self.SUBREDDIT_ID = "benchsr"
+        self.RATE_LIMIT = rate_limit
+        self.RATE_WINDOW = rate_window
+        self.ENFORCE_RATE_LIMIT = enforce_rate_limit
+        self.CALLS = Counter()
+        self.RATE_LIMITED = 0
+        self.me = {"name": bot_name, "id": "benchbot"}
+        # wiki page name: (content, revision id), missing pages are a 404 like on Reddit
+        self.wiki_pages = {}
+        self.flair_templates = []
+        self.moderators = [bot_name]
+        self.users = {}
+        self.flair = {}
+        self.submissions = {}
+        self.comments = {}
+        self.messages = {}
+        # messages the bot sent through Pushover, which can be pointed here with PUSHOVER_URL
+        self.notifications = []
+        self._replies = {}
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self._window_started = time.time()
+        self._window_used = 0
+        self._routes = [
+            ("POST", r"/api/v1/access_token", self._access_token),
+            ("GET", r"/api/v1/me", self._me),
+            ("GET", r"/r/(?P<sub>[^/]+)/about", self._subreddit_about),
+            ("GET", r"/r/(?P<sub>[^/]+)/about/moderators", self._moderators),
+            ("GET", r"/r/(?P<sub>[^/]+)/about/log", self._mod_log),
+            ("GET", r"/r/(?P<sub>[^/]+)/wiki/revisions", self._wiki_revisions),
+            ("GET", r"/r/(?P<sub>[^/]+)/wiki/(?P<page>.+)", self._wiki_page),
+            ("GET", r"/r/(?P<sub>[^/]+)/api/user_flair_v2", self._flair_templates),
+            ("POST", r"/r/(?P<sub>[^/]+)/api/flairtemplate_v2", self._edit_template),
+            ("GET", r"/r/(?P<sub>[^/]+)/api/flairlist", self._flair_list),
+            ("POST", r"/r/(?P<sub>[^/]+)/api/selectflair", self._select_flair),
+            ("POST", r"/r/(?P<sub>[^/]+)/api/flaircsv", self._flair_csv),
+            ("GET", r"/r/(?P<sub>[^/]+)/comments", self._subreddit_comments),
+            ("GET", r"/user/(?P<name>[^/]+)/about", self._user_about),
+            ("GET", r"/user/(?P<name>[^/]+)/submitted", self._user_submitted),
+            ("GET", r"/comments/(?P<id>[^/]+)(?:/.*)?", self._submission_comments),
+            ("GET", r"/api/info", self._info),
+            ("POST", r"/api/morechildren", self._more_children),
+            ("POST", r"/api/comment", self._reply),
+            ("POST", r"/api/submit", self._submit),
+            ("POST", r"/api/set_subreddit_sticky", self._sticky),
+            ("POST", r"/api/set_suggested_sort", self._ok),
+            ("POST", r"/api/lock", self._lock_submission),
+            ("POST", r"/api/save", self._save),
+            ("POST", r"/api/read_message", self._ok),
+            ("GET", r"/message/unread", self._unread),
+            ("POST", r"/api/mod/conversations", self._modmail),
+        ]
+
+    def seed_from_cassette(self, path: str) -> None:
+        """Takes the bot account, wiki pages, flair templates and moderators from a recorded settings load."""
+        with open(path, "r", encoding="utf-8") as file:
+            interactions = json.load(file)["http_interactions"]
+        for interaction in interactions:
+            request, response = interaction["request"], interaction["response"]
+            if request["method"] != "GET" or response["status"]["code"] != 200:
+                continue
+            path = urlsplit(request["uri"]).path.rstrip("/")
+            body = json.loads(response["body"]["string"])
+            if path == "/api/v1/me":
+                self.me = {"name": body["name"], "id": body["id"]}
+            elif "/wiki/" in path:
+                self.wiki_pages[path.split("/wiki/", 1)[1]] = (
+                    body["data"]["content_md"],
+                    body["data"]["revision_id"],
+                )
+            elif path.endswith("/api/user_flair_v2"):
+                self.flair_templates = body
+            elif path.endswith("/about/moderators"):
+                self.moderators = [mod["name"] for mod in body["data"]["children"]]
+            if path.startswith("/r/"):
+                self.SUBREDDIT_NAME = path.split("/")[2]
+
+    @property
+    def bot_name(self) -> str:
+        return self.me["name"]
+
+    def add_user(self, name: str, flair_text: str | None = None) -> dict:
+        with self._lock:
+            user = {"name": name, "id": self._new_id()}
+            self.users[name.lower()] = user
+            if flair_text is not None:
+                self.flair[name.lower()] = {
+                    "flair_text": flair_text,
+                    "flair_css_class": "",
+                }
+            return user
+
+    def add_submission(
+        self, title: str, created_utc: float | None = None, stickied: bool = True
+    ) -> dict:
+        """Adds a confirmation thread posted by the bot."""
+        with self._lock:
+            submission_id = self._new_id()
+            submission = {
+                "id": submission_id,
+                "name": f"{SUBMISSION}_{submission_id}",
+                "title": title,
+                "selftext": "",
+                "author": self.bot_name,
+                "author_fullname": f"{ACCOUNT}_{self.me['id']}",
+                "subreddit": self.SUBREDDIT_NAME,
+                "subreddit_id": f"{SUBREDDIT}_{self.SUBREDDIT_ID}",
+                "created_utc": created_utc or time.time(),
+                "stickied": stickied,
+                "locked": False,
+                "saved": False,
+                "num_comments": 0,
+                "permalink": f"/r/{self.SUBREDDIT_NAME}/comments/{submission_id}/confirmation_thread/",
+                "url": f"https://www.reddit.com/r/{self.SUBREDDIT_NAME}/comments/{submission_id}/confirmation_thread/",
+                "_comments": [],
+            }
+            self.submissions[submission_id] = submission
+            return submission
+
+    def add_comment(
+        self,
+        submission_id: str,
+        author: str,
+        body: str,
+        created_utc: float | None = None,
+        parent: str | None = None,
+    ) -> dict:
+        """Adds a comment to a submission, top level unless parent is a comment's fullname."""
+        with self._lock:
+            submission = self.submissions[submission_id]
+            comment_id = self._new_id()
+            author_user = self.users.get(author.lower()) or self.add_user(author)
+            comment = {
+                "id": comment_id,
+                "name": f"{COMMENT}_{comment_id}",
+                "body": body,
+                "author": author_user["name"],
+                "author_fullname": f"{ACCOUNT}_{author_user['id']}",
+                "link_id": submission["name"],
+                "link_author": submission["author"],
+                "parent_id": parent or submission["name"],
+                "subreddit": self.SUBREDDIT_NAME,
+                "subreddit_id": submission["subreddit_id"],
+                "created_utc": created_utc or time.time(),
+                "saved": False,
+                "removed": False,
+                "banned_by": None,
+                "stickied": False,
+                "replies": "",
+                "depth": 0 if parent is None else 1,
+                "permalink": f"{submission['permalink']}{comment_id}/",
+            }
+            self.comments[comment_id] = comment
+            self._replies.setdefault(comment["parent_id"], []).append(comment_id)
+            submission["_comments"].append(comment_id)
+            submission["num_comments"] += 1
+            return comment
+
+    def replies_to(self, fullname: str) -> list[dict]:
+        """Comments whose parent is fullname, oldest first."""
+        with self._lock:
+            return [
+                self.comments[comment_id]
+                for comment_id in self._replies.get(fullname, [])
+            ]
+
+    def handle(
+        self, method: str, path: str, params: dict, data: dict
+    ) -> tuple[int, object, dict]:
+        """Answers one API request, returning (status, JSON body, headers)."""
+        path = path.rstrip("/").removesuffix(".json") or "/"
+        if method == "POST" and path == "/1/messages":
+            with self._lock:
+                self.notifications.append(data.get("message", ""))
+            return (200, {"status": 1, "request": self._new_id()}, {})
+        self.CALLS[f"{method} {endpoint_label(path)}"] += 1
+        headers = self._rate_limit_headers()
+        if (
+            self.ENFORCE_RATE_LIMIT
+            and float(headers["x-ratelimit-remaining"]) < 0
+            and not path.endswith("/access_token")
+        ):
+            self.RATE_LIMITED += 1
+            return (429, {"message": "Too Many Requests", "error": 429}, headers)
+        for route_method, pattern, handler in self._routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                with self._lock:
+                    status, body = handler(params, data, **match.groupdict())
+                return (status, body, headers)
+        return (404, {"message": "Not Found", "error": 404}, headers)
+
+    def _rate_limit_headers(self) -> dict:
+        with self._lock:
+            now = time.time()
+            if now - self._window_started >= self.RATE_WINDOW:
+                self._window_started, self._window_used = now, 0
+            self._window_used += 1
+            return {
+                "x-ratelimit-used": str(self._window_used),
+                "x-ratelimit-remaining": str(
+                    float(self.RATE_LIMIT - self._window_used)
+                ),
+                "x-ratelimit-reset": str(
+                    int(self._window_started + self.RATE_WINDOW - now)
+                ),
+            }
+
+    def _new_id(self) -> str:
+        return _base36(next(self._ids) + 36**5)
+
+    # listings and things, in the JSON shapes Reddit returns
+
+    @staticmethod
+    def _thing(kind: str, data: dict) -> dict:
+        return {
+            "kind": kind,
+            "data": {key: value for key, value in data.items() if key[0] != "_"},
+        }
+
+    @staticmethod
+    def _listing(children: list, after: str | None = None) -> dict:
+        return {
+            "kind": "Listing",
+            "data": {
+                "after": after,
+                "before": None,
+                "dist": len(children),
+                "children": children,
+            },
+        }
+
+    def _page(self, items: list[dict], kind: str, params: dict) -> dict:
+        """A page of a newest first listing, following Reddit's limit, before and after parameters."""
+        limit = min(int(params.get("limit") or 25), 100)
+        names = [item["name"] for item in items]
+        if params.get("before") in names:
+            end = names.index(params["before"])
+            page = items[max(end - limit, 0) : end]
+        else:
+            start = (
+                names.index(params["after"]) + 1 if params.get("after") in names else 0
+            )
+            page = items[start : start + limit]
+        after = (
+            page[-1]["name"]
+            if page and page[-1]["name"] != names[-1] and not params.get("before")
+            else None
+        )
+        return self._listing([self._thing(kind, item) for item in page], after)
+
+    def _comment_or_none(self, fullname: str) -> dict | None:
+        return self.comments.get(fullname.split("_", 1)[-1])
+
+    # request handlers, called with the query parameters, the form data and the path groups
+
+    def _ok(self, params, data):
+        return (200, {"json": {"errors": []}})
+
+    def _access_token(self, params, data):
+        return (
+            200,
+            {
+                "access_token": "bench-token",
+                "token_type": "bearer",
+                "expires_in": 86400,
+                "scope": "*",
+            },
+        )
+
+    def _me(self, params, data):
+        return (200, dict(self.me))
+
+    def _subreddit_about(self, params, data, sub):
+        if sub.lower() != self.SUBREDDIT_NAME.lower():
+            return (404, {"message": "Not Found", "error": 404})
+        return (
+            200,
+            self._thing(
+                SUBREDDIT,
+                {
+                    "display_name": self.SUBREDDIT_NAME,
+                    "id": self.SUBREDDIT_ID,
+                    "name": f"{SUBREDDIT}_{self.SUBREDDIT_ID}",
+                    "subscribers": len(self.users),
+                },
+            ),
+        )
+
+    def _moderators(self, params, data, sub):
+        return (
+            200,
+            {
+                "kind": "UserList",
+                "data": {
+                    "children": [
+                        {
+                            "name": name,
+                            "id": f"{ACCOUNT}_{self._user_id(name)}",
+                            "mod_permissions": ["all"],
+                            "date": 0.0,
+                        }
+                        for name in self.moderators
+                    ]
+                },
+            },
+        )
+
+    def _mod_log(self, params, data, sub):
+        return (200, self._listing([]))
+
+    def _wiki_revisions(self, params, data, sub):
+        revisions = [
+            {
+                "id": revision_id,
+                "page": page,
+                "timestamp": 0.0,
+                "reason": None,
+                "author": None,
+            }
+            for page, (_, revision_id) in self.wiki_pages.items()
+        ]
+        return (200, self._listing(revisions))
+
+    def _wiki_page(self, params, data, sub, page):
+        if page not in self.wiki_pages:
+            return (404, {"reason": "PAGE_NOT_FOUND", "message": "Not Found"})
+        content, revision_id = self.wiki_pages[page]
+        return (
+            200,
+            {
+                "kind": "wikipage",
+                "data": {
+                    "content_md": content,
+                    "may_revise": True,
+                    "reason": None,
+                    "revision_date": 0,
+                    "revision_by": None,
+                    "revision_id": revision_id,
+                },
+            },
+        )
+
+    def _flair_templates(self, params, data, sub):
+        return (200, [dict(template) for template in self.flair_templates])
+
+    def _edit_template(self, params, data, sub):
+        for template in self.flair_templates:
+            if template["id"] == data.get("flair_template_id"):
+                template["css_class"] = data.get("css_class", template["css_class"])
+        return (200, {})
+
+    def _flair_list(self, params, data, sub):
+        name = params.get("name", "")
+        flair = self.flair.get(name.lower(), {})
+        return (
+            200,
+            {
+                "users": [
+                    {
+                        "user": self.users.get(name.lower(), {"name": name})["name"],
+                        "flair_text": flair.get("flair_text"),
+                        "flair_css_class": flair.get("flair_css_class"),
+                    }
+                ],
+                "next": None,
+                "prev": None,
+            },
+        )
+
+    def _select_flair(self, params, data, sub):
+        template = next(
+            (
+                template
+                for template in self.flair_templates
+                if template["id"] == data.get("flair_template_id")
+            ),
+            {"css_class": data.get("css_class", "")},
+        )
+        self.flair[data["name"].lower()] = {
+            "flair_text": data.get("text", ""),
+            "flair_css_class": template["css_class"],
+        }
+        return (200, {"json": {"errors": []}})
+
+    def _flair_csv(self, params, data, sub):
+        results = []
+        for user, text, css_class in csv.reader(data["flair_csv"].splitlines()):
+            self.flair[user.lower()] = {
+                "flair_text": text,
+                "flair_css_class": css_class,
+            }
+            results.append(
+                {
+                    "ok": True,
+                    "errors": {},
+                    "warnings": {},
+                    "status": f"added flair for user {user}",
+                }
+            )
+        return (200, results)
+
+    def _subreddit_comments(self, params, data, sub):
+        # comments are added as they're posted, so the newest are last
+        return (200, self._page(list(self.comments.values())[::-1], COMMENT, params))
+
+    def _user_about(self, params, data, name):
+        user = self._user(name)
+        if not user:
+            return (404, {"message": "Not Found", "error": 404})
+        return (200, self._thing(ACCOUNT, user))
+
+    def _user_submitted(self, params, data, name):
+        submissions = sorted(
+            (
+                submission
+                for submission in self.submissions.values()
+                if submission["author"].lower() == name.lower()
+            ),
+            key=lambda submission: submission["created_utc"],
+            reverse=True,
+        )
+        return (200, self._page(submissions, SUBMISSION, params))
+
+    def _submission_comments(self, params, data, id):
+        submission = self.submissions.get(id)
+        if not submission:
+            return (404, {"message": "Not Found", "error": 404})
+        top_level = [
+            self.comments[comment_id]
+            for comment_id in submission["_comments"]
+            if self.comments[comment_id]["parent_id"] == submission["name"]
+        ]
+        if params.get("sort", "confidence") in ("new", "confidence"):
+            top_level.reverse()
+        limit = int(params.get("limit") or COMMENT_LIMIT)
+        children = [self._thing(COMMENT, comment) for comment in top_level[:limit]]
+        remaining = [comment["id"] for comment in top_level[limit:]]
+        if remaining:
+            children.append(
+                {
+                    "kind": "more",
+                    "data": {
+                        "count": len(remaining),
+                        "name": f"{COMMENT}_{remaining[0]}",
+                        "id": remaining[0],
+                        "parent_id": submission["name"],
+                        "depth": 0,
+                        "children": remaining,
+                    },
+                }
+            )
+        return (
+            200,
+            [
+                self._listing([self._thing(SUBMISSION, submission)]),
+                self._listing(children),
+            ],
+        )
+
+    def _info(self, params, data):
+        things = []
+        for fullname in params.get("id", "").split(","):
+            kind, _, thing_id = fullname.partition("_")
+            if kind == COMMENT and thing_id in self.comments:
+                things.append(self._thing(COMMENT, self.comments[thing_id]))
+            elif kind == SUBMISSION and thing_id in self.submissions:
+                things.append(self._thing(SUBMISSION, self.submissions[thing_id]))
+        return (200, self._listing(things))
+
+    def _more_children(self, params, data):
+        # Reddit expands at most 100 ids per request
+        ids = data.get("children", "").split(",")[:100]
+        things = [
+            self._thing(COMMENT, self.comments[comment_id])
+            for comment_id in ids
+            if comment_id in self.comments
+        ]
+        return (200, {"json": {"errors": [], "data": {"things": things}}})
+
+    def _reply(self, params, data):
+        parent = data["thing_id"]
+        kind, _, parent_id = parent.partition("_")
+        if kind == COMMENT:
+            parent_comment = self.comments[parent_id]
+            submission_id = parent_comment["link_id"].split("_", 1)[1]
+        else:
+            submission_id = parent_id
+        comment = self.add_comment(
+            submission_id,
+            self.bot_name,
+            data["text"],
+            parent=parent if kind == COMMENT else None,
+        )
+        return (
+            200,
+            {
+                "json": {
+                    "errors": [],
+                    "data": {"things": [self._thing(COMMENT, comment)]},
+                }
+            },
+        )
+
+    def _submit(self, params, data):
+        submission = self.add_submission(data["title"])
+        submission["selftext"] = data.get("text", "")
+        submission["stickied"] = False
+        return (
+            200,
+            {
+                "json": {
+                    "errors": [],
+                    "data": {
+                        "url": submission["url"],
+                        "drafts_count": 0,
+                        "id": submission["id"],
+                        "name": submission["name"],
+                    },
+                }
+            },
+        )
+
+    def _sticky(self, params, data):
+        submission = self.submissions.get(data["id"].split("_", 1)[1])
+        if submission:
+            submission["stickied"] = data.get("state") == "True"
+        return (200, {"json": {"errors": []}})
+
+    def _lock_submission(self, params, data):
+        submission = self.submissions.get(data["id"].split("_", 1)[1])
+        if submission:
+            submission["locked"] = True
+        return (200, {})
+
+    def _save(self, params, data):
+        comment = self._comment_or_none(data["id"])
+        if comment:
+            comment["saved"] = True
+        return (200, {})
+
+    def _unread(self, params, data):
+        unread = [message for message in self.messages.values() if message["new"]]
+        return (200, self._page(unread[::-1], MESSAGE, params))
+
+    def _modmail(self, params, data):
+        conversation_id = self._new_id()
+        self.messages[conversation_id] = {
+            "id": conversation_id,
+            "name": f"{MESSAGE}_{conversation_id}",
+            "subject": data.get("subject", ""),
+            "body": data.get("body", ""),
+            "author": self.bot_name,
+            "new": False,
+            "was_comment": False,
+            "created_utc": time.time(),
+        }
+        author = {"name": self.bot_name, "id": self.me["id"], "isMod": True}
+        return (
+            201,
+            {
+                "conversation": {
+                    "id": conversation_id,
+                    "subject": data.get("subject", ""),
+                    "authors": [author],
+                    "owner": {
+                        "displayName": self.SUBREDDIT_NAME,
+                        "type": "subreddit",
+                        "id": f"{SUBREDDIT}_{self.SUBREDDIT_ID}",
+                    },
+                    "participant": author,
+                    "objIds": [{"id": f"{conversation_id}m", "key": "messages"}],
+                    "isAuto": False,
+                    "state": 0,
+                },
+                "messages": {
+                    f"{conversation_id}m": {
+                        "id": f"{conversation_id}m",
+                        "author": author,
+                        "body": data.get("body", ""),
+                        "bodyMarkdown": data.get("body", ""),
+                        "date": "2024-01-01T00:00:00.000000+00:00",
+                        "isInternal": False,
+                    }
+                },
+                "modActions": {},
+            },
+        )
+
+    def _user(self, name: str) -> dict | None:
+        if name.lower() == self.bot_name.lower():
+            return dict(self.me)
+        return self.users.get(name.lower())
+
+    def _user_id(self, name: str) -> str:
+        user = self._user(name)
+        return user["id"] if user else name.lower()
+
+
+class FakeRedditAdapter(BaseAdapter):
+    """A requests transport that answers from a FakeReddit, after latency seconds."""
+
+    def __init__(self, backend: FakeReddit, latency: float = 0):
+        super().__init__()
+        self.BACKEND = backend
+        self.LATENCY = latency
+
+    def __deepcopy__(self, memo) -> "FakeRedditAdapter":
+        # praw deep copies models passed as parameters, and with them the session
+        return self
+
+    def send(self, request, **kwargs):
+        if self.LATENCY:
+            time.sleep(self.LATENCY)
+        url = urlsplit(request.url)
+        body = request.body or ""
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        status, payload, headers = self.BACKEND.handle(
+            request.method, url.path, dict(parse_qsl(url.query)), dict(parse_qsl(body))
+        )
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(
+            {"content-type": "application/json; charset=UTF-8", **headers}
+        )
+        response._content = json.dumps(payload).encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeRedditServer(ThreadingHTTPServer):
+    """Serves a FakeReddit over HTTP, for a bot whose praw.ini sets oauth_url and reddit_url to its url.
+
+    Every response is delayed by latency seconds, and error_rate of them,
+    chosen at random, are a 503 the backend never sees. start_outage(seconds)
+    turns every request into a 503 for that long.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        backend: FakeReddit,
+        address: tuple[str, int] = ("127.0.0.1", 0),
+        latency: float = 0,
+        error_rate: float = 0,
+    ):
+        super().__init__(address, _FakeRedditRequestHandler)
+        self.BACKEND = backend
+        self.LATENCY = latency
+        self.ERROR_RATE = error_rate
+        self.ERRORS = 0
+        self._outage_until = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start_outage(self, seconds: float) -> None:
+        self._outage_until = time.monotonic() + seconds
+
+    def in_outage(self) -> bool:
+        return time.monotonic() < self._outage_until
+
+    def serve_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class _FakeRedditRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self._respond()
+
+    def _respond(self) -> None:
+        server = self.server
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        if server.LATENCY:
+            time.sleep(server.LATENCY)
+        if server.in_outage() or random.random() < server.ERROR_RATE:
+            server.ERRORS += 1
+            status, payload, headers = (503, {"message": "Service Unavailable"}, {})
+        else:
+            status, payload, headers = server.BACKEND.handle(
+                self.command,
+                url.path,
+                dict(parse_qsl(url.query)),
+                dict(parse_qsl(body)),
+            )
+        content = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def mounted(adapter: FakeRedditAdapter):
+    """Sends the requests of every Reddit instance created inside the block to adapter.
+
+    Mounted where prawcore creates its session, like the tests wrap that
+    session in Betamax, so code that builds its own Reddit instance, like
+    main.py, runs unchanged.
+    """
+    original_init = prawcore.Requestor.__init__
+
+    def __init__(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        self._http.mount("https://", adapter)
+
+    prawcore.Requestor.__init__ = __init__
+    try:
+        yield adapter
+    finally:
+        prawcore.Requestor.__init__ = original_init
+
+
+def _base36(number: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    text = ""
+    while number:
+        number, remainder = divmod(number, 36)
+        text = digits[remainder] + text
+    return text or "0"
@@ -0,0 +1,323 @@
+"""Soak test: runs the unmodified bot against FakeRedditServer while confirmations pour in.
+
+Starts a FakeRedditServer seeded from tests/cassettes/load_settings.json
+and starts src/main.py pointed at it, through PUSHOVER_URL and a praw.ini
+in XDG_CONFIG_HOME that sets praw's oauth_url and reddit_url. Once the
+bot's startup catchup finished, --comments confirmation comments are
+posted to this month's thread at --rate per second. --outage-after seconds
+in, --outage-seconds takes the server down for that long. An outage long
+enough for the bot's outage threshold has the recovery catchup pick up
+what was posted meanwhile; a shorter one shows what the bot loses.
+
+Once every comment has a reply, or nothing changed for --drain-timeout
+seconds, the results are checked: every comment must have exactly one
+reply from the bot and every user's flair must add up to their
+confirmations. Throughput, reply latency, API calls and rejected requests
+are printed, and written as JSON with --output. The exit status is 1 when
+a check failed. Environment variables are passed on to the bot, so e.g.
+ASYNC_RUNTIME=1 or WORKER_COUNT=4 soak those modes. With --no-bot the
+server just runs and prints the environment to start the bot with.
+
+Run from the repository root: python benchmarks/soak.py --comments 5000 --rate 20
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+STATE_DIRECTORY = tempfile.mkdtemp(prefix="penpal-soak-")
+os.environ.setdefault("LOG_PATH", os.path.join(STATE_DIRECTORY, "soak_log.txt"))
+
+sys.path.append("benchmarks")
+from fake_reddit import FakeReddit, FakeRedditServer
+
+CASSETTE = "tests/cassettes/load_settings.json"
+FLAIR_TEXT = "📧 Emails: {E} | 📬 Letters: {L}"
+FLAIR_PATTERN = re.compile(r"Emails: (\d+) \| \S+ Letters: (\d+)")
+# the recorded ranges end at 100, this one keeps thousands of confirmations from running out of flair
+OPEN_RANGE_TEMPLATE = {
+    "id": "soak-open-range",
+    "text": "101-999999:" + FLAIR_TEXT,
+    "css_class": "",
+    "mod_only": False,
+    "text_editable": False,
+    "type": "text",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--comments", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=10, help="comments per second")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--rate-limit", type=int, default=1000)
+    parser.add_argument("--rate-window", type=int, default=600)
+    parser.add_argument("--outage-after", type=float, default=0)
+    parser.add_argument("--outage-seconds", type=float, default=0)
+    parser.add_argument("--drain-timeout", type=float, default=300)
+    parser.add_argument("--no-bot", action="store_true")
+    parser.add_argument("--output")
+    options = parser.parse_args()
+    random.seed(1)
+
+    backend = FakeReddit(
+        rate_limit=options.rate_limit,
+        rate_window=options.rate_window,
+        enforce_rate_limit=True,
+    )
+    backend.seed_from_cassette(CASSETTE)
+    backend.flair_templates.append(dict(OPEN_RANGE_TEMPLATE))
+    soak = Soak(backend, options)
+    server = FakeRedditServer(
+        backend, (options.host, options.port), options.latency, options.error_rate
+    )
+    server.serve_in_background()
+    environment = soak.bot_environment(server.url)
+    print(f"Serving r/{backend.SUBREDDIT_NAME} at {server.url}")
+    if options.no_bot:
+        print("Start the bot with:")
+        for name, value in environment.items():
+            print(f"  {name}={value!r}")
+        input("Press enter to start posting comments")
+        bot = None
+    else:
+        bot = soak.start_bot(environment)
+        if not soak.wait_for_catchup(bot):
+            bot.kill()
+            print(f"The bot didn't finish its catchup, see {soak.BOT_LOG}")
+            sys.exit(1)
+    if options.outage_seconds:
+        threading.Timer(
+            options.outage_after, server.start_outage, [options.outage_seconds]
+        ).start()
+
+    try:
+        soak.post_comments()
+        soak.drain(server)
+    finally:
+        if bot:
+            bot.terminate()
+            try:
+                bot.wait(10)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+
+    results = soak.results(server)
+    for name, value in results.items():
+        print(f"{name}: {value}")
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    if bot:
+        print(f"Bot log: {soak.BOT_LOG}")
+    sys.exit(0 if results["passed"] else 1)
+
+
+class Soak:
+    def __init__(self, backend: FakeReddit, options):
+        self.BACKEND = backend
+        self.OPTIONS = options
+        self.BOT_LOG = os.path.join(STATE_DIRECTORY, "bot_output.txt")
+        self.BOT_LOG_PATH = os.path.join(STATE_DIRECTORY, "log.txt")
+        self.users = [
+            backend.add_user(
+                f"penpal_{index}",
+                FLAIR_TEXT.format(E=random.randint(0, 20), L=random.randint(0, 20)),
+            )
+            for index in range(options.users)
+        ]
+        self.expected = {
+            user["name"].lower(): self._flair_counts(
+                backend.flair[user["name"].lower()]["flair_text"]
+            )
+            for user in self.users
+        }
+        self.thread = backend.add_submission(
+            datetime.now(timezone.utc).strftime("%B %Y Confirmation Thread")
+        )
+        self.comments = []
+        self.confirmations = 0
+        self.started_at = None
+
+    def bot_environment(self, url: str) -> dict[str, str]:
+        # praw only reads its urls from praw.ini or Reddit's arguments, not from praw_ variables
+        with open(
+            os.path.join(STATE_DIRECTORY, "praw.ini"), "w", encoding="utf-8"
+        ) as file:
+            file.write(f"[DEFAULT]\noauth_url={url}\nreddit_url={url}\n")
+        return {
+            "DEV": "1",
+            "SECRETS": json.dumps(
+                {
+                    "REDDIT_CLIENT_ID": "soak",
+                    "REDDIT_CLIENT_SECRET": "soak",
+                    "REDDIT_USER_AGENT": "penpal confirmation bot soak test",
+                    "REDDIT_USERNAME": self.BACKEND.bot_name,
+                    "REDDIT_PASSWORD": "soak",
+                    "PUSHOVER_APP_TOKEN": "soak",
+                    "PUSHOVER_USER_TOKEN": "soak",
+                }
+            ),
+            "SUBREDDIT_NAME": self.BACKEND.SUBREDDIT_NAME,
+            "XDG_CONFIG_HOME": STATE_DIRECTORY,
+            "praw_check_for_updates": "False",
+            "PUSHOVER_URL": f"{url}/1/messages.json",
+            "PUSHOVER_STATE_PATH": "",
+            "BOT_STATE_DB": os.path.join(STATE_DIRECTORY, "bot_state.db"),
+            "JOURNAL_PATH": os.path.join(STATE_DIRECTORY, "bot_journal.jsonl"),
+            "LOG_PATH": self.BOT_LOG_PATH,
+        }
+
+    def start_bot(self, environment: dict[str, str]) -> subprocess.Popen:
+        with open(self.BOT_LOG, "w", encoding="utf-8") as log:
+            return subprocess.Popen(
+                [sys.executable, "src/main.py"],
+                env={**os.environ, **environment},
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+
+    def wait_for_catchup(self, bot: subprocess.Popen, timeout: float = 120) -> bool:
+        """Waits for the bot to log that its startup catchup finished, False if it exited or timed out."""
+        deadline = time.time() + timeout
+        while time.time() < deadline and bot.poll() is None:
+            if os.path.exists(self.BOT_LOG_PATH):
+                with open(self.BOT_LOG_PATH, "r", encoding="utf-8") as file:
+                    if "Catchup finished" in file.read():
+                        return True
+            time.sleep(0.5)
+        return False
+
+    def post_comments(self) -> None:
+        """Posts the confirmation comments at the requested rate, each confirming 1 to 3 other users."""
+        self.started_at = time.time()
+        for index in range(self.OPTIONS.comments):
+            delay = self.started_at + index / self.OPTIONS.rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            author, *mentioned = random.sample(self.users, random.randint(2, 4))
+            lines = []
+            for user in mentioned:
+                emails, letters = random.randint(0, 2), random.randint(1, 2)
+                counts = self.expected[user["name"].lower()]
+                counts[0] += emails
+                counts[1] += letters
+                lines.append(f"u/{user['name']} {emails} {letters}")
+            self.confirmations += len(mentioned)
+            self.comments.append(
+                self.BACKEND.add_comment(
+                    self.thread["id"], author["name"], "\n\n".join(lines)
+                )
+            )
+            if index and index % 500 == 0:
+                self._progress()
+
+    def drain(self, server: FakeRedditServer) -> None:
+        """Waits until every comment has a reply, or nothing changed for the drain timeout after an outage."""
+        replied, changed_at = -1, time.time()
+        for waited in range(sys.maxsize):
+            if replied == len(self.comments):
+                return
+            now_replied = len(self._replies())
+            if now_replied != replied or server.in_outage():
+                replied, changed_at = now_replied, time.time()
+            elif time.time() - changed_at > self.OPTIONS.drain_timeout:
+                print(
+                    f"Gave up waiting, nothing replied to for {self.OPTIONS.drain_timeout:.0f}s"
+                )
+                return
+            time.sleep(1)
+            if waited % 10 == 9:
+                self._progress()
+
+    def results(self, server: FakeRedditServer) -> dict:
+        replies = self._replies()
+        latencies = sorted(
+            replies[comment["id"]][0]["created_utc"] - comment["created_utc"]
+            for comment in self.comments
+            if comment["id"] in replies
+        )
+        missing = len(self.comments) - len(replies)
+        duplicated = sum(1 for bot_replies in replies.values() if len(bot_replies) > 1)
+        wrong_flair = sorted(
+            name
+            for name, counts in self.expected.items()
+            if self._flair_counts(self.BACKEND.flair[name]["flair_text"]) != counts
+        )
+        finished_at = max(
+            (reply[0]["created_utc"] for reply in replies.values()), default=None
+        )
+        api_calls = sum(self.BACKEND.CALLS.values())
+        return {
+            "comments": len(self.comments),
+            "confirmations": self.confirmations,
+            "comments_per_second": (
+                round(len(replies) / (finished_at - self.started_at), 2)
+                if finished_at
+                else 0
+            ),
+            "reply_latency_p50_s": _percentile(latencies, 0.5),
+            "reply_latency_p99_s": _percentile(latencies, 0.99),
+            "api_calls": api_calls,
+            "api_calls_per_confirmation": round(
+                api_calls / max(self.confirmations, 1), 2
+            ),
+            "rate_limited_requests": self.BACKEND.RATE_LIMITED,
+            "injected_errors": server.ERRORS,
+            "modmail_sent": len(self.BACKEND.messages),
+            "notifications_sent": len(self.BACKEND.notifications),
+            "missing_replies": missing,
+            "duplicate_replies": duplicated,
+            "wrong_flair": len(wrong_flair),
+            "wrong_flair_users": wrong_flair[:20],
+            "passed": not missing and not duplicated and not wrong_flair,
+        }
+
+    def _replies(self) -> dict[str, list[dict]]:
+        """The bot's replies to each replied to comment, by comment id."""
+        bot_name = self.BACKEND.bot_name.lower()
+        replies = {}
+        for comment in self.comments:
+            bot_replies = [
+                reply
+                for reply in self.BACKEND.replies_to(comment["name"])
+                if reply["author"].lower() == bot_name
+            ]
+            if bot_replies:
+                replies[comment["id"]] = bot_replies
+        return replies
+
+    def _flair_counts(self, flair_text: str) -> list[int] | None:
+        match = FLAIR_PATTERN.search(flair_text or "")
+        return [int(match.group(1)), int(match.group(2))] if match else None
+
+    def _progress(self) -> None:
+        print(
+            f"{time.time() - self.started_at:.0f}s: {len(self.comments)} comments posted, "
+            f"{len(self._replies())} replied to, {sum(self.BACKEND.CALLS.values())} API calls, "
+            f"{self.BACKEND.RATE_LIMITED} rate limited",
+            flush=True,
+        )
+
+
+def _percentile(values: list[float], fraction: float) -> float | None:
+    if not values:
+        return None
+    return round(values[max(math.ceil(fraction * len(values)) - 1, 0)], 2)
+
+
+if __name__ == "__main__":
+    main()
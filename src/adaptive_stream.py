@@ -0,0 +1,198 @@
+import time
+from praw.models.util import BoundedSet
+from logger import LOGGER
+from metrics import METRICS
+
+LISTING_LIMIT = 100
+# a poll returning at least this share of the listing is treated as a burst
+FULL_FRACTION = 0.9
+# how full polls should come back at the current rate, leaving room for bursts
+TARGET_FRACTION = 0.25
+# weight of the newest poll in the arrival rate estimate
+RATE_WEIGHT = 0.3
+# listing pages fetched at most to fill one gap, Reddit's listings end at about 1000 items anyway
+MAX_GAP_PAGES = 9
+
+
+class AdaptiveStream:
+    """Drop-in replacement for a praw stream like subreddit.stream.comments.
+
+    Calling it returns a generator with the same pause_after and
+    skip_existing behaviour as praw's stream_generator, over a listing
+    function such as subreddit.comments or inbox.unread. The polling
+    interval follows the arrival rate instead of a fixed backoff: it is
+    sized so a poll comes back about a quarter full, between MIN_INTERVAL
+    and MAX_INTERVAL, and the next poll goes out right away when one comes
+    back nearly full.
+
+    Like praw, a poll asks for what came after the newest item seen, and
+    without that cursor after a poll that found nothing. Such a poll only
+    returns the newest items, so when it comes back full of new ones more
+    arrived between polls than one listing holds. The stream then pages
+    back through the listing from the oldest of them until it meets an item
+    it has already seen, and yields the missed items first, oldest first. Overflows, recovered items and gaps
+    that couldn't be closed are logged and counted in the metrics.
+
+    What has been seen is kept on the object, so a stream recreated after
+    an error carries on where the last one stopped.
+    """
+
+    def __init__(
+        self,
+        function,
+        name: str,
+        min_interval: float = 1,
+        max_interval: float = 60,
+        attribute_name: str = "fullname",
+    ):
+        self.FUNCTION = function
+        self.NAME = name
+        self.MIN_INTERVAL = min_interval
+        self.MAX_INTERVAL = max_interval
+        self.ATTRIBUTE_NAME = attribute_name
+        self.interval = min_interval
+        self._seen = BoundedSet(LISTING_LIMIT * (MAX_GAP_PAGES + 2))
+        self._newest = None
+        self._polled_at = None
+        self._rate = None
+        self._without_before = 0
+
+    def __call__(
+        self, pause_after: int | None = None, skip_existing: bool = False, **kwargs
+    ):
+        return self._stream(pause_after, skip_existing, kwargs)
+
+    def _stream(self, pause_after, skip_existing, function_kwargs):
+        responses_without_new = 0
+        while True:
+            wait = self._next_poll_in()
+            if wait > 0:
+                if pause_after is None:
+                    time.sleep(wait)
+                else:
+                    # sleep no longer than praw would before handing control back
+                    time.sleep(min(wait, self.MIN_INTERVAL))
+                    if self._next_poll_in() > 0:
+                        yield None
+                        continue
+
+            new_items = self.poll(function_kwargs)
+            if not skip_existing:
+                yield from new_items
+            skip_existing = False
+            if pause_after is not None and pause_after < 0:
+                yield None
+            elif new_items:
+                responses_without_new = 0
+            else:
+                responses_without_new += 1
+                if pause_after is not None and responses_without_new > pause_after:
+                    responses_without_new = 0
+                    yield None
+
+    def poll(self, function_kwargs: dict | None = None) -> list:
+        """Fetches what is new since the last poll, oldest first, and adapts the interval."""
+        function_kwargs = function_kwargs or {}
+        first_poll = self._polled_at is None
+        cursor = self._newest
+        limit = LISTING_LIMIT
+        if cursor is None:
+            # varies the request like praw does, so a cached listing isn't served again
+            limit -= self._without_before
+            self._without_before = (self._without_before + 1) % 30
+        items = list(
+            self.FUNCTION(limit=limit, params={"before": cursor}, **function_kwargs)
+        )
+        new_items = [item for item in reversed(items) if not self._is_seen(item)]
+        # from a cursor the next poll carries on where a full one stopped, without one it can't
+        if (
+            cursor is None
+            and not first_poll
+            and len(items) >= limit
+            and not self._is_seen(items[-1])
+        ):
+            new_items = self._fill_gap(items[-1], function_kwargs) + new_items
+
+        for item in new_items:
+            self._seen.add(self._attribute(item))
+        if new_items:
+            self._newest = self._attribute(new_items[-1])
+        else:
+            self._newest = None
+        self._adapt(len(new_items), len(new_items) >= limit * FULL_FRACTION)
+        METRICS.inc("stream_polls_total", stream=self.NAME)
+        return new_items
+
+    def _fill_gap(self, oldest, function_kwargs: dict) -> list:
+        """Pages back from oldest until an already seen item, returning what was missed oldest first."""
+        METRICS.inc("stream_overflows_total", stream=self.NAME)
+        missed = []
+        closed = False
+        after = self._attribute(oldest)
+        for _ in range(MAX_GAP_PAGES):
+            page = list(
+                self.FUNCTION(
+                    limit=LISTING_LIMIT, params={"after": after}, **function_kwargs
+                )
+            )
+            for item in page:
+                if self._is_seen(item):
+                    closed = True
+                    break
+                missed.append(item)
+            if closed or len(page) < LISTING_LIMIT:
+                # a short page is the end of the listing, nothing older to miss
+                closed = True
+                break
+            after = self._attribute(page[-1])
+        METRICS.inc("stream_gap_items_total", len(missed), stream=self.NAME)
+        if closed:
+            LOGGER.warning(
+                "The %s stream overflowed between polls, recovered %s missed items",
+                self.NAME,
+                len(missed),
+            )
+        else:
+            METRICS.inc("stream_unrecovered_gaps_total", stream=self.NAME)
+            LOGGER.warning(
+                "The %s stream overflowed between polls and %s pages back didn't reach the last seen item, some items may be missed",
+                self.NAME,
+                MAX_GAP_PAGES,
+            )
+        return list(reversed(missed))
+
+    def _adapt(self, new_count: int, full: bool) -> None:
+        now = time.monotonic()
+        elapsed = max(now - self._polled_at, 0.001) if self._polled_at else None
+        self._polled_at = now
+        if elapsed is not None:
+            observed = new_count / elapsed
+            self._rate = (
+                observed
+                if self._rate is None
+                else RATE_WEIGHT * observed + (1 - RATE_WEIGHT) * self._rate
+            )
+        if full:
+            # more are likely waiting, poll again right away like praw does
+            self.interval = 0
+        elif self._rate is None:
+            self.interval = self.MIN_INTERVAL
+        elif self._rate <= 0:
+            self.interval = self.MAX_INTERVAL
+        else:
+            self.interval = min(
+                max(TARGET_FRACTION * LISTING_LIMIT / self._rate, self.MIN_INTERVAL),
+                self.MAX_INTERVAL,
+            )
+        METRICS.set("stream_poll_interval_seconds", self.interval, stream=self.NAME)
+
+    def _next_poll_in(self) -> float:
+        if self._polled_at is None:
+            return 0
+        return self._polled_at + self.interval - time.monotonic()
+
+    def _is_seen(self, item) -> bool:
+        return self._attribute(item) in self._seen
+
+    def _attribute(self, item) -> str:
+        return getattr(item, self.ATTRIBUTE_NAME)
@@ -0,0 +1,194 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from logger import LOGGER
+from metrics import METRICS, endpoint_label
+from prawcore import Requestor
+
+CONFIRMATION = 0
+CATCHUP = 1
+HOUSEKEEPING = 2
+PRIORITY_NAMES = {
+    CONFIRMATION: "confirmation",
+    CATCHUP: "catchup",
+    HOUSEKEEPING: "housekeeping",
+}
+
+# requests left in the rate limit window that lower priorities leave for higher ones
+RESERVES = {CONFIRMATION: 0, CATCHUP: 20, HOUSEKEEPING: 50}
+
+_PRIORITY = contextvars.ContextVar("api_priority", default=CONFIRMATION)
+
+
+@contextmanager
+def priority(level: int):
+    """Sends every Reddit request made inside the block with the given priority."""
+    token = _PRIORITY.set(level)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+class ApiScheduler:
+    """Shares Reddit's rate limit budget between request priorities.
+
+    Tracks the X-Ratelimit headers of every response. A request only goes out
+    while no higher priority request is waiting and more requests remain in
+    the window than its priority's reserve; otherwise it waits for the window
+    to reset. Confirmations have no reserve, so they are never held back.
+    """
+
+    def __init__(self, reserves: dict[int, int] = RESERVES):
+        self.RESERVES = reserves
+        self._condition = threading.Condition()
+        self._remaining = None
+        self._reset_at = None
+        self._waiting = {level: 0 for level in reserves}
+        self._waited = {level: 0.0 for level in reserves}
+        self._sent = {level: 0 for level in reserves}
+
+    def __deepcopy__(self, memo) -> "ApiScheduler":
+        # copies of the Reddit instance, like the ones praw makes of listing parameters, share the rate limit
+        return self
+
+    def acquire(self, level: int, timeout: float | None = None) -> bool:
+        """Waits until a request of the given priority may go out, up to timeout seconds."""
+        started_at = time.monotonic()
+        with self._condition:
+            self._waiting[level] += 1
+            try:
+                while not self._may_send(level):
+                    wait = self._seconds_until_reset()
+                    if timeout is not None:
+                        wait = min(wait, timeout - (time.monotonic() - started_at))
+                        if wait <= 0:
+                            return False
+                    self._condition.wait(wait)
+            finally:
+                self._waiting[level] -= 1
+                self._waited[level] += time.monotonic() - started_at
+            if self._remaining is not None:
+                self._remaining -= 1
+            self._sent[level] += 1
+            self._condition.notify_all()
+            return True
+
+    def update(self, headers) -> None:
+        """Records the rate limit reported by a Reddit response."""
+        if "x-ratelimit-remaining" not in headers:
+            return
+        with self._condition:
+            self._remaining = float(headers["x-ratelimit-remaining"])
+            METRICS.set("reddit_ratelimit_remaining", self._remaining)
+            self._reset_at = time.monotonic() + float(headers["x-ratelimit-reset"])
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """Returns the remaining budget plus queue depth, requests sent and total wait per priority."""
+        with self._condition:
+            return {
+                "remaining": self._remaining,
+                "priorities": {
+                    PRIORITY_NAMES[level]: {
+                        "waiting": self._waiting[level],
+                        "sent": self._sent[level],
+                        "wait_seconds": self._waited[level],
+                    }
+                    for level in self.RESERVES
+                },
+            }
+
+    def _may_send(self, level: int) -> bool:
+        if any(self._waiting[higher] for higher in self.RESERVES if higher < level):
+            return False
+        if self._remaining is None:
+            return True
+        if self._reset_at <= time.monotonic():
+            self._remaining = None
+            return True
+        return self._remaining > self.RESERVES[level]
+
+    def _seconds_until_reset(self) -> float:
+        if self._reset_at is None:
+            return 1.0
+        return max(self._reset_at - time.monotonic(), 0.1)
+
+
+class ScheduledRequestor(Requestor):
+    """prawcore requestor that sends every request through an ApiScheduler.
+
+    Use with Reddit(requestor_class=ScheduledRequestor, requestor_kwargs={"scheduler": ...}).
+    """
+
+    def __init__(self, *args, scheduler: ApiScheduler, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+
+    def request(self, method, url, *args, **kwargs):
+        self.scheduler.acquire(_PRIORITY.get())
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except Exception:
+            METRICS.inc(
+                "reddit_api_requests_total",
+                method=method,
+                endpoint=endpoint_label(url),
+                status="error",
+            )
+            raise
+        METRICS.inc(
+            "reddit_api_requests_total",
+            method=method,
+            endpoint=endpoint_label(url),
+            status=response.status_code,
+        )
+        self.scheduler.update(response.headers)
+        return response
+
+
+class DeferredBatch:
+    """Collects housekeeping work and runs it in batches at housekeeping priority.
+
+    flush(items) is called once batch_size items are queued, or max_delay
+    seconds after the first item was queued, whichever comes first. Batches
+    are always sent from the timer thread, never from the thread adding
+    items, so a batch waiting on the rate limit doesn't hold up the caller.
+    """
+
+    def __init__(self, flush, batch_size: int, max_delay: float):
+        self.FLUSH = flush
+        self.BATCH_SIZE = batch_size
+        self.MAX_DELAY = max_delay
+        self._lock = threading.Lock()
+        # one batch is sent at a time, and a flush at exit waits for the one being sent
+        self._flush_lock = threading.Lock()
+        self._items = []
+        self._timer = None
+
+    def add(self, item) -> None:
+        with self._lock:
+            self._items.append(item)
+            full = len(self._items) >= self.BATCH_SIZE
+            if full or self._timer is None:
+                if self._timer:
+                    self._timer.cancel()
+                self._timer = threading.Timer(0 if full else self.MAX_DELAY, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                if self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+                items, self._items = self._items, []
+            if not items:
+                return
+            try:
+                with priority(HOUSEKEEPING):
+                    self.FLUSH(items)
+            except Exception as ex:
+                LOGGER.exception(ex)
@@ -0,0 +1,79 @@
+import asyncio
+from datetime import datetime, timezone
+from logger import LOGGER
+
+
+class KeyedTasks:
+    """Runs coroutines concurrently on the event loop, keeping per-key order.
+
+    A submitted coroutine waits for every earlier coroutine that shares one of
+    its keys, e.g. comments mentioning the same user, so those run one after
+    another in submission order while unrelated ones overlap. submit() waits
+    while max_pending coroutines are unfinished.
+    """
+
+    def __init__(self, max_pending: int):
+        self._slots = asyncio.Semaphore(max_pending)
+        self._tails = {}
+        self._tasks = set()
+        self.FAILED = 0
+
+    async def submit(self, keys, coroutine_function, *args) -> None:
+        await self._slots.acquire()
+        keys = frozenset(keys)
+        previous = {self._tails[key] for key in keys if key in self._tails}
+        task = asyncio.create_task(self._run(previous, coroutine_function, args))
+        self._tasks.add(task)
+        for key in keys:
+            self._tails[key] = task
+        task.add_done_callback(lambda task: self._done(task, keys))
+
+    async def join(self) -> None:
+        """Waits until every submitted coroutine has finished."""
+        while self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+    async def _run(self, previous, coroutine_function, args) -> None:
+        if previous:
+            await asyncio.wait(previous)
+        try:
+            await coroutine_function(*args)
+        except Exception as ex:
+            self.FAILED += 1
+            LOGGER.exception(ex)
+
+    def _done(self, task, keys) -> None:
+        self._tasks.discard(task)
+        for key in keys:
+            if self._tails.get(key) is task:
+                del self._tails[key]
+        self._slots.release()
+
+
+async def stream_items(stream_factory, on_recovered=None, outage_threshold=10):
+    """Yields the items of a blocking praw stream without blocking the event loop.
+
+    Each item is waited for in a worker thread. When the stream raises, it
+    is recreated after an exponential backoff; once outage_threshold errors
+    in a row have passed, on_recovered(started_at) is awaited after the
+    stream comes back, like the outage recovery handler of the blocking loop.
+    """
+    failures = 0
+    started_at = None
+    while True:
+        try:
+            stream = await asyncio.to_thread(stream_factory)
+            while True:
+                item = await asyncio.to_thread(next, stream, None)
+                if failures:
+                    if failures >= outage_threshold and on_recovered:
+                        await on_recovered(started_at)
+                    failures, started_at = 0, None
+                if item is None:
+                    break
+                yield item
+        except Exception as ex:
+            LOGGER.exception(ex)
+            failures += 1
+            started_at = started_at or datetime.now(timezone.utc)
+            await asyncio.sleep(min(2**failures, 60))
@@ -0,0 +1,159 @@
+import math
+import os
+import sqlite3
+import threading
+
+
+class CatchupCheckpoint:
+    """Tracks which confirmation thread comments have been processed.
+
+    Keeps a low-water mark per submission, so catchup only has to look at
+    comments posted after it, plus the ids of every processed comment so a
+    comment is never counted twice. Workers finish comments out of order, so
+    the mark only moves up to the oldest comment still in flight: a processed
+    comment newer than that is held back until everything older is done.
+    Replaces saving comments on Reddit.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS catchup_checkpoint (
+                submission TEXT PRIMARY KEY,
+                subreddit TEXT NOT NULL,
+                created_utc REAL NOT NULL,
+                comment TEXT NOT NULL
+            )""")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS processed_comments (
+                submission TEXT NOT NULL,
+                comment TEXT NOT NULL,
+                PRIMARY KEY (submission, comment)
+            ) WITHOUT ROWID""")
+        self._db.commit()
+        # per submission: {comment id: created_utc} of comments handed out but not processed yet,
+        # and [(created_utc, comment id, subreddit)] of processed comments the mark can't pass yet
+        self._in_flight = {}
+        self._held_back = {}
+        # (submission, comment id) of in flight comments a worker is handling right now
+        self._claimed = set()
+
+    def get(self, submission_fullname: str) -> tuple[float, str] | None:
+        """Returns (created_utc, comment fullname) of the newest comment with nothing older in flight."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT created_utc, comment FROM catchup_checkpoint WHERE submission = ?",
+                (submission_fullname,),
+            ).fetchone()
+
+    def is_processed(self, submission_fullname: str, comment_id: str) -> bool:
+        with self._lock:
+            return (
+                self._db.execute(
+                    "SELECT 1 FROM processed_comments WHERE submission = ? AND comment = ?",
+                    (submission_fullname, comment_id),
+                ).fetchone()
+                is not None
+            )
+
+    def start(
+        self, submission_fullname: str, comment_id: str, created_utc: float
+    ) -> bool:
+        """Claims a comment for processing and keeps the checkpoint behind it until it's processed.
+
+        Returns False when the comment is already claimed, e.g. queued by
+        catchup while the stream comes across it again.
+        """
+        with self._lock:
+            if (submission_fullname, comment_id) in self._claimed:
+                return False
+            self._claimed.add((submission_fullname, comment_id))
+            self._in_flight.setdefault(submission_fullname, {})[
+                comment_id
+            ] = created_utc
+            return True
+
+    def abandon(self, submission_fullname: str, comment_id: str) -> None:
+        """Gives up the claim on a comment that failed, still keeping the checkpoint behind it.
+
+        Catchup finds the comment again and can claim it for another try.
+        """
+        with self._lock:
+            self._claimed.discard((submission_fullname, comment_id))
+
+    def release(self, submission_fullname: str, comment_id: str) -> None:
+        """Stops holding the checkpoint back for a comment that turned out not to need processing."""
+        with self._lock:
+            self._claimed.discard((submission_fullname, comment_id))
+            self._in_flight.get(submission_fullname, {}).pop(comment_id, None)
+            self._advance(submission_fullname)
+            self._db.commit()
+
+    def mark_processed(
+        self,
+        subreddit_name: str,
+        submission_fullname: str,
+        comment_id: str,
+        created_utc: float,
+    ) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO processed_comments VALUES (?, ?)",
+                (submission_fullname, comment_id),
+            )
+            self._claimed.discard((submission_fullname, comment_id))
+            self._in_flight.get(submission_fullname, {}).pop(comment_id, None)
+            self._held_back.setdefault(submission_fullname, []).append(
+                (created_utc, comment_id, subreddit_name.lower())
+            )
+            self._advance(submission_fullname)
+            self._db.commit()
+
+    def _advance(self, submission_fullname: str) -> None:
+        """Moves the checkpoint to the newest processed comment older than everything in flight."""
+        in_flight = self._in_flight.get(submission_fullname)
+        low_water = min(in_flight.values()) if in_flight else math.inf
+        if not in_flight:
+            self._in_flight.pop(submission_fullname, None)
+        held_back = self._held_back.get(submission_fullname, [])
+        passed = [entry for entry in held_back if entry[0] < low_water]
+        if not passed:
+            return
+        still_held = [entry for entry in held_back if entry[0] >= low_water]
+        if still_held:
+            self._held_back[submission_fullname] = still_held
+        else:
+            del self._held_back[submission_fullname]
+        created_utc, comment_id, subreddit_name = max(passed)
+        self._db.execute(
+            """INSERT INTO catchup_checkpoint VALUES (?, ?, ?, ?)
+            ON CONFLICT (submission) DO UPDATE SET
+                created_utc = excluded.created_utc, comment = excluded.comment
+            WHERE excluded.created_utc > catchup_checkpoint.created_utc""",
+            (submission_fullname, subreddit_name, created_utc, f"t1_{comment_id}"),
+        )
+
+    def prune(self, subreddit_name: str, current_submission_fullname: str) -> None:
+        """Forgets processed comments of older confirmation threads."""
+        with self._lock:
+            self._db.execute(
+                """DELETE FROM processed_comments WHERE submission IN (
+                    SELECT submission FROM catchup_checkpoint
+                    WHERE subreddit = ? AND submission != ?
+                )""",
+                (subreddit_name.lower(), current_submission_fullname),
+            )
+            self._db.execute(
+                "DELETE FROM catchup_checkpoint WHERE subreddit = ? AND submission != ?",
+                (subreddit_name.lower(), current_submission_fullname),
+            )
+            for submission_fullname, held_back in list(self._held_back.items()):
+                if (
+                    submission_fullname != current_submission_fullname
+                    and held_back[0][2] == subreddit_name.lower()
+                ):
+                    del self._held_back[submission_fullname]
+            self._db.commit()
+
+
+def open_catchup_checkpoint() -> CatchupCheckpoint:
+    return CatchupCheckpoint(os.getenv("BOT_STATE_DB", "bot_state.db"))
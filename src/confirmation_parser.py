@@ -0,0 +1,333 @@
+import re
+import string
+from re import _constants as sre_constants, _parser as sre_parse
+from logger import LOGGER
+
+DEFAULT_CONFIRMATION_PATTERN = (
+    r"u/([a-zA-Z0-9_-]{3,})\s+\\?-?\s*(\d+)(?:\s+|\s*-\s*)(\d+)"
+)
+# Reddit's own comment length limit, so this only bites on unexpected input
+MAX_BODY_LENGTH = 10000
+# more confirmations than this in one comment is a mistake or abuse
+MAX_MATCHES = 50
+
+# the default pattern with every repeat made possessive, see scan_confirmations
+_LINEAR_DEFAULT_PATTERN = re.compile(
+    r"u/([a-zA-Z0-9_-]{3,}+)\s++\\?+-?+\s*+(\d++)(?:\s++|\s*+-\s*+)(\d++)"
+)
+_REPEATS = (
+    sre_constants.MAX_REPEAT,
+    sre_constants.MIN_REPEAT,
+    sre_constants.POSSESSIVE_REPEAT,
+)
+_ZERO_WIDTH = (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT)
+_SINGLE_CHARACTERS = (
+    sre_constants.LITERAL,
+    sre_constants.NOT_LITERAL,
+    sre_constants.ANY,
+    sre_constants.IN,
+)
+# characters standing in for "any input" when checking whether two alternatives can start alike
+_PROBE_CHARACTERS = (
+    string.ascii_letters + string.digits + string.punctuation + " \t\n é١"
+)
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: r"\d",
+    sre_constants.CATEGORY_NOT_DIGIT: r"\D",
+    sre_constants.CATEGORY_SPACE: r"\s",
+    sre_constants.CATEGORY_NOT_SPACE: r"\S",
+    sre_constants.CATEGORY_WORD: r"\w",
+    sre_constants.CATEGORY_NOT_WORD: r"\W",
+}
+
+
+class UnsafePatternError(ValueError):
+    """Raised for a regex that can backtrack exponentially on crafted input."""
+
+
+def check_pattern(pattern: str) -> None:
+    """Rejects patterns whose matching time can grow much faster than the input.
+
+    Three shapes cause that in a backtracking engine: an unbounded repeat
+    inside another unbounded repeat, like (a+)+, alternatives that can start
+    with the same character inside an unbounded repeat, like (\\w|\\d)+, and
+    unbounded repeats in a row that can match the same characters, like
+    \\s+-?\\s*, which try every way of splitting a run between them.
+    Possessive repeats and atomic groups never give characters back, so they
+    are fine.
+    """
+    _check_items(sre_parse.parse(pattern), inside_repeat=False)
+
+
+def _check_items(items, inside_repeat: bool) -> None:
+    _check_adjacent_repeats(items)
+    for op, av in items:
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            unbounded = av[1] == sre_constants.MAXREPEAT
+            if unbounded and inside_repeat:
+                raise UnsafePatternError("an unbounded repeat is nested in another")
+            _check_items(av[2], inside_repeat or unbounded)
+        elif op in (sre_constants.POSSESSIVE_REPEAT, sre_constants.ATOMIC_GROUP):
+            _check_items(av[2] if op == sre_constants.POSSESSIVE_REPEAT else av, False)
+        elif op == sre_constants.SUBPATTERN:
+            _check_items(av[-1], inside_repeat)
+        elif op == sre_constants.BRANCH:
+            if inside_repeat:
+                starts = [_first_characters(branch) for branch in av[1]]
+                for index, first in enumerate(starts):
+                    if any(first & other for other in starts[index + 1 :]):
+                        raise UnsafePatternError(
+                            "a repeated alternation has branches that start alike"
+                        )
+            for branch in av[1]:
+                _check_items(branch, inside_repeat)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _check_items(av[1], inside_repeat)
+
+
+def _check_adjacent_repeats(items) -> None:
+    for index, (op, av) in enumerate(items):
+        run = _trailing_repeat_characters([(op, av)])
+        if not run:
+            continue
+        for next_op, next_av in items[index + 1 :]:
+            if _leading_repeat_characters([(next_op, next_av)]) & run:
+                raise UnsafePatternError(
+                    "unbounded repeats in a row can match the same characters"
+                )
+            if _can_be_empty([(next_op, next_av)]):
+                continue
+            # a character the first repeat could have matched, like the space in \s+ \s+
+            if (
+                next_op in _SINGLE_CHARACTERS
+                and _item_first_characters(next_op, next_av) <= run
+            ):
+                continue
+            break
+
+
+def _trailing_repeat_characters(items) -> set[str]:
+    """Probe characters of a backtracking unbounded repeat that items can end with."""
+    characters = set()
+    for op, av in reversed(items):
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            if av[1] == sre_constants.MAXREPEAT:
+                characters |= _characters(av[2])
+        elif op == sre_constants.SUBPATTERN:
+            characters |= _trailing_repeat_characters(av[-1])
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                characters |= _trailing_repeat_characters(branch)
+        if not _can_be_empty([(op, av)]):
+            break
+    return characters
+
+
+def _leading_repeat_characters(items) -> set[str]:
+    """Probe characters an unbounded repeat that items can start with can start with."""
+    characters = set()
+    for op, av in items:
+        if op in _REPEATS:
+            if av[1] == sre_constants.MAXREPEAT:
+                characters |= _first_characters(av[2])
+        elif op == sre_constants.SUBPATTERN:
+            characters |= _leading_repeat_characters(av[-1])
+        elif op == sre_constants.ATOMIC_GROUP:
+            characters |= _leading_repeat_characters(av)
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                characters |= _leading_repeat_characters(branch)
+        if not _can_be_empty([(op, av)]):
+            break
+    return characters
+
+
+def _characters(items) -> set[str]:
+    """Probe characters that any part of a match of items can contain."""
+    characters = set()
+    for op, av in items:
+        if op in _REPEATS:
+            characters |= _characters(av[2])
+        elif op == sre_constants.SUBPATTERN:
+            characters |= _characters(av[-1])
+        elif op == sre_constants.ATOMIC_GROUP:
+            characters |= _characters(av)
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                characters |= _characters(branch)
+        else:
+            characters |= _item_first_characters(op, av)
+    return characters
+
+
+def _first_characters(items) -> set[str]:
+    """Probe characters that a match of items can start with."""
+    first = set()
+    for op, av in items:
+        first |= _item_first_characters(op, av)
+        if not _can_be_empty([(op, av)]):
+            break
+    return first
+
+
+def _item_first_characters(op, av) -> set[str]:
+    if op == sre_constants.LITERAL:
+        return {chr(av)}
+    if op in (sre_constants.NOT_LITERAL, sre_constants.ANY, sre_constants.IN):
+        matcher = re.compile(_character_class(op, av), re.DOTALL)
+        return {char for char in _PROBE_CHARACTERS if matcher.fullmatch(char)}
+    if op in _REPEATS:
+        return _first_characters(av[2])
+    if op == sre_constants.SUBPATTERN:
+        return _first_characters(av[-1])
+    if op == sre_constants.ATOMIC_GROUP:
+        return _first_characters(av)
+    if op == sre_constants.BRANCH:
+        return set().union(*(_first_characters(branch) for branch in av[1]))
+    if op in _ZERO_WIDTH:
+        return set()
+    # back references and the like could start with anything
+    return set(_PROBE_CHARACTERS)
+
+
+def _character_class(op, av) -> str:
+    """Rebuilds a single character matcher as regex source, to test probe characters against it."""
+    if op == sre_constants.ANY:
+        return "."
+    if op == sre_constants.NOT_LITERAL:
+        return f"[^{re.escape(chr(av))}]"
+    negate = ""
+    parts = []
+    for set_op, set_av in av:
+        if set_op == sre_constants.NEGATE:
+            negate = "^"
+        elif set_op == sre_constants.LITERAL:
+            parts.append(re.escape(chr(set_av)))
+        elif set_op == sre_constants.RANGE:
+            parts.append(f"{re.escape(chr(set_av[0]))}-{re.escape(chr(set_av[1]))}")
+        else:
+            parts.append(_CATEGORIES.get(set_av, r"\s\S"))
+    return f"[{negate}{''.join(parts)}]"
+
+
+def _can_be_empty(items) -> bool:
+    for op, av in items:
+        if op in _REPEATS:
+            if av[0] > 0 and not _can_be_empty(av[2]):
+                return False
+        elif op == sre_constants.SUBPATTERN:
+            if not _can_be_empty(av[-1]):
+                return False
+        elif op == sre_constants.ATOMIC_GROUP:
+            if not _can_be_empty(av):
+                return False
+        elif op == sre_constants.BRANCH:
+            if not any(_can_be_empty(branch) for branch in av[1]):
+                return False
+        elif op not in _ZERO_WIDTH:
+            return False
+    return True
+
+
+class ConfirmationParser:
+    """Finds confirmations in a comment, with a drop-in findall() for the old compiled regex.
+
+    The default pattern is matched by an equivalent pattern that can't
+    backtrack, so its running time is linear in the comment length whatever
+    the comment contains. A custom pattern
+    from the wiki is checked with check_pattern() first and falls back to the
+    default when it is unsafe, with the reason kept in REJECTED. Bodies
+    without the longest literal text every match contains, "u/" for the
+    default, are skipped outright, only the first MAX_BODY_LENGTH characters
+    are searched and at most MAX_MATCHES confirmations are returned.
+    """
+
+    def __init__(self, pattern: str):
+        self.REJECTED = None
+        if pattern != DEFAULT_CONFIRMATION_PATTERN:
+            try:
+                check_pattern(pattern)
+            except UnsafePatternError as ex:
+                self.REJECTED = str(ex)
+                LOGGER.warning(
+                    "Rejected confirmation pattern %r, using the default: %s",
+                    pattern,
+                    ex,
+                )
+                pattern = DEFAULT_CONFIRMATION_PATTERN
+        self.pattern = pattern
+        self._regex = (
+            None if pattern == DEFAULT_CONFIRMATION_PATTERN else re.compile(pattern)
+        )
+        self._ignore_case = bool(
+            self._regex is not None and self._regex.flags & re.IGNORECASE
+        )
+        self._prefilter = max(_literal_runs(sre_parse.parse(pattern)), key=len)
+        if self._ignore_case:
+            self._prefilter = self._prefilter.lower()
+
+    def findall(self, body: str) -> list:
+        if self._prefilter not in (body.lower() if self._ignore_case else body):
+            return []
+        if len(body) > MAX_BODY_LENGTH:
+            LOGGER.warning(
+                "Only searching the first %s of %s characters for confirmations",
+                MAX_BODY_LENGTH,
+                len(body),
+            )
+            body = body[:MAX_BODY_LENGTH]
+        if self._regex is None:
+            return scan_confirmations(body, MAX_MATCHES)
+        return _first_matches(self._regex.finditer(body), MAX_MATCHES, _findall_value)
+
+
+def _literal_runs(items) -> list[str]:
+    """Runs of literal text a match of items always contains, in order."""
+    runs = [""]
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            runs[-1] += chr(av)
+        elif op == sre_constants.SUBPATTERN:
+            inner = _literal_runs(av[-1])
+            runs[-1] += inner[0]
+            runs.extend(inner[1:])
+        else:
+            runs.append("")
+    return runs
+
+
+def _first_matches(matches, max_matches: int, value) -> list:
+    found = []
+    for match in matches:
+        if len(found) >= max_matches:
+            LOGGER.warning(
+                "Only counting the first %s confirmations in a comment, dropping the rest",
+                max_matches,
+            )
+            break
+        found.append(value(match))
+    return found
+
+
+def _findall_value(match: re.Match):
+    """What re.findall would have returned for this match."""
+    groups = match.groups()
+    if not groups:
+        return match.group(0)
+    if len(groups) == 1:
+        return groups[0] or ""
+    return tuple(group or "" for group in groups)
+
+
+def scan_confirmations(body: str, max_matches: int) -> list[tuple[str, str, str]]:
+    """Finds what DEFAULT_CONFIRMATION_PATTERN's findall would, in linear time.
+
+    Each part of the pattern uses a character class the parts next to it
+    don't share (name characters, whitespace, "\\", "-", digits), so only the
+    greedy runs can ever match and the possessive version, which never gives
+    characters back, finds the same matches. Attempts start at "u/", which
+    none of those classes contain, so they never rescan each other's text.
+    """
+    return _first_matches(
+        _LINEAR_DEFAULT_PATTERN.finditer(body), max_matches, re.Match.groups
+    )
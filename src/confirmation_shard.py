@@ -0,0 +1,85 @@
+import os
+from praw import Reddit
+from api_scheduler import ApiScheduler, ScheduledRequestor
+from helpers import load_secrets, sint
+from helpers_confirmation import handle_confirmations
+from settings import Settings
+
+
+def shard_app(secrets: dict, index: int) -> dict:
+    """Returns the OAuth app a shard logs in with.
+
+    Reddit's rate limit is counted per OAuth app, so listing extra apps under
+    SHARD_APPS (each with REDDIT_CLIENT_ID and REDDIT_CLIENT_SECRET) gives
+    every shard its own budget. Without them all shards share the bot's app.
+    """
+    apps = secrets.get("SHARD_APPS") or [secrets]
+    return apps[index % len(apps)]
+
+
+class ConfirmationShard:
+    """Updates flair for the users of one shard, inside that shard's worker process."""
+
+    def __init__(self, subreddit_names: list[str], index: int):
+        self.INDEX = index
+        secrets = load_secrets(subreddit_names[0])
+        app = shard_app(secrets, index)
+        self.BOT = Reddit(
+            requestor_class=ScheduledRequestor,
+            requestor_kwargs={"scheduler": ApiScheduler()},
+            client_id=app["REDDIT_CLIENT_ID"],
+            client_secret=app["REDDIT_CLIENT_SECRET"],
+            user_agent=f"{secrets['REDDIT_USER_AGENT']} (shard {index})",
+            username=secrets["REDDIT_USERNAME"],
+            password=secrets["REDDIT_PASSWORD"],
+        )
+        # the dispatcher's settings came along with the fork but belong to its Reddit session
+        Settings._instances.clear()
+        journal_path = os.getenv("JOURNAL_PATH", "bot_journal.jsonl")
+        if journal_path:
+            # each shard journals the users it owns in its own file
+            os.environ["JOURNAL_PATH"] = f"{journal_path}.shard{index}"
+        self.ALL_SETTINGS = {}
+        for name in subreddit_names:
+            settings = Settings(self.BOT, name)
+            # replies are put together by the dispatcher, which can't wait on a shard's flair batch
+            settings.FLAIR_WRITE_QUEUE = None
+            self.ALL_SETTINGS[name.lower()] = settings
+        settings_poll_interval = sint(os.getenv("SETTINGS_POLL_INTERVAL", ""), 0)
+        if settings_poll_interval > 0:
+            for settings in self.ALL_SETTINGS.values():
+                settings.start_polling(self.BOT, settings_poll_interval)
+        # the dispatcher forwards mod log changes, this catches any it missed
+        moderator_resync_interval = sint(
+            os.getenv("MODERATOR_RESYNC_INTERVAL", ""), 3600
+        )
+        if moderator_resync_interval > 0:
+            for settings in self.ALL_SETTINGS.values():
+                settings.start_moderator_resync(moderator_resync_interval)
+
+    def confirm(
+        self,
+        subreddit_name: str,
+        comment_id: str,
+        author_fullname: str,
+        planned: list[tuple[str, int, int]],
+    ) -> list[tuple[str, str | None]]:
+        settings = self.ALL_SETTINGS[subreddit_name.lower()]
+        comment = self.BOT.comment(comment_id)
+        # set up front so comparing against the author doesn't fetch the comment
+        comment.author_fullname = author_fullname
+        reply_parts = handle_confirmations(self.BOT, settings, comment, planned)
+        if settings.JOURNAL:
+            # kept until compaction, so a comment sent again after a dispatcher crash gets the same replies
+            settings.JOURNAL.finish(subreddit_name, comment_id)
+        return reply_parts
+
+    def update_moderator(
+        self, subreddit_name: str, name: str, is_moderator: bool
+    ) -> None:
+        self.ALL_SETTINGS[subreddit_name.lower()].CURRENT_MODS.update(
+            name, is_moderator
+        )
+
+    def reload(self, subreddit_name: str) -> None:
+        self.ALL_SETTINGS[subreddit_name.lower()].reload(self.BOT, subreddit_name)
@@ -0,0 +1,65 @@
+import bisect
+from logger import LOGGER
+
+
+class FlairLadder:
+    """Ranged flair templates compiled into sorted, non-overlapping ranges.
+
+    Mod only and regular templates are kept on separate ladders and looked up
+    with bisect. Overlapping ranges and gaps are reported when the ladder is
+    built; an overlapping range is dropped in favour of the one starting first.
+    """
+
+    def __init__(self, ranged_templates: list[tuple[int, int, dict]]):
+        self.PROBLEMS = []
+        self._starts = {}
+        self._rungs = {}
+        for mod_only in (False, True):
+            rungs = sorted(
+                (
+                    rung
+                    for rung in ranged_templates
+                    if bool(rung[2]["mod_only"]) == mod_only
+                ),
+                key=lambda rung: (rung[0], rung[1]),
+            )
+            self._rungs[mod_only] = self._check_rungs(rungs, mod_only)
+            self._starts[mod_only] = [rung[0] for rung in self._rungs[mod_only]]
+        for problem in self.PROBLEMS:
+            LOGGER.warning(problem)
+
+    def _check_rungs(self, rungs: list, mod_only: bool) -> list:
+        ladder_name = "mod only" if mod_only else "regular"
+        checked = []
+        for min_count, max_count, template in rungs:
+            if min_count > max_count:
+                self.PROBLEMS.append(
+                    f"Ignoring {ladder_name} flair range {min_count}-{max_count}: minimum is above maximum"
+                )
+                continue
+            if not checked:
+                if min_count > 0:
+                    self.PROBLEMS.append(
+                        f"No {ladder_name} flair range covers totals below {min_count}"
+                    )
+            else:
+                previous_min, previous_max, _ = checked[-1]
+                if min_count <= previous_max:
+                    self.PROBLEMS.append(
+                        f"Ignoring {ladder_name} flair range {min_count}-{max_count}: overlaps {previous_min}-{previous_max}"
+                    )
+                    continue
+                if min_count > previous_max + 1:
+                    self.PROBLEMS.append(
+                        f"No {ladder_name} flair range covers totals {previous_max + 1}-{min_count - 1}"
+                    )
+            checked.append((min_count, max_count, template))
+        return checked
+
+    def find(self, total_count: int, is_mod: bool) -> dict | None:
+        """Returns the template whose range holds total_count, or None."""
+        index = bisect.bisect_right(self._starts[is_mod], total_count) - 1
+        if index < 0:
+            return None
+        _, max_count, template = self._rungs[is_mod][index]
+        return template if total_count <= max_count else None
@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import threading
+import time
+from helpers import sint
+
+
+class FlairLedger:
+    """Local record of the flair the bot last wrote (or read) for each user.
+
+    Lets increment_flair skip the flair read on Reddit for users the bot has
+    already seen. Entries older than max_age are treated as misses so that
+    anything changed outside the bot is eventually picked up again.
+    """
+
+    def __init__(self, path: str, max_age: int):
+        self.MAX_AGE = max_age
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS flair_ledger (
+                subreddit TEXT NOT NULL,
+                user_name TEXT NOT NULL,
+                flair_text TEXT,
+                flair_css_class TEXT,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (subreddit, user_name)
+            )""")
+        self._db.commit()
+
+    def get(self, subreddit_name: str, user_name: str) -> dict | None:
+        """Returns the cached flair in the same shape as SUBREDDIT.flair(), or None when missing or stale."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT flair_text, flair_css_class, checked_at FROM flair_ledger WHERE subreddit = ? AND user_name = ?",
+                (subreddit_name.lower(), str(user_name).lower()),
+            ).fetchone()
+        if not row:
+            return None
+        flair_text, flair_css_class, checked_at = row
+        if time.time() - checked_at > self.MAX_AGE:
+            return None
+        return {
+            "user": str(user_name),
+            "flair_text": flair_text,
+            "flair_css_class": flair_css_class,
+        }
+
+    def record(
+        self,
+        subreddit_name: str,
+        user_name: str,
+        flair_text: str | None,
+        flair_css_class: str | None,
+    ) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO flair_ledger VALUES (?, ?, ?, ?, ?)",
+                (
+                    subreddit_name.lower(),
+                    str(user_name).lower(),
+                    flair_text,
+                    flair_css_class,
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+
+    def forget(self, subreddit_name: str, user_name: str) -> None:
+        """Drops a user's entry, forcing the next increment to read from Reddit."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM flair_ledger WHERE subreddit = ? AND user_name = ?",
+                (subreddit_name.lower(), str(user_name).lower()),
+            )
+            self._db.commit()
+
+
+def open_flair_ledger() -> FlairLedger:
+    return FlairLedger(
+        os.getenv("BOT_STATE_DB", "bot_state.db"),
+        sint(os.getenv("FLAIR_LEDGER_MAX_AGE", ""), 86400),
+    )
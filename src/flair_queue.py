@@ -0,0 +1,104 @@
+import atexit
+import threading
+from logger import LOGGER
+
+
+class FlairWriteQueue:
+    """Collects flair writes for a short window and sends them through the flair CSV endpoint.
+
+    Several increments for the same user within the window collapse into the
+    last value, and each batch of up to 100 users costs a single API call.
+    Callbacks registered with after_flush run once the batch holding every
+    write queued so far has been confirmed by Reddit.
+    """
+
+    def __init__(self, settings, window: float):
+        self.SETTINGS = settings
+        self.WINDOW = window
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._in_flight = {}
+        self._callbacks = []
+        self._last_failed = set()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def submit(self, redditor, flair_text: str, flair_template: dict) -> None:
+        with self._lock:
+            self._pending[str(redditor).lower()] = {
+                "user": str(redditor),
+                "flair_text": flair_text,
+                "flair_css_class": flair_template["css_class"],
+            }
+            self._schedule()
+
+    def pending(self, redditor) -> dict | None:
+        """Returns a queued or in-flight flair that hasn't been confirmed yet, in the same shape as SUBREDDIT.flair()."""
+        name = str(redditor).lower()
+        with self._lock:
+            return self._pending.get(name) or self._in_flight.get(name)
+
+    def after_flush(self, callback) -> None:
+        """Runs callback(failed_names) once every write queued so far has been sent."""
+        with self._lock:
+            run_now = not self._pending and not self._in_flight
+            if not run_now:
+                # writes already in flight are reported by the flush that follows them
+                self._callbacks.append((callback, not self._pending))
+                self._schedule()
+        if run_now:
+            callback(set())
+
+    def _schedule(self) -> None:
+        if self._timer is None:
+            self._timer = threading.Timer(self.WINDOW, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                self._timer = None
+                batch, self._pending = self._pending, {}
+                callbacks, self._callbacks = self._callbacks, []
+                self._in_flight.update(batch)
+            if not batch and not callbacks:
+                return
+
+            prior_failed, failed = self._last_failed, set()
+            results = []
+            try:
+                if batch:
+                    results = self.SETTINGS.SUBREDDIT.flair.update(list(batch.values()))
+            except Exception as ex:
+                LOGGER.exception(ex)
+            for index, (name, flair) in enumerate(batch.items()):
+                if index < len(results) and results[index].get("ok"):
+                    self.SETTINGS.FLAIR_LEDGER.record(
+                        self.SETTINGS.SUBREDDIT_NAME,
+                        name,
+                        flair["flair_text"],
+                        flair["flair_css_class"],
+                    )
+                else:
+                    failed.add(name)
+                    self.SETTINGS.FLAIR_LEDGER.forget(
+                        self.SETTINGS.SUBREDDIT_NAME, name
+                    )
+            if batch:
+                LOGGER.info(
+                    "Flushed %s flair updates, %s failed", len(batch), len(failed)
+                )
+
+            with self._lock:
+                for name in batch:
+                    if self._in_flight.get(name) is batch[name]:
+                        del self._in_flight[name]
+
+            self._last_failed = failed
+            for callback, include_prior in callbacks:
+                try:
+                    callback(failed | prior_failed if include_prior else failed)
+                except Exception as ex:
+                    LOGGER.exception(ex)
@@ -1,21 +1,71 @@
 import re
 import os
 import json
-import boto3
+import time
+
+_SECRETS = {}
 
 
 def load_secrets(subreddit_name: str) -> dict:
+    """Loads the bot's secrets, from Secrets Manager unless DEV is set.
+
+    Secrets are kept in memory for SECRETS_CACHE_TTL seconds (default 3600).
+    When SECRETS_CACHE_PATH is set they are also kept in that file, readable
+    only by the bot's user, so a restart within the TTL neither imports
+    boto3 nor waits on Secrets Manager.
+    """
     if os.getenv("DEV"):
-        secrets = os.getenv("SECRETS")
-    else:
-        secrets_manager = boto3.client("secretsmanager")
-        secrets_response = secrets_manager.get_secret_value(
-            SecretId=f"penpal-confirmation-bot/{subreddit_name}"
-        )
-        secrets = secrets_response["SecretString"]
+        return json.loads(os.getenv("SECRETS"))
+    ttl = sint(os.getenv("SECRETS_CACHE_TTL", ""), 3600)
+    cached = _SECRETS.get(subreddit_name) or _read_secrets_cache(subreddit_name)
+    if cached and cached[0] > time.time():
+        _SECRETS[subreddit_name] = cached
+        return json.loads(cached[1])
+
+    # boto3 takes a while to import and is only needed when the cache is cold
+    import boto3
+
+    secrets_manager = boto3.client("secretsmanager")
+    secrets_response = secrets_manager.get_secret_value(
+        SecretId=f"penpal-confirmation-bot/{subreddit_name}"
+    )
+    secrets = secrets_response["SecretString"]
+    _SECRETS[subreddit_name] = (time.time() + ttl, secrets)
+    _write_secrets_cache(subreddit_name, _SECRETS[subreddit_name])
     return json.loads(secrets)
 
 
+def _read_secrets_cache(subreddit_name: str) -> tuple[float, str] | None:
+    path = os.getenv("SECRETS_CACHE_PATH")
+    if not path:
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            expires_at, secrets = json.load(file)[subreddit_name]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return (expires_at, secrets)
+
+
+def _write_secrets_cache(subreddit_name: str, cached: tuple[float, str]) -> None:
+    path = os.getenv("SECRETS_CACHE_PATH")
+    if not path:
+        return
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            entries = json.load(file)
+    except (OSError, ValueError):
+        entries = {}
+    entries[subreddit_name] = list(cached)
+    temporary_path = f"{path}.{os.getpid()}"
+    file_descriptor = os.open(
+        temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+    )
+    with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+        json.dump(entries, file)
+    os.replace(temporary_path, path)
+
+
 def sint(str, default):
     try:
         return int(str)
@@ -0,0 +1,186 @@
+import settings
+from praw import models, Reddit
+from helpers import deEmojify
+from helpers_flair import get_current_flair, increment_flair, set_redditor_flair
+from helpers_redditor import get_redditor
+from logger import LOGGER
+from metrics import METRICS
+
+
+def begin_confirmations(
+    settings: settings.Settings,
+    comment: models.Comment,
+    planned: list[tuple[str, int, int]],
+) -> None:
+    """Journals the intent to apply a comment's confirmations, if the journal is enabled."""
+    if settings.JOURNAL:
+        settings.JOURNAL.begin(settings.SUBREDDIT_NAME, comment.id, planned)
+
+
+def handle_confirmations(
+    bot: Reddit,
+    settings: settings.Settings,
+    comment: models.Comment,
+    planned: list[tuple[str, int, int]],
+) -> list[tuple[str, str | None]]:
+    """Updates flair for each planned confirmation, returning (mentioned_name, reply) pairs."""
+    begin_confirmations(settings, comment, planned)
+    reply_parts = []
+    for match in planned:
+        try:
+            reply_parts.append(
+                (match[0], handle_confirmation(bot, settings, comment, match))
+            )
+        except Exception as ex:
+            METRICS.inc("confirmations_total", result="error")
+            LOGGER.info("Exception occurred while handling confirmation")
+            LOGGER.info(ex)
+    return reply_parts
+
+
+def handle_confirmation(
+    bot: Reddit,
+    settings: settings.Settings,
+    comment: models.Comment,
+    match: tuple[str, int, int],
+) -> str | None:
+    mentioned_name, emails, letters = match
+    journal = settings.JOURNAL
+    progress = None
+    if journal:
+        progress = journal.user_progress(
+            settings.SUBREDDIT_NAME, comment.id, mentioned_name
+        )
+        if progress and progress["op"] == "applied":
+            # already handled before a restart, don't count it twice
+            METRICS.inc("confirmations_total", result="replayed")
+            return progress["reply"]
+    mentioned_user = get_redditor(bot, mentioned_name)
+
+    if not mentioned_user:
+        result = "user_not_found"
+        reply = settings.USER_DOESNT_EXIST.format(
+            comment=comment, mentioned_name=mentioned_name
+        )
+    elif mentioned_user.fullname == comment.author_fullname:
+        result = "own_flair"
+        reply = settings.CANT_UPDATE_YOURSELF
+    elif progress:
+        result = "resumed"
+        reply = _finish_interrupted_update(
+            settings, mentioned_name, mentioned_user, progress
+        )
+    else:
+        result = "updated"
+        reply = _update_flair(
+            settings, comment, mentioned_name, mentioned_user, emails, letters
+        )
+    if reply == settings.FLAIR_UPDATE_FAILED.format(mentioned_name=mentioned_name):
+        result = "failed"
+    METRICS.inc("confirmations_total", result=result)
+    if journal and settings.FLAIR_WRITE_QUEUE and result in ("updated", "resumed"):
+        # the write is only queued, so it stays "applying" until its batch reaches Reddit
+        settings.FLAIR_WRITE_QUEUE.after_flush(
+            lambda failed: journal.applied(
+                settings.SUBREDDIT_NAME,
+                comment.id,
+                mentioned_name,
+                (
+                    settings.FLAIR_UPDATE_FAILED.format(mentioned_name=mentioned_name)
+                    if mentioned_name.lower() in failed
+                    else reply
+                ),
+            )
+        )
+    elif journal:
+        journal.applied(settings.SUBREDDIT_NAME, comment.id, mentioned_name, reply)
+    return reply
+
+
+def _update_flair(
+    settings: settings.Settings,
+    comment: models.Comment,
+    mentioned_name: str,
+    mentioned_user: models.Redditor,
+    emails: int,
+    letters: int,
+) -> str:
+    def journal_write(old_text, new_text, flair_template):
+        settings.JOURNAL.applying(
+            settings.SUBREDDIT_NAME,
+            comment.id,
+            mentioned_name,
+            old_text,
+            new_text,
+            flair_template,
+        )
+
+    old_flair, new_flair = increment_flair(
+        settings,
+        mentioned_user,
+        emails,
+        letters,
+        journal_write if settings.JOURNAL else None,
+    )
+    if not old_flair or not new_flair:
+        return settings.FLAIR_UPDATE_FAILED.format(mentioned_name=mentioned_name)
+    LOGGER.info(
+        "Updated %s to %s for %s",
+        old_flair,
+        new_flair,
+        mentioned_name,
+        extra={
+            "comment_id": comment.id,
+            "mentioned_user": mentioned_name,
+            "old_flair": old_flair,
+            "new_flair": new_flair,
+        },
+    )
+    return _confirmation_reply(settings, mentioned_name, old_flair, new_flair)
+
+
+def _finish_interrupted_update(
+    settings: settings.Settings,
+    mentioned_name: str,
+    mentioned_user: models.Redditor,
+    progress: dict,
+) -> str:
+    """Completes a flair update that was journaled but not confirmed before a restart.
+
+    Reddit's current flair tells whether the write went through. Anything
+    other than the old or the new text means someone else changed the flair
+    since, so the update is reported as failed rather than guessed at.
+    """
+    current_flair = get_current_flair(settings, mentioned_user)
+    current_text = (current_flair or {}).get("flair_text") or "No Flair"
+    if current_text == progress["old"]:
+        set_redditor_flair(
+            settings, mentioned_user, progress["new"], progress["template"]
+        )
+    elif current_text != progress["new"]:
+        LOGGER.warning(
+            "Flair for %s changed to %s while its update to %s was interrupted",
+            mentioned_name,
+            current_text,
+            progress["new"],
+        )
+        return settings.FLAIR_UPDATE_FAILED.format(mentioned_name=mentioned_name)
+    LOGGER.info(
+        "Finished interrupted update of %s to %s for %s",
+        progress["old"],
+        progress["new"],
+        mentioned_name,
+    )
+    return _confirmation_reply(
+        settings, mentioned_name, progress["old"], progress["new"]
+    )
+
+
+def _confirmation_reply(
+    settings: settings.Settings, mentioned_name: str, old_flair: str, new_flair: str
+) -> str:
+    return deEmojify(
+        settings.CONFIRMATION_TEMPLATE.format(
+            mentioned_name=mentioned_name, old_flair=old_flair, new_flair=new_flair
+        )
+    )
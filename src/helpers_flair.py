@@ -2,11 +2,33 @@ import settings
 from praw import models
 from helpers import sint
 from logger import LOGGER
+from metrics import METRICS
 
 
+@METRICS.timed("get_current_flair")
 def get_current_flair(settings: settings.Settings, redditor: models.Redditor) -> dict:
     """Uses an API call to ensure we have the latest flair text"""
-    return next(settings.SUBREDDIT.flair(redditor))
+    # by name, since praw deep copies the listing parameters and a Redditor would take the whole Reddit instance along
+    return next(settings.SUBREDDIT.flair(str(redditor)))
+
+
+def get_ledger_flair(settings: settings.Settings, redditor: models.Redditor) -> dict:
+    """Returns the flair from the local ledger, only asking Reddit on a miss or when the entry is stale."""
+    if settings.FLAIR_WRITE_QUEUE:
+        queued_flair = settings.FLAIR_WRITE_QUEUE.pending(redditor)
+        if queued_flair:
+            return queued_flair
+    current_flair = settings.FLAIR_LEDGER.get(settings.SUBREDDIT_NAME, redditor)
+    if current_flair is None:
+        current_flair = get_current_flair(settings, redditor)
+        if current_flair:
+            settings.FLAIR_LEDGER.record(
+                settings.SUBREDDIT_NAME,
+                redditor,
+                current_flair["flair_text"],
+                current_flair["flair_css_class"],
+            )
+    return current_flair
 
 
 def get_flair_template(
@@ -21,13 +43,8 @@ def get_flair_template(
         and current_flair["flair_css_class"] in settings.SPECIAL_FLAIR_TEMPLATES
     ):
         return settings.SPECIAL_FLAIR_TEMPLATES[current_flair["flair_css_class"]]
-    for (min_count, max_count), template in settings.FLAIR_TEMPLATES.items():
-        if min_count <= total_count <= max_count:
-            # if a flair template was marked mod only, enforce that. Allows flairs like "Moderator | Trades min-max"
-            if template["mod_only"] == (user in settings.CURRENT_MODS):
-                return template
-
-    return None
+    # if a flair template was marked mod only, enforce that. Allows flairs like "Moderator | Trades min-max"
+    return settings.FLAIR_LADDER.find(total_count, user in settings.CURRENT_MODS)
 
 
 def increment_flair(
@@ -35,8 +52,14 @@ def increment_flair(
     redditor: models.Redditor,
     new_emails: int,
     new_letters: int,
+    before_write=None,
 ) -> tuple[str | None, str | None]:
-    current_flair = get_current_flair(settings, redditor)
+    """Adds to a user's flair counts, returning the old and new flair text.
+
+    before_write(old_text, new_text, flair_template) is called right before
+    the new flair is written, e.g. to journal it.
+    """
+    current_flair = get_ledger_flair(settings, redditor)
     current_flair_text = current_flair["flair_text"] if current_flair else None
     if current_flair_text is None or current_flair_text == "":
         current_flair_text = "No Flair"
@@ -58,16 +81,28 @@ def increment_flair(
         return (None, None)
 
     new_flair_text = new_flair_template["text"].format(E=new_emails, L=new_letters)
+    if before_write:
+        before_write(current_flair_text, new_flair_text, new_flair_template)
     set_redditor_flair(settings, redditor, new_flair_text, new_flair_template)
     return (current_flair_text, new_flair_text)
 
 
+@METRICS.timed("set_redditor_flair")
 def set_redditor_flair(
     settings: settings.Settings,
     redditor: models.Redditor,
     new_flair_text: str,
     flair_template,
 ) -> None:
+    if settings.FLAIR_WRITE_QUEUE:
+        settings.FLAIR_WRITE_QUEUE.submit(redditor, new_flair_text, flair_template)
+        return
     settings.SUBREDDIT.flair.set(
         redditor, text=new_flair_text, flair_template_id=flair_template["id"]
     )
+    settings.FLAIR_LEDGER.record(
+        settings.SUBREDDIT_NAME,
+        redditor,
+        new_flair_text,
+        flair_template["css_class"],
+    )
@@ -1,11 +1,116 @@
+import atexit
+import json
+import os
 import prawcore
+import threading
+import time
+from collections import OrderedDict
+from helpers import sint
+from logger import LOGGER
+from metrics import METRICS
 from praw import models, Reddit
 
 
+class RedditorCache:
+    """Bounded LRU of redditor lookups keyed by lowercased name.
+
+    Existing users are kept for TTL seconds and names that came back NotFound
+    for NEGATIVE_TTL seconds. When snapshot_path is set the cache is loaded
+    from, and saved back to, that file so it survives restarts.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: int,
+        negative_ttl: int,
+        snapshot_path: str | None = None,
+    ):
+        self.MAX_SIZE = max_size
+        self.TTL = ttl
+        self.NEGATIVE_TTL = negative_ttl
+        self.SNAPSHOT_PATH = snapshot_path
+        self.HITS = 0
+        self.MISSES = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        if snapshot_path:
+            self.load()
+
+    def get(self, name: str) -> tuple[bool, dict | None]:
+        """Returns (found, data) where data is None for a cached NotFound."""
+        key = name.lower()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                self._entries.pop(key, None)
+                self.MISSES += 1
+                return (False, None)
+            self._entries.move_to_end(key)
+            self.HITS += 1
+            return (True, entry[1])
+
+    def put(self, name: str, data: dict | None) -> None:
+        ttl = self.TTL if data else self.NEGATIVE_TTL
+        with self._lock:
+            self._entries[name.lower()] = (time.time() + ttl, data)
+            self._entries.move_to_end(name.lower())
+            while len(self._entries) > self.MAX_SIZE:
+                self._entries.popitem(last=False)
+
+    def load(self) -> None:
+        try:
+            with open(self.SNAPSHOT_PATH, "r", encoding="utf-8") as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        with self._lock:
+            for key, (expires_at, data) in entries.items():
+                if expires_at > now:
+                    self._entries[key] = (expires_at, data)
+        LOGGER.info("Loaded %s cached redditors", len(self._entries))
+
+    def save(self) -> None:
+        if not self.SNAPSHOT_PATH:
+            return
+        with self._lock:
+            entries = dict(self._entries)
+        with open(self.SNAPSHOT_PATH, "w", encoding="utf-8") as file:
+            json.dump(entries, file)
+
+
+REDDITOR_CACHE = RedditorCache(
+    sint(os.getenv("REDDITOR_CACHE_SIZE", ""), 10000),
+    sint(os.getenv("REDDITOR_CACHE_TTL", ""), 604800),
+    sint(os.getenv("REDDITOR_CACHE_NEGATIVE_TTL", ""), 600),
+    os.getenv("REDDITOR_CACHE_PATH"),
+)
+atexit.register(REDDITOR_CACHE.save)
+METRICS.derive(
+    "redditor_cache_requests_total",
+    "counter",
+    lambda: REDDITOR_CACHE.HITS,
+    result="hit",
+)
+METRICS.derive(
+    "redditor_cache_requests_total",
+    "counter",
+    lambda: REDDITOR_CACHE.MISSES,
+    result="miss",
+)
+
+
+@METRICS.timed("get_redditor")
 def get_redditor(bot: Reddit, name: str) -> models.Redditor | None:
+    found, cached = REDDITOR_CACHE.get(name)
+    if found:
+        return models.Redditor(bot, _data=dict(cached)) if cached else None
     try:
         redditor = bot.redditor(name)
         if redditor.id:
+            REDDITOR_CACHE.put(name, {"name": redditor.name, "id": redditor.id})
             return redditor
     except prawcore.exceptions.NotFound:
+        REDDITOR_CACHE.put(name, None)
         return None
@@ -1,9 +1,14 @@
+from collections import deque
 from praw import models
 from datetime import datetime, timezone
+from typing import Iterator
 from logger import LOGGER
+from api_scheduler import priority, HOUSEKEEPING
 from types import SimpleNamespace
 import settings
 
+MORECHILDREN_BATCH_SIZE = 100
+
 
 def get_current_confirmation_post(settings: settings.Settings) -> models.Submission:
     for submission in settings.ME.submissions.new(limit=5):
@@ -63,11 +68,57 @@ def lock_previous_submissions(
 ) -> None:
     """Locks previous month posts."""
     LOGGER.info("Locking previous submissions")
-    for submission in settings.ME.submissions.new(limit=10):
-        if submission.subreddit_id != settings.SUBREDDIT.name:
-            continue
-        if exempt_submission and submission == exempt_submission:
-            continue
-        if not submission.locked:
-            LOGGER.info("Locking https://reddit.com%s", submission.permalink)
-            submission.mod.lock()
+    with priority(HOUSEKEEPING):
+        for submission in settings.ME.submissions.new(limit=10):
+            if submission.subreddit_id != settings.SUBREDDIT.name:
+                continue
+            if exempt_submission and submission == exempt_submission:
+                continue
+            if not submission.locked:
+                LOGGER.info("Locking https://reddit.com%s", submission.permalink)
+                submission.mod.lock()
+
+
+def iter_root_comments(
+    submission: models.Submission, sort: str = "new"
+) -> Iterator[models.Comment]:
+    """Yields a submission's top level comments without building its comment forest.
+
+    Only top level comments are requested, and the ids behind "load more
+    comments" stubs are expanded through /api/morechildren in batches of 100.
+    Nothing but the ids still to be expanded is held between batches.
+    """
+    reddit = submission._reddit
+    pending_ids = deque()
+
+    def root_comments(items):
+        for item in items:
+            if item.parent_id != submission.fullname:
+                continue
+            if isinstance(item, models.MoreComments):
+                pending_ids.extend(item.children)
+            else:
+                yield item
+
+    _, comment_listing = reddit.get(
+        f"comments/{submission.id}/", params={"sort": sort, "depth": 1}
+    )
+    yield from root_comments(comment_listing.children)
+    del comment_listing
+
+    while pending_ids:
+        batch = [
+            pending_ids.popleft()
+            for _ in range(min(MORECHILDREN_BATCH_SIZE, len(pending_ids)))
+        ]
+        yield from root_comments(
+            reddit.post(
+                "api/morechildren/",
+                data={
+                    "children": ",".join(batch),
+                    "link_id": submission.fullname,
+                    "sort": sort,
+                    "depth": 1,
+                },
+            )
+        )
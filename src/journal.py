@@ -0,0 +1,244 @@
+import json
+import os
+import threading
+import time
+from helpers import sint
+from logger import LOGGER
+
+# how many finished comments are appended between compactions
+COMPACT_EVERY = 500
+
+
+class ProcessingJournal:
+    """Append-only write-ahead journal of confirmation processing.
+
+    For each comment it records the intent (the planned per-user counts),
+    then for each user the flair about to be written, the flair written with
+    the reply text, and finally that the reply was posted. Replaying the file
+    on open gives every comment's progress, so a comment seen again after a
+    crash, e.g. by catchup, finishes its half-done work instead of counting a
+    confirmation twice.
+
+    Only the record written before a flair update has to be on disk before
+    going on, since it is what a restart relies on. Threads waiting for that
+    share one fsync, and the other records ride along with the next one.
+    Finished comments are kept for retention seconds and then dropped when
+    the file is compacted.
+    """
+
+    def __init__(self, path: str, retention: int):
+        self.PATH = path
+        self.RETENTION = retention
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._entries = {}
+        self._written = 0
+        self._synced = 0
+        self._finished_since_compaction = 0
+        self._replay()
+        self._file = open(path, "a", encoding="utf-8")
+        self.compact()
+
+    def begin(self, subreddit_name: str, comment_id: str, planned: list) -> None:
+        """Records the intent to apply planned (name, emails, letters) for a comment."""
+        key = _key(subreddit_name, comment_id)
+        with self._lock:
+            if key in self._entries:
+                return
+        self._append(
+            {
+                "op": "begin",
+                "subreddit": subreddit_name.lower(),
+                "comment": comment_id,
+                "planned": [list(match) for match in planned],
+            }
+        )
+
+    def applying(
+        self,
+        subreddit_name: str,
+        comment_id: str,
+        user_name: str,
+        old_text: str | None,
+        new_text: str,
+        flair_template: dict,
+    ) -> None:
+        """Records a flair update about to be sent, and waits until that is on disk."""
+        self._append(
+            {
+                "op": "applying",
+                "subreddit": subreddit_name.lower(),
+                "comment": comment_id,
+                "user": user_name.lower(),
+                "old": old_text,
+                "new": new_text,
+                "template": {
+                    "id": flair_template["id"],
+                    "css_class": flair_template["css_class"],
+                },
+            },
+            durable=True,
+        )
+
+    def applied(
+        self, subreddit_name: str, comment_id: str, user_name: str, reply: str | None
+    ) -> None:
+        self._append(
+            {
+                "op": "applied",
+                "subreddit": subreddit_name.lower(),
+                "comment": comment_id,
+                "user": user_name.lower(),
+                "reply": reply,
+            }
+        )
+
+    def finish(self, subreddit_name: str, comment_id: str) -> None:
+        """Records that a comment was replied to, which completes it."""
+        if not self.get(subreddit_name, comment_id):
+            return
+        self._append(
+            {
+                "op": "finish",
+                "subreddit": subreddit_name.lower(),
+                "comment": comment_id,
+                "at": time.time(),
+            }
+        )
+        with self._lock:
+            self._finished_since_compaction += 1
+            compact = self._finished_since_compaction >= COMPACT_EVERY
+        if compact:
+            self.compact()
+
+    def get(self, subreddit_name: str, comment_id: str) -> dict | None:
+        """Returns a comment's progress: planned, users (name -> record) and finished_at."""
+        with self._lock:
+            return self._entries.get(_key(subreddit_name, comment_id))
+
+    def user_progress(
+        self, subreddit_name: str, comment_id: str, user_name: str
+    ) -> dict | None:
+        """Returns the last applying or applied record for a user in a comment."""
+        entry = self.get(subreddit_name, comment_id)
+        return entry["users"].get(user_name.lower()) if entry else None
+
+    def unfinished(self) -> list[dict]:
+        with self._lock:
+            return [
+                entry
+                for entry in self._entries.values()
+                if entry["finished_at"] is None
+            ]
+
+    def sync(self) -> None:
+        """Waits until everything appended so far is on disk."""
+        with self._lock:
+            target = self._written
+        self._sync_to(target)
+
+    def compact(self) -> None:
+        """Rewrites the journal without comments finished more than retention seconds ago."""
+        with self._sync_lock, self._lock:
+            cutoff = time.time() - self.RETENTION
+            self._entries = {
+                key: entry
+                for key, entry in self._entries.items()
+                if entry["finished_at"] is None or entry["finished_at"] > cutoff
+            }
+            temporary_path = f"{self.PATH}.compacting"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                for entry in self._entries.values():
+                    for record in entry["records"]:
+                        file.write(json.dumps(record) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            self._file.close()
+            os.replace(temporary_path, self.PATH)
+            self._file = open(self.PATH, "a", encoding="utf-8")
+            self._synced = self._written
+            self._finished_since_compaction = 0
+
+    def _append(self, record: dict, durable: bool = False) -> None:
+        with self._lock:
+            self._apply(record)
+            self._file.write(json.dumps(record) + "\n")
+            self._written += 1
+            target = self._written
+        if durable:
+            self._sync_to(target)
+
+    def _sync_to(self, target: int) -> None:
+        # whoever gets the lock syncs everything written so far, so waiting threads share one fsync
+        with self._sync_lock:
+            if self._synced >= target:
+                return
+            with self._lock:
+                self._file.flush()
+                written = self._written
+            os.fsync(self._file.fileno())
+            self._synced = written
+
+    def _replay(self) -> None:
+        if not os.path.exists(self.PATH):
+            return
+        with open(self.PATH, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError):
+                    # a torn last line from a crash mid-write
+                    LOGGER.warning("Skipping unreadable journal record: %r", line)
+        LOGGER.info(
+            "Replayed journal %s: %s comments, %s unfinished",
+            self.PATH,
+            len(self._entries),
+            len(self.unfinished()),
+        )
+
+    def _apply(self, record: dict) -> None:
+        key = _key(record["subreddit"], record["comment"])
+        if record["op"] == "begin":
+            self._entries.setdefault(
+                key,
+                {
+                    "subreddit": record["subreddit"],
+                    "comment": record["comment"],
+                    "planned": record["planned"],
+                    "users": {},
+                    "finished_at": None,
+                    "records": [],
+                },
+            )
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry["records"].append(record)
+        if record["op"] in ("applying", "applied"):
+            progress = entry["users"].setdefault(record["user"], {})
+            progress.update(record)
+        elif record["op"] == "finish":
+            entry["finished_at"] = record["at"]
+
+
+def _key(subreddit_name: str, comment_id: str) -> tuple[str, str]:
+    return (subreddit_name.lower(), comment_id)
+
+
+_JOURNALS = {}
+_JOURNALS_LOCK = threading.Lock()
+
+
+def open_journal() -> ProcessingJournal | None:
+    """Returns this process's journal, shared by every subreddit, or None when JOURNAL_PATH is empty."""
+    path = os.getenv("JOURNAL_PATH", "bot_journal.jsonl")
+    if not path:
+        return None
+    with _JOURNALS_LOCK:
+        # forked shard processes open their own file rather than share the parent's
+        key = (path, os.getpid())
+        if key not in _JOURNALS:
+            _JOURNALS[key] = ProcessingJournal(
+                path, sint(os.getenv("JOURNAL_RETENTION", ""), 86400)
+            )
+        return _JOURNALS[key]
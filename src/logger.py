@@ -1,21 +1,222 @@
+import atexit
+import json
 import logging
+import os
+import queue
 import sys
+import threading
+import time
+import weakref
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+)
+
+# extra fields the bot attaches to log records, written out by the JSON lines format
+STRUCTURED_FIELDS = (
+    "comment_id",
+    "mentioned_user",
+    "old_flair",
+    "new_flair",
+    "elapsed_ms",
+)
+# queue handlers of the async loggers, so their listeners can be stopped at exit and replaced after a fork
+_QUEUE_HANDLERS = weakref.WeakSet()
+# log file handlers, so a forked process can move them to files of its own
+_FILE_HANDLERS = weakref.WeakSet()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Writes each record as one JSON object, with the bot's structured fields when present."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RawQueueHandler(QueueHandler):
+    """Queues records as they are, so the listener thread formats them instead of the caller.
+
+    QueueHandler.prepare formats the message and traceback up front so
+    records can be pickled, which a queue inside this process doesn't need.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Lets one record per message template and interval through, below warning level.
+
+    The next record let through says how many similar ones were dropped.
+    Warnings and errors always pass.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.INTERVAL = interval
+        self._lock = threading.Lock()
+        self._seen = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            last_at, dropped = self._seen.get(key, (None, 0))
+            if last_at is not None and now - last_at < self.INTERVAL:
+                self._seen[key] = (last_at, dropped + 1)
+                return False
+            self._seen[key] = (now, 0)
+        if dropped:
+            record.msg = f"{record.msg} ({dropped} similar messages dropped)"
+        return True
 
 
 def setup_custom_logger(name):
-    """Set up the logger."""
-    formatter = logging.Formatter(
-        fmt="%(asctime)s %(levelname)-8s %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+    """Set up the logger.
+
+    By default logs go to log.txt, truncated on start, and stdout, written on
+    the logging thread. These environment variables change that:
+    LOG_ASYNC=1 hands records to a background thread, LOG_MAX_BYTES or
+    LOG_ROTATE_WHEN (e.g. "midnight") rotate the file keeping LOG_BACKUP_COUNT
+    old ones, LOG_FORMAT=json writes JSON lines and LOG_SAMPLE_INTERVAL lets
+    each info message through at most once per that many seconds.
+    """
+    return configure_logger(
+        logging.getLogger(name),
+        log_path=os.getenv("LOG_PATH", "log.txt"),
+        async_mode=os.getenv("LOG_ASYNC", "") == "1",
+        json_lines=os.getenv("LOG_FORMAT", "") == "json",
+        max_bytes=_env_number("LOG_MAX_BYTES", 0),
+        rotate_when=os.getenv("LOG_ROTATE_WHEN", ""),
+        backup_count=int(_env_number("LOG_BACKUP_COUNT", 5)),
+        sample_interval=_env_number("LOG_SAMPLE_INTERVAL", 0),
     )
-    handler = logging.FileHandler("log.txt", mode="w")
+
+
+def configure_logger(
+    loggr: logging.Logger,
+    log_path: str,
+    async_mode: bool = False,
+    json_lines: bool = False,
+    max_bytes: float = 0,
+    rotate_when: str = "",
+    backup_count: int = 5,
+    sample_interval: float = 0,
+    stream=None,
+) -> logging.Logger:
+    if json_lines:
+        formatter = JsonLinesFormatter()
+    else:
+        formatter = logging.Formatter(
+            fmt="%(asctime)s %(levelname)-8s %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+        )
+    if max_bytes:
+        handler = RotatingFileHandler(
+            log_path, maxBytes=int(max_bytes), backupCount=backup_count
+        )
+    elif rotate_when:
+        handler = TimedRotatingFileHandler(
+            log_path, when=rotate_when, backupCount=backup_count
+        )
+    else:
+        handler = logging.FileHandler(log_path, mode="w")
     handler.setFormatter(formatter)
-    screen_handler = logging.StreamHandler(stream=sys.stdout)
+    _FILE_HANDLERS.add(handler)
+    screen_handler = logging.StreamHandler(stream=stream or sys.stdout)
     screen_handler.setFormatter(formatter)
-    loggr = logging.getLogger(name)
+    handlers = [handler, screen_handler]
+
     loggr.setLevel(logging.INFO)
-    loggr.addHandler(handler)
-    loggr.addHandler(screen_handler)
+    if async_mode:
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        queue_handler = RawQueueHandler(log_queue)
+        # where logging.config puts it too, so the listener can be stopped through the logger
+        queue_handler.listener = listener
+        _QUEUE_HANDLERS.add(queue_handler)
+        handlers = [queue_handler]
+    if sample_interval:
+        loggr.addFilter(SamplingFilter(sample_interval))
+    for log_handler in handlers:
+        loggr.addHandler(log_handler)
     return loggr
 
 
+def stop_listeners() -> None:
+    """Writes out the records still queued by async loggers and stops their threads.
+
+    Runs at exit. A forked worker has to call it itself before it ends, since
+    multiprocessing ends those with os._exit, skipping atexit.
+    """
+    for queue_handler in list(_QUEUE_HANDLERS):
+        _stop_listener(queue_handler.listener)
+
+
+def _stop_listener(listener: QueueListener) -> None:
+    # QueueListener.stop fails when the listener was already stopped
+    if listener._thread is not None:
+        listener.stop()
+
+
+def use_own_log_file(suffix: str) -> None:
+    """Moves this process's log files to the log path with suffix added, appending to them.
+
+    For forked processes, which would otherwise write to their parent's file
+    and rotate it from under each other. The new file is opened on the first
+    record.
+    """
+    for handler in list(_FILE_HANDLERS):
+        handler.acquire()
+        try:
+            if handler.stream:
+                handler.stream.close()
+                handler.stream = None
+            handler.baseFilename = f"{handler.baseFilename}.{suffix}"
+            # a replacement process keeps what the one before it logged
+            handler.mode = "a"
+        finally:
+            handler.release()
+
+
+def _restart_listeners_in_child() -> None:
+    """Gives a forked child its own queue and listener thread for each async logger.
+
+    The child inherits the parent's queue with whatever records were waiting
+    in it, which the parent writes itself, but not the thread emptying it.
+    """
+    for queue_handler in list(_QUEUE_HANDLERS):
+        listener = queue_handler.listener
+        if listener._thread is None:
+            continue
+        queue_handler.queue = listener.queue = queue.SimpleQueue()
+        listener._thread = None
+        listener.start()
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
+atexit.register(stop_listeners)
+os.register_at_fork(after_in_child=_restart_listeners_in_child)
 LOGGER = setup_custom_logger("penpal-confirmation-bot")
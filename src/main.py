@@ -1,164 +1,868 @@
+import time
+
+# taken before the other imports so the startup report includes them
+PROCESS_STARTED_AT = time.perf_counter()
+
+import asyncio
+import atexit
+import math
 import os
 import praw_bot_wrapper
 import sys
-from pushover import Pushover
+from functools import partial
+from pushover import Pushover, PUSHOVER_URL
 from datetime import datetime
 from praw import models, Reddit
-from helpers_flair import increment_flair
-from helpers_submission import get_current_confirmation_post
-from helpers_redditor import get_redditor
-from helpers import load_secrets, sint, deEmojify
+from praw.exceptions import ClientException
+from helpers_confirmation import (
+    begin_confirmations,
+    handle_confirmation,
+    handle_confirmations,
+)
+from helpers_submission import get_current_confirmation_post, iter_root_comments
+from helpers import load_secrets, sint
 from settings import Settings
 from logger import LOGGER
+from metrics import METRICS
+import profiling
 from helpers_submission import lock_previous_submissions, post_monthly_submission
+from work_queue import KeyedWorkQueue
+from async_runtime import KeyedTasks, stream_items
+from adaptive_stream import AdaptiveStream
+from shard_pool import ShardPool, shard_for
+from confirmation_shard import ConfirmationShard
+from api_scheduler import (
+    ApiScheduler,
+    DeferredBatch,
+    ScheduledRequestor,
+    priority,
+    CATCHUP,
+)
 
+IMPORTED_AT = time.perf_counter()
+# several subreddits can share one bot process, e.g. SUBREDDIT_NAME=penpals+snailmail
 SUBREDDIT_NAME = os.environ["SUBREDDIT_NAME"]
-SECRETS = load_secrets(SUBREDDIT_NAME)
-PUSHOVER = Pushover(SECRETS["PUSHOVER_APP_TOKEN"], SECRETS["PUSHOVER_USER_TOKEN"])
+SUBREDDIT_NAMES = SUBREDDIT_NAME.split("+")
+SECRETS = load_secrets(SUBREDDIT_NAMES[0])
+PUSHOVER = Pushover(
+    SECRETS["PUSHOVER_APP_TOKEN"],
+    SECRETS["PUSHOVER_USER_TOKEN"],
+    url=os.getenv("PUSHOVER_URL", PUSHOVER_URL),
+    timeout=sint(os.getenv("PUSHOVER_TIMEOUT", ""), 10),
+    window=sint(os.getenv("PUSHOVER_COALESCE_WINDOW", ""), 300),
+    state_path=os.getenv("PUSHOVER_STATE_PATH", "pushover_state.json") or None,
+)
+SCHEDULER = ApiScheduler()
 BOT = Reddit(
+    requestor_class=ScheduledRequestor,
+    requestor_kwargs={"scheduler": SCHEDULER},
     client_id=SECRETS["REDDIT_CLIENT_ID"],
     client_secret=SECRETS["REDDIT_CLIENT_SECRET"],
     user_agent=SECRETS["REDDIT_USER_AGENT"],
     username=SECRETS["REDDIT_USERNAME"],
     password=SECRETS["REDDIT_PASSWORD"],
 )
-SETTINGS = Settings(BOT, SUBREDDIT_NAME)
+ALL_SETTINGS = {name.lower(): Settings(BOT, name) for name in SUBREDDIT_NAMES}
+SETTINGS_READY_AT = time.perf_counter()
+# with SHARD_COUNT set, flair updates run in that many worker processes, split by mentioned user.
+# started before any other thread so the forked workers don't inherit a held lock
+SHARD_COUNT = sint(os.getenv("SHARD_COUNT", ""), 0)
+SHARD_POOL = (
+    ShardPool(
+        SHARD_COUNT,
+        partial(ConfirmationShard, SUBREDDIT_NAMES),
+        sint(os.getenv("SHARD_QUEUE_SIZE", ""), 100),
+    )
+    if SHARD_COUNT > 0
+    else None
+)
+if SHARD_POOL:
+    atexit.register(SHARD_POOL.stop)
+# with ADAPTIVE_POLLING set, the comment and inbox streams poll as often as their traffic needs
+if sint(os.getenv("ADAPTIVE_POLLING", ""), 0):
+    POLL_INTERVALS = (
+        sint(os.getenv("POLL_MIN_INTERVAL", ""), 1),
+        sint(os.getenv("POLL_MAX_INTERVAL", ""), 60),
+    )
+    COMMENT_STREAM = AdaptiveStream(
+        BOT.subreddit(SUBREDDIT_NAME).comments, "comments", *POLL_INTERVALS
+    )
+    INBOX_STREAM = AdaptiveStream(BOT.inbox.unread, "inbox", *POLL_INTERVALS)
+else:
+    COMMENT_STREAM = BOT.subreddit(SUBREDDIT_NAME).stream.comments
+    INBOX_STREAM = BOT.inbox.stream
+# marking mail read is housekeeping, sent 25 messages per request once the bot is running
+MARK_READ = None
+SETTINGS = ALL_SETTINGS[SUBREDDIT_NAMES[0].lower()]
+# with WORKER_COUNT set, streams only queue items and a pool of workers processes them
+WORKER_COUNT = sint(os.getenv("WORKER_COUNT", ""), 0)
+WORK_QUEUE = (
+    KeyedWorkQueue(WORKER_COUNT, sint(os.getenv("WORK_QUEUE_SIZE", ""), 500))
+    if WORKER_COUNT > 0
+    else None
+)
+# the journal and checkpoint make the saved flag unnecessary, it can still be set for older tooling
+SAVE_COMMENTS = sint(os.getenv("SAVE_COMMENTS", ""), 0)
+FIRST_COMMENT_AT = None
+# the catchup started by whichever async stream recovered first, the others wait on it
+RECOVERY = None
+# the async runtime's per-user ordered comment tasks and their loop, catchup queues into them too
+COMMENT_TASKS = None
+EVENT_LOOP = None
+
 
+def _settings_for(subreddit: models.Subreddit | str) -> Settings | None:
+    """Returns the settings of the subreddit an item came from, or None if the bot doesn't serve it."""
+    return ALL_SETTINGS.get(str(subreddit).lower())
 
+
+@METRICS.timed("comment_filter")
 def _should_process_comment(comment: models.Comment):
+    settings = _settings_for(comment.subreddit)
     if (
-        not comment.saved
+        settings
+        and not comment.saved
         and not comment.removed
-        and comment.link_author == SETTINGS.BOT_NAME
+        and comment.link_author == settings.BOT_NAME
         and hasattr(comment, "author_fullname")
-        and comment.author_fullname != SETTINGS.FULLNAME
+        and comment.author_fullname != settings.FULLNAME
         and comment.is_root
         and comment.banned_by is None
+        and not settings.CATCHUP_CHECKPOINT.is_processed(comment.link_id, comment.id)
     ):
         return True
     return False
 
 
-@praw_bot_wrapper.stream_handler(SETTINGS.SUBREDDIT.stream.comments)
+@praw_bot_wrapper.stream_handler(COMMENT_STREAM)
+def ingest_comment(comment: models.Comment) -> None:
+    """Passes new comments to the handler, through the work queue when workers are enabled."""
+    METRICS.set("comment_stream_lag_seconds", time.time() - comment.created_utc)
+    if not _should_process_comment(comment):
+        return
+    _dispatch_comment(comment)
+
+
+def _dispatch_comment(comment: models.Comment, is_catchup=False) -> None:
+    if not _start_comment(comment):
+        # already queued, e.g. by catchup before the stream came across it again
+        return
+    if COMMENT_TASKS:
+        # catchup runs in a worker thread, so its comments wait behind the stream's for the same users
+        asyncio.run_coroutine_threadsafe(
+            COMMENT_TASKS.submit(
+                _comment_keys(comment),
+                asyncio.to_thread,
+                _handle_claimed_comment,
+                comment,
+                is_catchup,
+            ),
+            EVENT_LOOP,
+        ).result()
+        return
+    if not WORK_QUEUE:
+        _handle_claimed_comment(comment, is_catchup)
+        return
+    # comments mentioning the same user are processed one at a time, in order
+    WORK_QUEUE.put(_comment_keys(comment), _handle_claimed_comment, comment, is_catchup)
+
+
+def _handle_claimed_comment(comment: models.Comment, is_catchup=False) -> str | None:
+    try:
+        return handle_confirmation_thread_comment(comment, is_catchup)
+    except Exception:
+        _abandon_comment(comment)
+        raise
+
+
+def _start_comment(comment: models.Comment) -> bool:
+    """Claims a comment and keeps the checkpoint behind it until a worker has processed it.
+
+    Returns False when the comment is already claimed.
+    """
+    return _settings_for(comment.subreddit).CATCHUP_CHECKPOINT.start(
+        comment.link_id, comment.id, comment.created_utc
+    )
+
+
+def _abandon_comment(comment: models.Comment) -> None:
+    """Lets catchup claim a comment that failed again, without moving the checkpoint past it."""
+    _settings_for(comment.subreddit).CATCHUP_CHECKPOINT.abandon(
+        comment.link_id, comment.id
+    )
+
+
+def _release_comment(settings: Settings, comment: models.Comment) -> None:
+    settings.CATCHUP_CHECKPOINT.release(comment.link_id, comment.id)
+
+
+def _comment_keys(comment: models.Comment) -> set[str]:
+    """Keys of the users a comment mentions, for processing their comments in order."""
+    settings = _settings_for(comment.subreddit)
+    return {
+        f"{settings.SUBREDDIT_NAME.lower()}/{mentioned_name.lower()}"
+        for mentioned_name, _, _ in settings.CONFIRMATION_PATTERN.findall(comment.body)
+    }
+
+
 def handle_confirmation_thread_comment(
     comment: models.Comment, is_catchup=False
 ) -> str | None:
     """Handles a comment left on the confirmation thread."""
+    settings = _settings_for(comment.subreddit)
     if not is_catchup and not _should_process_comment(comment):
+        if settings:
+            _release_comment(settings, comment)
+        return
+    if is_catchup and settings.CATCHUP_CHECKPOINT.is_processed(
+        comment.link_id, comment.id
+    ):
+        _release_comment(settings, comment)
         return
 
-    LOGGER.info("Processing new comment https://reddit.com%s", comment.permalink)
-    all_matches = SETTINGS.CONFIRMATION_PATTERN.findall(comment.body)
+    started_at = time.perf_counter()
+    LOGGER.info(
+        "Processing new comment https://reddit.com%s",
+        comment.permalink,
+        extra={"comment_id": comment.id},
+    )
+    with METRICS.time("parse"):
+        all_matches = settings.CONFIRMATION_PATTERN.findall(comment.body)
     if not len(all_matches):
-        comment.save()
+        _mark_processed(settings, comment)
         return
 
-    reply_body = ""
-    for match in all_matches:
-        try:
-            reply_body += "\n\n" + _handle_confirmation(comment, match)
-        except Exception as ex:
-            LOGGER.info("Exception occurred while handling confirmation")
-            LOGGER.info(ex)
+    planned = _plan_confirmations(all_matches)
+    if SHARD_POOL:
+        SHARD_POOL.submit(
+            [mentioned_name for mentioned_name, _, _ in planned],
+            lambda positions: (
+                settings.SUBREDDIT_NAME,
+                comment.id,
+                comment.author_fullname,
+                [planned[position] for position in positions],
+            ),
+            lambda shard_results: _finish_sharded_confirmation(
+                settings, comment, planned, shard_results, started_at
+            ),
+        )
+        return None
 
-    comment.save()
-    if reply_body != "":
-        comment.reply(reply_body)
-    return reply_body
+    reply_parts = handle_confirmations(BOT, settings, comment, planned)
+    _mark_processed(settings, comment)
+    if settings.FLAIR_WRITE_QUEUE:
+        # the reply waits until the batch holding this comment's flair writes is confirmed
+        settings.FLAIR_WRITE_QUEUE.after_flush(
+            lambda failed: _reply_to_confirmation(
+                settings, comment, reply_parts, failed, started_at
+            )
+        )
+        return None
+    return _reply_to_confirmation(settings, comment, reply_parts, started_at=started_at)
 
 
-def _handle_confirmation(comment: models.Comment, match: dict) -> str | None:
-    mentioned_name, emails, letters = match
-    emails, letters = sint(emails, 0), sint(letters, 0)
-    mentioned_user = get_redditor(BOT, mentioned_name)
+def _finish_sharded_confirmation(
+    settings: Settings,
+    comment: models.Comment,
+    planned: list[tuple[str, int, int]],
+    shard_results: list,
+    started_at: float | None = None,
+) -> str:
+    """Replies once every shard has handled its part of the comment, in the comment's order.
 
-    if not mentioned_user:
-        return SETTINGS.USER_DOESNT_EXIST.format(
-            comment=comment, mentioned_name=mentioned_name
+    Users whose shard failed or died on the comment are told their flair
+    update failed, and the mods are notified, since whether it went through
+    isn't known.
+    """
+    shard_indexes = sorted(
+        {
+            shard_for(mentioned_name, SHARD_POOL.SHARDS)
+            for mentioned_name, _, _ in planned
+        }
+    )
+    replies = {}
+    failed_names = set()
+    for index, reply_parts in zip(shard_indexes, shard_results):
+        if reply_parts is None:
+            failed_names.update(
+                mentioned_name.lower()
+                for mentioned_name, _, _ in planned
+                if shard_for(mentioned_name, SHARD_POOL.SHARDS) == index
+            )
+            continue
+        for mentioned_name, reply in reply_parts:
+            replies[mentioned_name.lower()] = reply
+    reply_parts = [
+        (mentioned_name, replies.get(mentioned_name.lower()))
+        for mentioned_name, _, _ in planned
+        if mentioned_name.lower() in replies or mentioned_name.lower() in failed_names
+    ]
+    if failed_names:
+        METRICS.inc("confirmations_total", len(failed_names), result="failed")
+        LOGGER.error(
+            "Shard failed on comment %s, flair for %s may not be updated",
+            comment.id,
+            ", ".join(sorted(failed_names)),
+            extra={"comment_id": comment.id},
+        )
+        PUSHOVER.notify(
+            f"Flair update failed for r/{settings.SUBREDDIT_NAME} - {', '.join(sorted(failed_names))} in https://reddit.com{comment.permalink}"
         )
+    _mark_processed(settings, comment)
+    return _reply_to_confirmation(
+        settings, comment, reply_parts, failed_names, started_at
+    )
+
+
+def _mark_processed(settings: Settings, comment: models.Comment) -> None:
+    settings.CATCHUP_CHECKPOINT.mark_processed(
+        settings.SUBREDDIT_NAME, comment.link_id, comment.id, comment.created_utc
+    )
+
 
-    if mentioned_user.fullname == comment.author_fullname:
-        return SETTINGS.CANT_UPDATE_YOURSELF
+def _plan_confirmations(all_matches: list) -> list[tuple[str, int, int]]:
+    """Sums emails and letters per mentioned user so each user is looked up and flaired once per comment."""
+    planned = {}
+    for mentioned_name, emails, letters in all_matches:
+        name, total_emails, total_letters = planned.get(
+            mentioned_name.lower(), (mentioned_name, 0, 0)
+        )
+        planned[mentioned_name.lower()] = (
+            name,
+            total_emails + sint(emails, 0),
+            total_letters + sint(letters, 0),
+        )
+    return list(planned.values())
 
-    old_flair, new_flair = increment_flair(SETTINGS, mentioned_user, emails, letters)
-    if not old_flair or not new_flair:
-        return SETTINGS.FLAIR_UPDATE_FAILED.format(mentioned_name=mentioned_name)
 
-    LOGGER.info("Updated %s to %s for %s", old_flair, new_flair, mentioned_name)
-    return deEmojify(
-        SETTINGS.CONFIRMATION_TEMPLATE.format(
-            mentioned_name=mentioned_name, old_flair=old_flair, new_flair=new_flair
+def _reply_to_confirmation(
+    settings: Settings,
+    comment: models.Comment,
+    reply_parts: list,
+    failed_names: set = frozenset(),
+    started_at: float | None = None,
+) -> str:
+    reply_body = ""
+    for mentioned_name, reply in reply_parts:
+        if mentioned_name.lower() in failed_names:
+            reply = settings.FLAIR_UPDATE_FAILED.format(mentioned_name=mentioned_name)
+        reply_body += "\n\n" + reply
+    if reply_body != "":
+        with METRICS.time("reply"):
+            comment.reply(reply_body)
+    if SAVE_COMMENTS:
+        comment.save()
+    if settings.JOURNAL:
+        settings.JOURNAL.finish(settings.SUBREDDIT_NAME, comment.id)
+    if started_at is not None:
+        elapsed = time.perf_counter() - started_at
+        METRICS.observe("stage_duration_seconds", elapsed, stage="comment")
+        elapsed_ms = elapsed * 1000
+        LOGGER.info(
+            "Handled comment %s in %.1f ms",
+            comment.id,
+            elapsed_ms,
+            extra={"comment_id": comment.id, "elapsed_ms": round(elapsed_ms, 1)},
         )
+    if FIRST_COMMENT_AT is None:
+        _report_first_comment()
+    return reply_body
+
+
+def _report_startup() -> None:
+    """Logs how long imports and loading secrets and settings took, and exports it as metrics."""
+    phases = {
+        "imports": IMPORTED_AT - PROCESS_STARTED_AT,
+        "settings": SETTINGS_READY_AT - IMPORTED_AT,
+    }
+    for phase, seconds in phases.items():
+        METRICS.set("startup_seconds", seconds, phase=phase)
+    LOGGER.info(
+        "Started in %.2fs: imports %.2fs, secrets and settings %.2fs%s",
+        SETTINGS_READY_AT - PROCESS_STARTED_AT,
+        phases["imports"],
+        phases["settings"],
+        " (fast start)" if sint(os.getenv("FAST_START", ""), 0) else "",
     )
 
 
-@praw_bot_wrapper.stream_handler(BOT.inbox.stream)
+def _report_first_comment() -> None:
+    global FIRST_COMMENT_AT
+    FIRST_COMMENT_AT = time.perf_counter()
+    seconds = FIRST_COMMENT_AT - PROCESS_STARTED_AT
+    METRICS.set("startup_seconds", seconds, phase="first_comment")
+    LOGGER.info("First comment handled %.2fs after start", seconds)
+
+
+@praw_bot_wrapper.stream_handler(INBOX_STREAM)
+def ingest_mail(message: models.Message | models.Comment | models.Submission) -> None:
+    if not WORK_QUEUE:
+        handle_new_mail(message)
+        return
+    WORK_QUEUE.put({"inbox"}, handle_new_mail, message)
+
+
 def handle_new_mail(
     message: models.Message | models.Comment | models.Submission,
 ) -> None:
     """Monitors messages sent to the bot"""
-    message.mark_read()
-    if (
-        not isinstance(message, models.Message)
-        or message.author not in SETTINGS.CURRENT_MODS
-    ):
+    _mark_read(message)
+    moderated_settings = _moderated_settings(message)
+    if moderated_settings and _start_profiling(message):
         return
-    if "reload" in message.body.lower():
+    if moderated_settings and "reload" in message.body.lower():
         LOGGER.info("Mod requested settings reload")
-        SETTINGS.reload(BOT, SUBREDDIT_NAME)
-        message.reply("Successfully reloaded bot settings")
-    message.mark_read()
+        changes = []
+        for settings in moderated_settings:
+            changes += _reload_settings(settings)
+        message.reply(_reload_reply(changes))
+
+
+def _mark_read(message: models.Message | models.Comment | models.Submission) -> None:
+    if MARK_READ:
+        MARK_READ.add(message)
+    else:
+        message.mark_read()
+
+
+def _moderated_settings(
+    message: models.Message | models.Comment | models.Submission,
+) -> list[Settings]:
+    """Settings of every served subreddit the sender moderates, since they act on all of them."""
+    if not isinstance(message, models.Message) or not message.author:
+        return []
+    return [
+        settings
+        for settings in ALL_SETTINGS.values()
+        if message.author in settings.CURRENT_MODS
+    ]
+
+
+@METRICS.timed("settings_reload")
+def _reload_settings(settings: Settings) -> list[str]:
+    changes = [
+        f"* r/{settings.SUBREDDIT_NAME}: {change}"
+        for change in settings.reload(BOT, settings.SUBREDDIT_NAME)
+    ]
+    if SHARD_POOL:
+        SHARD_POOL.broadcast("reload", settings.SUBREDDIT_NAME)
+    return changes
+
+
+def _reload_shards(subreddit_name: str) -> None:
+    SHARD_POOL.broadcast("reload", subreddit_name)
+
+
+def _start_profiling(message: models.Message) -> bool:
+    """Handles a "profile [seconds]" or "memsnapshot [seconds]" message, replying with the report when it's done."""
+    command = profiling.parse_command(message.body)
+    if not command:
+        return False
+    name, seconds = command
+    LOGGER.info("Mod requested %s for %s seconds", name, seconds)
+    if not profiling.start(name, seconds, message.reply):
+        message.reply("Another profile or memsnapshot is still running.")
+    return True
+
+
+def _reload_reply(changes: list[str]) -> str:
+    return "Successfully reloaded bot settings\n\n" + (
+        "\n".join(changes) or "Nothing had changed."
+    )
+
+
+@praw_bot_wrapper.stream_handler(BOT.subreddit(SUBREDDIT_NAME).mod.stream.log)
+def handle_mod_log(log_entry: models.ModAction) -> None:
+    """Keeps the moderator cache and the flair ledger in step with what moderators do.
+
+    Added and removed moderators are picked up without a reload, and the
+    ledger flair of users whose flair was edited by someone other than the
+    bot is forgotten.
+    """
+    settings = _settings_for(log_entry.subreddit)
+    if not settings:
+        return
+    moderator_change = settings.CURRENT_MODS.apply(log_entry)
+    if moderator_change:
+        name, is_moderator = moderator_change
+        LOGGER.info(
+            "%s u/%s as a moderator of r/%s",
+            "Added" if is_moderator else "Removed",
+            name,
+            settings.SUBREDDIT_NAME,
+        )
+        if SHARD_POOL:
+            SHARD_POOL.broadcast(
+                "update_moderator", settings.SUBREDDIT_NAME, name, is_moderator
+            )
+        return
+    if log_entry.action != "editflair" or not log_entry.target_author:
+        return
+    if str(log_entry.mod).lower() == settings.BOT_NAME.lower():
+        return
+    LOGGER.info("Flair for %s edited by %s", log_entry.target_author, log_entry.mod)
+    settings.FLAIR_LEDGER.forget(settings.SUBREDDIT_NAME, log_entry.target_author)
+
+
+def replay_journal() -> None:
+    """Finishes comments that the journal shows were interrupted by a crash or restart.
+
+    Catchup can't be relied on for these since a comment is checkpointed
+    before its reply is posted. Users whose flair was already updated get
+    their journaled reply, and a comment the bot already replied to is just
+    marked finished.
+    """
+    journals = {settings.JOURNAL for settings in ALL_SETTINGS.values()} - {None}
+    for journal in journals:
+        for entry in journal.unfinished():
+            settings = _settings_for(entry["subreddit"])
+            if settings:
+                _resume_comment(settings, journal, entry)
+
+
+def _resume_comment(settings: Settings, journal, entry: dict) -> None:
+    comment = BOT.comment(entry["comment"])
+    try:
+        comment.refresh()
+    except ClientException as ex:
+        LOGGER.info("Dropping interrupted comment %s: %s", entry["comment"], ex)
+        journal.finish(settings.SUBREDDIT_NAME, entry["comment"])
+        return
+    if any(
+        str(reply.author).lower() == settings.BOT_NAME.lower()
+        for reply in comment.replies
+    ):
+        journal.finish(settings.SUBREDDIT_NAME, comment.id)
+        return
+    LOGGER.info("Resuming interrupted comment https://reddit.com%s", comment.permalink)
+    planned = [tuple(match) for match in entry["planned"]]
+    reply_parts = handle_confirmations(BOT, settings, comment, planned)
+    _mark_processed(settings, comment)
+    _reply_to_confirmation(settings, comment, reply_parts)
 
 
 @praw_bot_wrapper.outage_recovery_handler(outage_threshold=10)
+@METRICS.timed("catchup")
 def handle_catchup(started_at: datetime | None = None):
+    LOGGER.info("Running catchup function")
+    if started_at:
+        PUSHOVER.notify(
+            f"Bot error for r/{os.getenv('SUBREDDIT_NAME', 'unknown')} - Server Error from Reddit APIs. Started at {started_at}"
+        )
+    with priority(CATCHUP):
+        for settings in ALL_SETTINGS.values():
+            _handle_subreddit_catchup(settings, started_at)
+    LOGGER.info("API scheduler after catchup: %s", SCHEDULER.stats())
+    if WORK_QUEUE:
+        LOGGER.info("Work queue after catchup: %s", WORK_QUEUE.stats())
+    if SHARD_POOL:
+        LOGGER.info("Shards after catchup: %s", SHARD_POOL.stats())
+
+
+def _handle_subreddit_catchup(settings: Settings, started_at: datetime | None):
     # send the modmail this way so it is archivable
     # mod discussions can't be archived which is annoying
-    LOGGER.info("Running catchup function")
     if started_at:
-        SETTINGS.SUBREDDIT.modmail.create(
+        settings.SUBREDDIT.modmail.create(
             subject="Bot Recovered from Extended Outage",
-            body=SETTINGS.OUTAGE_MESSAGE.format(
-                started_at=started_at, subreddit_name=SUBREDDIT_NAME
+            body=settings.OUTAGE_MESSAGE.format(
+                started_at=started_at, subreddit_name=settings.SUBREDDIT_NAME
             ),
-            recipient=SETTINGS.ME,
+            recipient=settings.ME,
         )
-        PUSHOVER.send_message(
-            f"Bot error for r/{os.getenv('SUBREDDIT_NAME', 'unknown')} - Server Error from Reddit APIs. Started at {started_at}"
-        )
-    current_confirmation_submission = get_current_confirmation_post(SETTINGS)
-    current_confirmation_submission.comment_sort = "new"
+    current_confirmation_submission = get_current_confirmation_post(settings)
     if not current_confirmation_submission:
-        LOGGER.infO("Catchup skipped - no monthly post found")
+        LOGGER.info(
+            "Catchup skipped for r/%s - no monthly post found",
+            settings.SUBREDDIT_NAME,
+        )
         return
-    _handle_catchup(current_confirmation_submission)
-    LOGGER.info("Catchup finished")
+    settings.CATCHUP_CHECKPOINT.prune(
+        settings.SUBREDDIT_NAME, current_confirmation_submission.fullname
+    )
+    checkpoint = settings.CATCHUP_CHECKPOINT.get(
+        current_confirmation_submission.fullname
+    )
+    new_comments = None
+    if checkpoint:
+        new_comments = _comments_since(
+            settings, current_confirmation_submission, checkpoint
+        )
+    if new_comments is None:
+        new_comments = _handle_catchup(
+            settings, current_confirmation_submission, checkpoint
+        )
+    # oldest first, so the checkpoint never moves past a comment that wasn't processed
+    for comment in reversed(new_comments):
+        _dispatch_comment(comment, is_catchup=True)
+    LOGGER.info(
+        "Catchup finished for r/%s, found %s new comments",
+        settings.SUBREDDIT_NAME,
+        len(new_comments),
+    )
+
+
+def _comments_since(
+    settings: Settings, submission: models.Submission, checkpoint: tuple[float, str]
+) -> list[models.Comment] | None:
+    """Collects unprocessed comments newer than the checkpoint from the subreddit comment listing.
+
+    Returns None when the listing runs out before reaching the checkpoint, in
+    which case the submission's comment tree has to be walked instead.
+    """
+    checkpoint_created_utc, _ = checkpoint
+    new_comments = []
+    for comment in settings.SUBREDDIT.comments(limit=None):
+        if comment.created_utc < checkpoint_created_utc:
+            return new_comments
+        if comment.link_id == submission.fullname and _should_process_comment(comment):
+            new_comments.append(comment)
+    return None
 
 
-def _handle_catchup(item: models.Submission | models.MoreComments):
-    for comment in item.comments:
-        if isinstance(comment, models.MoreComments):
-            _handle_catchup(comment)
+def _handle_catchup(
+    settings: Settings,
+    submission: models.Submission,
+    checkpoint: tuple[float, str] | None = None,
+) -> list[models.Comment]:
+    """Collects unprocessed top level comments, newest first, down to the checkpoint.
+
+    A comment that failed stays unprocessed behind newer ones that succeeded,
+    so processed comments newer than the checkpoint are skipped rather than
+    ending the walk. Without a checkpoint it stops at the first processed one.
+    """
+    checkpoint_created_utc = checkpoint[0] if checkpoint else math.inf
+    new_comments = []
+    for comment in iter_root_comments(submission, sort="new"):
         if comment.stickied:  # ignore mod stickied comments
             continue
-        if comment.saved:
-            return
-        handle_confirmation_thread_comment(comment, is_catchup=True)
+        if comment.saved or settings.CATCHUP_CHECKPOINT.is_processed(
+            comment.link_id, comment.id
+        ):
+            if comment.created_utc < checkpoint_created_utc:
+                break
+            continue
+        new_comments.append(comment)
+    return new_comments
+
+
+async def run_async() -> None:
+    """Runs the bot on an asyncio event loop instead of the blocking praw_bot_wrapper loop.
+
+    After catchup the comment, inbox and mod log streams are consumed concurrently and comments
+    are handled as overlapping tasks, ordered per mentioned user like the
+    work queue. Catchup comments, including those found after an outage, are
+    queued into the same tasks. praw itself still blocks, so every Reddit call
+    is made from a worker thread.
+    """
+    global COMMENT_TASKS, EVENT_LOOP
+    PUSHOVER.notify(f"Bot startup for r/{SUBREDDIT_NAME}")
+    EVENT_LOOP = asyncio.get_running_loop()
+    COMMENT_TASKS = KeyedTasks(sint(os.getenv("WORK_QUEUE_SIZE", ""), 500))
+    await asyncio.to_thread(handle_catchup)
+    await asyncio.gather(
+        _consume_comments(COMMENT_TASKS), _consume_mail(), _consume_mod_log()
+    )
+
+
+async def _consume_comments(comment_tasks: KeyedTasks) -> None:
+    async for comment in stream_items(COMMENT_STREAM, _recover_async):
+        METRICS.set("comment_stream_lag_seconds", time.time() - comment.created_utc)
+        if _should_process_comment(comment) and _start_comment(comment):
+            await comment_tasks.submit(
+                _comment_keys(comment),
+                _handle_claimed_comment_async,
+                comment,
+            )
+
+
+async def _handle_claimed_comment_async(comment: models.Comment) -> str | None:
+    try:
+        return await handle_confirmation_thread_comment_async(comment)
+    except Exception:
+        _abandon_comment(comment)
+        raise
+
+
+async def _consume_mail() -> None:
+    async for message in stream_items(INBOX_STREAM, _recover_async):
+        try:
+            await handle_new_mail_async(message)
+        except Exception as ex:
+            LOGGER.exception(ex)
+
+
+async def _consume_mod_log() -> None:
+    async for log_entry in stream_items(
+        BOT.subreddit(SUBREDDIT_NAME).mod.stream.log, _recover_async
+    ):
+        try:
+            await asyncio.to_thread(handle_mod_log, log_entry)
+        except Exception as ex:
+            LOGGER.exception(ex)
+
+
+async def _recover_async(started_at: datetime) -> None:
+    """Runs one catchup per outage, however many streams saw it."""
+    global RECOVERY
+    if RECOVERY is None or RECOVERY.done():
+        RECOVERY = asyncio.ensure_future(_run_recovery(started_at))
+    await RECOVERY
+
+
+async def _run_recovery(started_at: datetime) -> None:
+    try:
+        await asyncio.to_thread(handle_catchup, started_at)
+    except Exception as ex:
+        LOGGER.exception(ex)
+
+
+async def handle_confirmation_thread_comment_async(
+    comment: models.Comment,
+) -> str | None:
+    """Coroutine version of handle_confirmation_thread_comment.
+
+    Each user appears once in the planned confirmations, so every mentioned
+    user is looked up and flaired at the same time, and the checkpoint is
+    written while the reply is posted.
+    """
+    if SHARD_POOL:
+        # the shards do the flair updates, this only waits for room in their queues
+        return await asyncio.to_thread(handle_confirmation_thread_comment, comment)
+    settings = _settings_for(comment.subreddit)
+    if not _should_process_comment(comment):
+        _release_comment(settings, comment)
+        return None
+
+    started_at = time.perf_counter()
+    LOGGER.info(
+        "Processing new comment https://reddit.com%s",
+        comment.permalink,
+        extra={"comment_id": comment.id},
+    )
+    with METRICS.time("parse"):
+        all_matches = settings.CONFIRMATION_PATTERN.findall(comment.body)
+    if not len(all_matches):
+        await asyncio.to_thread(_mark_processed, settings, comment)
+        return None
+
+    planned = _plan_confirmations(all_matches)
+    await asyncio.to_thread(begin_confirmations, settings, comment, planned)
+    replies = await asyncio.gather(
+        *(
+            asyncio.to_thread(handle_confirmation, BOT, settings, comment, match)
+            for match in planned
+        ),
+        return_exceptions=True,
+    )
+    reply_parts = []
+    for match, reply in zip(planned, replies):
+        if isinstance(reply, Exception):
+            METRICS.inc("confirmations_total", result="error")
+            LOGGER.info("Exception occurred while handling confirmation")
+            LOGGER.info(reply)
+        else:
+            reply_parts.append((match[0], reply))
+
+    _, reply_body = await asyncio.gather(
+        asyncio.to_thread(_mark_processed, settings, comment),
+        _reply_after_flush(settings, comment, reply_parts, started_at),
+    )
+    return reply_body
+
+
+async def _reply_after_flush(
+    settings: Settings,
+    comment: models.Comment,
+    reply_parts: list,
+    started_at: float | None = None,
+) -> str:
+    failed_names = frozenset()
+    if settings.FLAIR_WRITE_QUEUE:
+        # the reply waits until the batch holding this comment's flair writes is confirmed
+        loop = asyncio.get_running_loop()
+        flushed = loop.create_future()
+        settings.FLAIR_WRITE_QUEUE.after_flush(
+            lambda failed: loop.call_soon_threadsafe(flushed.set_result, failed)
+        )
+        failed_names = await flushed
+    return await asyncio.to_thread(
+        _reply_to_confirmation,
+        settings,
+        comment,
+        reply_parts,
+        failed_names,
+        started_at,
+    )
+
+
+async def handle_new_mail_async(
+    message: models.Message | models.Comment | models.Submission,
+) -> None:
+    """Coroutine version of handle_new_mail, reloading every moderated subreddit at once."""
+    _mark_read(message)
+    moderated_settings = _moderated_settings(message)
+    if moderated_settings and await asyncio.to_thread(_start_profiling, message):
+        return
+    if not moderated_settings or "reload" not in message.body.lower():
+        return
+    LOGGER.info("Mod requested settings reload")
+    changes = await asyncio.gather(
+        *(
+            asyncio.to_thread(_reload_settings, settings)
+            for settings in moderated_settings
+        )
+    )
+    await asyncio.to_thread(
+        message.reply,
+        _reload_reply([change for subreddit in changes for change in subreddit]),
+    )
 
 
 if __name__ == "__main__":
     try:
         if len(sys.argv) > 1:
             if sys.argv[1] == "create-monthly":
-                new_submission = post_monthly_submission(SETTINGS)
-                lock_previous_submissions(SETTINGS, new_submission)
-                PUSHOVER.send_message(f"Created monthly post for r/{SUBREDDIT_NAME}")
+                for settings in ALL_SETTINGS.values():
+                    new_submission = post_monthly_submission(settings)
+                    lock_previous_submissions(settings, new_submission)
+                    PUSHOVER.notify(
+                        f"Created monthly post for r/{settings.SUBREDDIT_NAME}"
+                    )
         else:
             LOGGER.info("Bot start up")
-            PUSHOVER.send_message(f"Bot startup for r/{SUBREDDIT_NAME}")
-            handle_catchup()
-            praw_bot_wrapper.run()
+            MARK_READ = DeferredBatch(BOT.inbox.mark_read, 25, 30)
+            atexit.register(MARK_READ.flush)
+            _report_startup()
+            metrics_port = sint(os.getenv("METRICS_PORT", ""), 0)
+            if metrics_port > 0:
+                METRICS.serve(metrics_port, os.getenv("METRICS_HOST", "127.0.0.1"))
+            replay_journal()
+            for settings in ALL_SETTINGS.values():
+                # shards built their settings from the same snapshot, they reload if it was out of date
+                after_reload = (
+                    partial(_reload_shards, settings.SUBREDDIT_NAME)
+                    if SHARD_POOL
+                    else None
+                )
+                settings.start_revalidation(BOT, after_reload)
+            settings_poll_interval = sint(os.getenv("SETTINGS_POLL_INTERVAL", ""), 0)
+            if settings_poll_interval > 0:
+                for settings in ALL_SETTINGS.values():
+                    settings.start_polling(BOT, settings_poll_interval)
+            moderator_resync_interval = sint(
+                os.getenv("MODERATOR_RESYNC_INTERVAL", ""), 3600
+            )
+            if moderator_resync_interval > 0:
+                for settings in ALL_SETTINGS.values():
+                    settings.start_moderator_resync(moderator_resync_interval)
+            if sint(os.getenv("ASYNC_RUNTIME", ""), 0):
+                asyncio.run(run_async())
+            else:
+                PUSHOVER.notify(f"Bot startup for r/{SUBREDDIT_NAME}")
+                handle_catchup()
+                praw_bot_wrapper.run()
     except Exception as ex:
         LOGGER.exception(ex)
-        PUSHOVER.send_message(f"r{SUBREDDIT_NAME} bot exception: {ex}")
+        PUSHOVER.notify(f"r{SUBREDDIT_NAME} bot exception: {ex}")
         pass
@@ -0,0 +1,205 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from logger import LOGGER
+
+PREFIX = "penpal_bot_"
+# seconds, Prometheus' default histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+HELP = {
+    "stage_duration_seconds": "Time spent in each stage of the bot",
+    "reddit_api_requests_total": "Reddit API requests by method, endpoint and status",
+    "reddit_ratelimit_remaining": "Requests left in Reddit's rate limit window",
+    "redditor_cache_requests_total": "Mentioned user lookups by cache result",
+    "confirmations_total": "Confirmations handled, by result",
+    "comment_stream_lag_seconds": "Age of the newest comment read from the stream",
+    "stream_polls_total": "Listing requests made by each adaptive stream",
+    "stream_poll_interval_seconds": "Current polling interval of each adaptive stream",
+    "stream_overflows_total": "Polls that came back full of new items, so items may have been missed",
+    "stream_gap_items_total": "Items recovered by paging back after an overflow",
+    "stream_unrecovered_gaps_total": "Overflows where paging back didn't reach the last seen item",
+    "startup_seconds": "How long each startup phase took, first_comment counts from process start",
+}
+# path segments followed by a name or id, which are left out of endpoint labels
+_NAMED_SEGMENTS = {"r", "u", "user", "comments", "by_id", "duplicates"}
+
+
+class Metrics:
+    """Counters, gauges and latency histograms, rendered in Prometheus' text format.
+
+    Recording is a dict update under a lock, and values that already exist
+    elsewhere, like cache hit counts, are only read when someone scrapes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._derived = []
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, _label_items(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[(name, _label_items(labels))] = value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = (name, _label_items(labels))
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # per bucket counts, with one more for everything above the last bucket, then the sum
+                histogram = self._histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[bucket] += 1
+            histogram[-1] += seconds
+
+    def derive(self, name: str, kind: str, read, **labels) -> None:
+        """Reports read() as a counter or gauge each time the metrics are scraped."""
+        with self._lock:
+            self._derived.append((name, kind, _label_items(labels), read))
+
+    @contextmanager
+    def time(self, stage: str):
+        """Records how long the block takes under stage_duration_seconds."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(
+                "stage_duration_seconds", time.perf_counter() - started_at, stage=stage
+            )
+
+    def timed(self, stage: str):
+        """Decorator version of time()."""
+
+        def decorate(function):
+            @wraps(function)
+            def timed_function(*args, **kwargs):
+                with self.time(stage):
+                    return function(*args, **kwargs)
+
+            return timed_function
+
+        return decorate
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+            derived = list(self._derived)
+        for name, kind, labels, read in derived:
+            try:
+                value = read()
+            except Exception as ex:
+                LOGGER.warning("Couldn't read metric %s: %s", name, ex)
+                continue
+            if value is not None:
+                (counters if kind == "counter" else gauges)[(name, labels)] = value
+
+        lines = []
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for name, samples in _by_name(values).items():
+                lines += _header(name, kind)
+                for labels, value in samples:
+                    lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+        for name, samples in _by_name(histograms).items():
+            lines += _header(name, "histogram")
+            for labels, histogram in samples:
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram):
+                    cumulative += count
+                    bucket_labels = labels + (("le", str(bound)),)
+                    lines.append(
+                        f"{PREFIX}{name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+                    )
+                lines.append(
+                    f"{PREFIX}{name}_sum{_format_labels(labels)} {histogram[-1]}"
+                )
+                lines.append(
+                    f"{PREFIX}{name}_count{_format_labels(labels)} {cumulative}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serves the metrics at http://host:port/metrics from a background thread."""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # scrapes every few seconds would drown out the bot's own log
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(
+            target=server.serve_forever, name="metrics", daemon=True
+        ).start()
+        LOGGER.info("Serving metrics on http://%s:%s/metrics", host, port)
+        return server
+
+
+def endpoint_label(url: str) -> str:
+    """Reddit API path with names and ids left out, e.g. /r/_/api/flairselector."""
+    segments = urlsplit(url).path.strip("/").removesuffix(".json").split("/")
+    label = []
+    for segment in segments:
+        if label and label[-1] in _NAMED_SEGMENTS:
+            label.append("_")
+            if label[-2] == "comments":
+                # the rest is the post's slug and a comment id
+                break
+        else:
+            label.append(segment)
+    return "/" + "/".join(label)
+
+
+def _label_items(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _by_name(values: dict) -> dict:
+    samples = {}
+    for (name, labels), value in sorted(values.items()):
+        samples.setdefault(name, []).append((labels, value))
+    return samples
+
+
+def _header(name: str, kind: str) -> list[str]:
+    return [
+        f"# HELP {PREFIX}{name} {HELP.get(name, name)}",
+        f"# TYPE {PREFIX}{name} {kind}",
+    ]
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics()
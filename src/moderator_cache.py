@@ -0,0 +1,66 @@
+import threading
+from collections.abc import Set
+
+# mod log actions that make the acting or target user a moderator, or stop them being one
+ADDED_ACTIONS = ("acceptmoderatorinvite", "addmoderator")
+REMOVED_ACTIONS = ("removemoderator",)
+
+
+class ModeratorCache(Set):
+    """The moderators of a subreddit, kept current from the mod log.
+
+    Works as a set of lowercased usernames, and membership takes a Redditor
+    or a name in any case. Usernames can't change, so they identify a user
+    as well as an id does, and checking one never fetches anything. Readers
+    never wait: every change swaps in a new frozenset.
+    """
+
+    def __init__(self, names=()):
+        self._lock = threading.Lock()
+        self._names = frozenset(str(name).lower() for name in names)
+
+    def __contains__(self, user) -> bool:
+        return str(user).lower() in self._names
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __repr__(self) -> str:
+        return f"ModeratorCache({sorted(self._names)!r})"
+
+    def update(self, name: str, is_moderator: bool) -> None:
+        with self._lock:
+            if is_moderator:
+                self._names = self._names | {name.lower()}
+            else:
+                self._names = self._names - {name.lower()}
+
+    def replace(self, names) -> tuple[set[str], set[str]]:
+        """Swaps in a full moderator list, returning the names (added, removed)."""
+        names = frozenset(str(name).lower() for name in names)
+        with self._lock:
+            added, removed = names - self._names, self._names - names
+            self._names = names
+        return (set(added), set(removed))
+
+    def apply(self, log_entry) -> tuple[str, bool] | None:
+        """Updates the cache from a mod log entry, returning (name, is_moderator) when it changed anything."""
+        if log_entry.action in ADDED_ACTIONS:
+            # whoever accepts an invite is the one acting
+            name = (
+                log_entry.mod
+                if log_entry.action == "acceptmoderatorinvite"
+                else log_entry.target_author
+            )
+            is_moderator = True
+        elif log_entry.action in REMOVED_ACTIONS:
+            name, is_moderator = log_entry.target_author, False
+        else:
+            return None
+        if not name or (str(name) in self) == is_moderator:
+            return None
+        self.update(str(name), is_moderator)
+        return (str(name).lower(), is_moderator)
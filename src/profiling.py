@@ -0,0 +1,138 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from logger import LOGGER
+
+COMMANDS = ("profile", "memsnapshot")
+DEFAULT_SECONDS = 60
+MAX_SECONDS = 600
+# how many functions or allocation sites a report lists
+TOP = 20
+SAMPLE_INTERVAL = 0.005
+# a thread whose innermost frame is in one of these is waiting for work, not doing it
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+
+_RUNNING = threading.Lock()
+
+
+def parse_command(body: str) -> tuple[str, int] | None:
+    """Returns (command, seconds) for a "profile [seconds]" or "memsnapshot [seconds]" message."""
+    words = body.lower().split()
+    if not words or words[0] not in COMMANDS:
+        return None
+    seconds = DEFAULT_SECONDS
+    if len(words) > 1 and words[1].isdigit():
+        seconds = int(words[1])
+    return (words[0], max(1, min(seconds, MAX_SECONDS)))
+
+
+def start(command: str, seconds: int, on_report) -> bool:
+    """Runs a profiling command for seconds on a background thread, then calls on_report(report).
+
+    Only one runs at a time; returns False when another is still running.
+    Nothing is hooked into the bot outside these windows.
+    """
+    if not _RUNNING.acquire(blocking=False):
+        return False
+    work = sample_stacks if command == "profile" else trace_allocations
+
+    def run():
+        try:
+            report = work(seconds)
+        except Exception as ex:
+            LOGGER.exception(ex)
+            report = f"{command} failed: {ex}"
+        finally:
+            _RUNNING.release()
+        on_report(report)
+
+    threading.Thread(target=run, name=f"profiling-{command}", daemon=True).start()
+    LOGGER.info("Started %s for %s seconds", command, seconds)
+    return True
+
+
+def sample_stacks(seconds: float, interval: float = SAMPLE_INTERVAL) -> str:
+    """Samples every thread's stack for seconds and reports where the time goes.
+
+    cProfile only sees the thread it was enabled on, while the bot's work is
+    spread over stream, worker and scheduler threads, so this looks at all of
+    them through sys._current_frames() instead. Idle threads are left out.
+    """
+    own_thread = threading.get_ident()
+    own_time = Counter()
+    total_time = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if (
+                thread_id == own_thread
+                or os.path.basename(frame.f_code.co_filename) in _IDLE_FILES
+            ):
+                continue
+            samples += 1
+            own_time[_location(frame)] += 1
+            seen = set()
+            while frame is not None:
+                location = _location(frame)
+                if location not in seen:
+                    seen.add(location)
+                    total_time[location] += 1
+                frame = frame.f_back
+        time.sleep(interval)
+
+    if not samples:
+        return f"No busy threads were seen in {seconds} seconds."
+    lines = [
+        f"Profiled for {seconds} seconds, {samples} busy thread samples.",
+        "",
+        "    cumulative    own  function",
+    ]
+    for location, count in total_time.most_common(TOP):
+        lines.append(
+            f"    {count / samples:9.1%} {own_time[location] / samples:6.1%}  "
+            f"{location[1]} ({location[0]}:{location[2]})"
+        )
+    return "\n".join(lines)
+
+
+def trace_allocations(seconds: float) -> str:
+    """Traces allocations for seconds and reports the sites holding the most memory."""
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    try:
+        time.sleep(seconds)
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+
+    lines = [
+        f"Traced allocations for {seconds} seconds: "
+        f"{current / 1024:.0f} KiB still allocated, {peak / 1024:.0f} KiB at the peak.",
+        "",
+        "         KiB   blocks  site",
+    ]
+    for statistic in snapshot.statistics("lineno")[:TOP]:
+        frame = statistic.traceback[0]
+        lines.append(
+            f"    {statistic.size / 1024:8.1f} {statistic.count:8}  "
+            f"{_short_path(frame.filename)}:{frame.lineno}"
+        )
+    return "\n".join(lines)
+
+
+def _location(frame) -> tuple[str, str, int]:
+    code = frame.f_code
+    return (_short_path(code.co_filename), code.co_name, code.co_firstlineno)
+
+
+def _short_path(path: str) -> str:
+    return os.path.join(*path.split(os.sep)[-2:]) if os.sep in path else path
@@ -1,30 +1,186 @@
+import atexit
 import http.client
+import json
+import queue
+import re
+import threading
+import time
 import urllib
 from logger import LOGGER
 from requests import Session
 
+PUSHOVER_URL = "https://api.pushover.net/1/messages.json"
+# numbers, ids and timestamps differ between otherwise identical messages
+_VARYING_PARTS = re.compile(r"\d+|0x[0-9a-f]+|\b[0-9a-f]{8,}\b", re.IGNORECASE)
+
 
 class Pushover:
-    def __init__(self, APP_TOKEN, USER_TOKEN):
+    """Sends Pushover notifications.
+
+    send_message() posts on the caller's thread. notify() only queues the
+    message for a background sender, which retries with backoff, so the bot
+    never waits on Pushover. Messages that only differ in their numbers are
+    coalesced: the first is sent right away and the repeats within WINDOW
+    seconds are summed up in one follow up message, e.g. "bot exception
+    (x12 more in the last 5 min)". Queued messages are sent on shutdown.
+
+    With state_path set, open coalescing windows are saved there on shutdown
+    and picked up on start, so a crash loop still sends one message per
+    window rather than one per crash.
+    """
+
+    def __init__(
+        self,
+        APP_TOKEN,
+        USER_TOKEN,
+        url: str = PUSHOVER_URL,
+        timeout: float = 10,
+        window: float = 300,
+        max_queued: int = 100,
+        retries: int = 3,
+        retry_delay: float = 1,
+        state_path: str | None = None,
+    ):
         self.APP_TOKEN = APP_TOKEN
         self.USER_TOKEN = USER_TOKEN
+        self.URL = url
+        self.TIMEOUT = timeout
+        self.WINDOW = window
+        self.RETRIES = retries
+        self.RETRY_DELAY = retry_delay
+        self.STATE_PATH = state_path
         self.SESSION = Session()
         self.SESSION.headers.update(
             {"Content-type": "application/x-www-form-urlencoded"}
         )
+        self.DROPPED = 0
+        self._queue = queue.Queue(max_queued)
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._sender = None
+        if state_path:
+            self._load_windows()
 
     def send_message(self, message):
         try:
             """Sends a pushover notification."""
-            response = self.SESSION.post(
-                "https://api.pushover.net/1/messages.json",
-                data={
-                    "token": self.APP_TOKEN,
-                    "user": self.USER_TOKEN,
-                    "message": message,
-                },
-            )
-            return response
+            return self._post(message)
         except Exception as error:
             LOGGER.exception(error)
             return None
+
+    def notify(self, message) -> None:
+        """Queues a notification for the background sender without waiting on it."""
+        key = _VARYING_PARTS.sub("#", message)
+        now = time.time()
+        with self._lock:
+            window = self._windows.get(key)
+            if window and now - window["started_at"] < self.WINDOW:
+                window["repeats"] += 1
+                return
+            self._windows[key] = {"message": message, "started_at": now, "repeats": 0}
+            if window:
+                self._enqueue_summary(window)
+            self._start_sender()
+        self._enqueue(message)
+
+    def close(self, timeout: float = 10) -> None:
+        """Sends what is queued, waiting up to timeout seconds, and saves or summarises open windows."""
+        if self.STATE_PATH:
+            self._close_expired_windows()
+            self._save_windows()
+        with self._lock:
+            windows, self._windows = list(self._windows.values()), {}
+            if not self.STATE_PATH:
+                for window in windows:
+                    self._enqueue_summary(window)
+            sender = self._sender
+        if sender:
+            self._enqueue(None)
+            sender.join(timeout)
+            with self._lock:
+                self._sender = None
+
+    def _post(self, message):
+        return self.SESSION.post(
+            self.URL,
+            data={
+                "token": self.APP_TOKEN,
+                "user": self.USER_TOKEN,
+                "message": message,
+            },
+            timeout=self.TIMEOUT,
+        )
+
+    def _start_sender(self) -> None:
+        if self._sender is None:
+            self._sender = threading.Thread(
+                target=self._send_queued, name="pushover", daemon=True
+            )
+            self._sender.start()
+            atexit.register(self.close)
+
+    def _enqueue(self, message) -> None:
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.DROPPED += 1
+            LOGGER.warning("Pushover queue full, dropped notification: %s", message)
+
+    def _enqueue_summary(self, window: dict) -> None:
+        if window["repeats"]:
+            self._enqueue(
+                f"{window['message']} (x{window['repeats']} more in the last {self.WINDOW / 60:g} min)"
+            )
+
+    def _send_queued(self) -> None:
+        while True:
+            try:
+                message = self._queue.get(timeout=min(max(self.WINDOW, 1), 60))
+            except queue.Empty:
+                message = False
+            if message is None:
+                return
+            if message:
+                self._send_with_retries(message)
+            self._close_expired_windows()
+
+    def _send_with_retries(self, message) -> None:
+        for attempt in range(self.RETRIES + 1):
+            try:
+                response = self._post(message)
+                if response.status_code < 500 and response.status_code != 429:
+                    return
+                LOGGER.warning("Pushover returned %s", response.status_code)
+            except Exception as error:
+                LOGGER.warning("Pushover request failed: %s", error)
+            if attempt < self.RETRIES:
+                time.sleep(self.RETRY_DELAY * 2**attempt)
+        LOGGER.error("Gave up sending pushover notification: %s", message)
+
+    def _load_windows(self) -> None:
+        try:
+            with open(self.STATE_PATH, "r", encoding="utf-8") as file:
+                self._windows = json.load(file)
+        except (OSError, ValueError):
+            return
+        if self._windows:
+            # summaries of windows left open by the previous run still need sending
+            self._start_sender()
+
+    def _save_windows(self) -> None:
+        with self._lock:
+            windows = dict(self._windows)
+        try:
+            with open(self.STATE_PATH, "w", encoding="utf-8") as file:
+                json.dump(windows, file)
+        except OSError as error:
+            LOGGER.warning("Couldn't save pushover state: %s", error)
+
+    def _close_expired_windows(self) -> None:
+        now = time.time()
+        with self._lock:
+            for key, window in list(self._windows.items()):
+                if now - window["started_at"] >= self.WINDOW:
+                    del self._windows[key]
+                    self._enqueue_summary(window)
@@ -1,82 +1,474 @@
+import os
 import prawcore
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from praw import models
+from api_scheduler import priority, HOUSEKEEPING
 from helpers import sint
 from logger import LOGGER
+from flair_ledger import open_flair_ledger
+from flair_queue import FlairWriteQueue
+from flair_ladder import FlairLadder
+from catchup_checkpoint import open_catchup_checkpoint
+from confirmation_parser import ConfirmationParser
+from journal import open_journal
+from moderator_cache import ModeratorCache
+from settings_snapshot import open_settings_snapshot
+
+WIKI_TEMPLATES = [
+    "outage_recovery",
+    "confirmation_regex_pattern",
+    "flair_regex",
+    "ranged_flair_template_regex",
+    "special_flair_template_regex",
+    "confirmation_message",
+    "user_doesnt_exist",
+    "cant_update_yourself",
+    "flair_update_failed",
+]
 
 
 class Settings:
-    _instance = None
+    """Per subreddit settings. Creating Settings twice for the same subreddit returns the same instance."""
+
+    _instances = {}
 
     def __new__(cls, bot, subreddit_name):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._load_settings(bot, subreddit_name)
-        return cls._instance
+        key = subreddit_name.lower()
+        if key not in cls._instances:
+            instance = super().__new__(cls)
+            instance.FLAIR_LEDGER = open_flair_ledger()
+            instance.CATCHUP_CHECKPOINT = open_catchup_checkpoint()
+            instance.JOURNAL = open_journal()
+            instance.SNAPSHOT = open_settings_snapshot()
+            # the same cache object lives across reloads, so mod log updates always reach it
+            instance.CURRENT_MODS = ModeratorCache()
+            # the wiki poller and the reload command can ask for a reload at the same time
+            instance._reload_lock = threading.Lock()
+            # with FAST_START the last good settings are used right away and checked against Reddit after
+            fast_start = sint(os.getenv("FAST_START", ""), 0)
+            instance.FROM_SNAPSHOT = bool(
+                fast_start and instance._load_snapshot(bot, subreddit_name)
+            )
+            if not instance.FROM_SNAPSHOT:
+                instance._load_settings(bot, subreddit_name)
+            instance.FLAIR_WRITE_QUEUE = instance._open_flair_write_queue()
+            cls._instances[key] = instance
+        return cls._instances[key]
 
-    def reload(self, bot, subreddit_name):
-        self._load_settings(bot, subreddit_name)
+    def reload(self, bot, subreddit_name, include_flair_templates=True) -> list[str]:
+        """Reloads only what changed since settings were last loaded.
+
+        Wiki pages are only re-downloaded when their latest revision differs
+        from the one loaded, and flair templates are compared by id so the
+        css_class fix-ups only run for new or edited templates. Returns a
+        description of every change, empty when nothing changed. Without
+        access to the wiki's revision history every page is re-read instead.
+        Reloads run one at a time.
+        """
+        with self._reload_lock:
+            return self._reload(bot, subreddit_name, include_flair_templates)
+
+    def _reload(self, bot, subreddit_name, include_flair_templates) -> list[str]:
+        started_at = time.perf_counter()
+        subreddit = self.SUBREDDIT
+        latest_revisions = self._timed_fetch(
+            "wiki revisions", self._fetch_wiki_revisions, subreddit
+        )
+        if latest_revisions is None:
+            pages_to_fetch = WIKI_TEMPLATES
+        else:
+            pages_to_fetch = [
+                template
+                for template in WIKI_TEMPLATES
+                if template in latest_revisions
+                and latest_revisions[template] != self._wiki_pages[template][1]
+            ]
+        with ThreadPoolExecutor(max_workers=self._load_workers()) as executor:
+            fetched_pages = {
+                template: executor.submit(
+                    self._timed_fetch,
+                    template,
+                    self._fetch_template_revision,
+                    subreddit,
+                    template,
+                )
+                for template in pages_to_fetch
+            }
+            if include_flair_templates:
+                flair_templates = executor.submit(
+                    self._timed_fetch,
+                    "flair templates",
+                    self._fetch_flair_templates,
+                    subreddit,
+                )
+                moderators = executor.submit(
+                    self._timed_fetch, "moderators", self._fetch_moderators, subreddit
+                )
+            fetched_pages = {
+                template: page.result() for template, page in fetched_pages.items()
+            }
+        changed_pages = [
+            template
+            for template, page in fetched_pages.items()
+            if page != self._wiki_pages[template]
+        ]
+        pages = dict(self._wiki_pages)
+        pages.update({template: fetched_pages[template] for template in changed_pages})
+
+        changes = [
+            f"Updated wiki page confirmation-bot/{page}" for page in changed_pages
+        ]
+        changed_template_ids = set()
+        if include_flair_templates:
+            flair_templates = flair_templates.result()
+            old_templates = {
+                template["id"]: template for template in self._flair_templates
+            }
+            new_templates = {template["id"]: template for template in flair_templates}
+            added = new_templates.keys() - old_templates.keys()
+            removed = old_templates.keys() - new_templates.keys()
+            edited = {
+                template_id
+                for template_id in new_templates.keys() & old_templates.keys()
+                if new_templates[template_id] != old_templates[template_id]
+            }
+            changed_template_ids = added | edited
+            if added or removed or edited:
+                changes.append(
+                    f"Flair templates: {len(added)} added, {len(edited)} edited, {len(removed)} removed"
+                )
+
+            moderators = moderators.result()
+            for mod in sorted(moderators - self.CURRENT_MODS):
+                changes.append(f"Moderator added: u/{mod}")
+            for mod in sorted(self.CURRENT_MODS - moderators):
+                changes.append(f"Moderator removed: u/{mod}")
+        else:
+            flair_templates, moderators = self._flair_templates, self.CURRENT_MODS
+        if {"ranged_flair_template_regex", "special_flair_template_regex"} & set(
+            changed_pages
+        ):
+            # every template may sort differently under new patterns
+            changed_template_ids = None
+
+        if changes:
+            self._apply_settings(
+                self.ME,
+                subreddit_name,
+                subreddit,
+                pages,
+                flair_templates,
+                moderators,
+                changed_template_ids,
+            )
+            self._save_snapshot()
+            if self.CONFIRMATION_PATTERN.REJECTED:
+                changes.append(
+                    "Rejected confirmation-bot/confirmation_regex_pattern, using the default pattern: "
+                    + self.CONFIRMATION_PATTERN.REJECTED
+                )
+        LOGGER.info(
+            "Reloaded settings for r/%s in %.2fs: %s",
+            subreddit_name,
+            time.perf_counter() - started_at,
+            "; ".join(changes) or "no changes",
+        )
+        return changes
 
     def _load_settings(self, bot, subreddit_name):
-        self.ME = bot.user.me()
-        self.BOT_NAME = self.ME.name
-        self.ID = self.ME.id
-        self.FULLNAME = self.ME.fullname
-        self.SUBREDDIT_NAME = subreddit_name
-        self.SUBREDDIT = bot.subreddit(subreddit_name)
-        self.OUTAGE_MESSAGE = self.load_template("outage_recovery")
-        self.CONFIRMATION_PATTERN = re.compile(
-            self.load_template("confirmation_regex_pattern")
+        """Fetches every wiki page, the flair templates and the moderators concurrently."""
+        started_at = time.perf_counter()
+        # fetched first and on its own so the OAuth token is only requested once
+        me = bot.user.me()
+        subreddit = bot.subreddit(subreddit_name)
+        with ThreadPoolExecutor(max_workers=self._load_workers()) as executor:
+            pages = {
+                template: executor.submit(
+                    self._timed_fetch,
+                    template,
+                    self._fetch_template_revision,
+                    subreddit,
+                    template,
+                )
+                for template in WIKI_TEMPLATES
+            }
+            flair_templates = executor.submit(
+                self._timed_fetch,
+                "flair templates",
+                self._fetch_flair_templates,
+                subreddit,
+            )
+            moderators = executor.submit(
+                self._timed_fetch, "moderators", self._fetch_moderators, subreddit
+            )
+            pages = {template: page.result() for template, page in pages.items()}
+            flair_templates = flair_templates.result()
+            moderators = moderators.result()
+
+        self._apply_settings(
+            me, subreddit_name, subreddit, pages, flair_templates, moderators
         )
-        self.FLAIR_PATTERN = re.compile(self.load_template("flair_regex"))
-        self.FLAIR_TEMPLATE_PATTERN = re.compile(
-            self.load_template("ranged_flair_template_regex")
+        self._save_snapshot()
+        LOGGER.info(
+            "Loaded settings for r/%s in %.2fs",
+            subreddit_name,
+            time.perf_counter() - started_at,
         )
-        self.SPECIAL_FLAIR_TEMPLATE_PATTERN = re.compile(
-            self.load_template("special_flair_template_regex")
+
+    def _load_snapshot(self, bot, subreddit_name) -> bool:
+        """Applies the settings saved by the last load, returning False when there are none to use."""
+        started_at = time.perf_counter()
+        snapshot = self.SNAPSHOT.get(subreddit_name)
+        if not snapshot:
+            return False
+        pages = {template: tuple(page) for template, page in snapshot["pages"].items()}
+        if set(WIKI_TEMPLATES) - pages.keys():
+            # saved by a version of the bot that read fewer wiki pages
+            return False
+        self._apply_settings(
+            models.Redditor(bot, _data=snapshot["me"]),
+            subreddit_name,
+            bot.subreddit(subreddit_name),
+            pages,
+            snapshot["flair_templates"],
+            set(snapshot["moderators"]),
+            # the css_class fix-ups were made when the snapshot was taken
+            changed_template_ids=set(),
         )
-        self.CONFIRMATION_TEMPLATE = self.load_template("confirmation_message")
-        self.USER_DOESNT_EXIST = self.load_template("user_doesnt_exist")
-        self.CANT_UPDATE_YOURSELF = self.load_template("cant_update_yourself")
-        self.FLAIR_UPDATE_FAILED = self.load_template("flair_update_failed")
-        self.FLAIR_TEMPLATES, self.SPECIAL_FLAIR_TEMPLATES = (
-            self._load_flair_templates()
+        LOGGER.info(
+            "Loaded settings for r/%s from the snapshot in %.3fs",
+            subreddit_name,
+            time.perf_counter() - started_at,
         )
-        self.CURRENT_MODS = [str(mod) for mod in self.SUBREDDIT.moderator()]
+        return True
+
+    def start_revalidation(self, bot, after_reload=None) -> None:
+        """Reloads whatever changed on Reddit since the snapshot, in a background thread.
+
+        Does nothing unless the settings came from the snapshot. Started by
+        the bot once it is running rather than when the settings are built, so
+        shard processes forked in between don't inherit the thread.
+        after_reload() is called when something changed.
+        """
+        if not self.FROM_SNAPSHOT:
+            return
+
+        def revalidate():
+            try:
+                changes = self.reload(bot, self.SUBREDDIT_NAME)
+                if changes and after_reload:
+                    after_reload()
+            except Exception as ex:
+                LOGGER.exception(ex)
+
+        threading.Thread(target=revalidate, daemon=True).start()
+
+    def _save_snapshot(self) -> None:
+        try:
+            self.SNAPSHOT.save(
+                self.SUBREDDIT_NAME,
+                {"name": self.BOT_NAME, "id": self.ID},
+                self._wiki_pages,
+                self._flair_templates,
+                self.CURRENT_MODS,
+            )
+        except Exception as ex:
+            # only costs the next fast start
+            LOGGER.warning("Couldn't save the settings snapshot: %s", ex)
+
+    def _apply_settings(
+        self,
+        me,
+        subreddit_name,
+        subreddit,
+        pages,
+        flair_templates,
+        moderators,
+        changed_template_ids=None,
+    ):
+        """Builds the settings from fetched data and swaps them in with a single update.
+
+        Nothing is assigned until everything has been built, so a failed
+        reload leaves the previous settings in place.
+        """
+        flair_template_pattern = re.compile(pages["ranged_flair_template_regex"][0])
+        special_flair_template_pattern = re.compile(
+            pages["special_flair_template_regex"][0]
+        )
+        ranged_templates, special_templates, ranged_list = self._load_flair_templates(
+            subreddit,
+            # copied since loading strips the range prefix from the template text
+            [dict(template) for template in flair_templates],
+            flair_template_pattern,
+            special_flair_template_pattern,
+            changed_template_ids,
+        )
+        self.CURRENT_MODS.replace(moderators)
+        self.__dict__.update(
+            {
+                "ME": me,
+                "BOT_NAME": me.name,
+                "ID": me.id,
+                "FULLNAME": me.fullname,
+                "SUBREDDIT_NAME": subreddit_name,
+                "SUBREDDIT": subreddit,
+                "OUTAGE_MESSAGE": pages["outage_recovery"][0],
+                "CONFIRMATION_PATTERN": ConfirmationParser(
+                    pages["confirmation_regex_pattern"][0]
+                ),
+                "FLAIR_PATTERN": re.compile(pages["flair_regex"][0]),
+                "FLAIR_TEMPLATE_PATTERN": flair_template_pattern,
+                "SPECIAL_FLAIR_TEMPLATE_PATTERN": special_flair_template_pattern,
+                "CONFIRMATION_TEMPLATE": pages["confirmation_message"][0],
+                "USER_DOESNT_EXIST": pages["user_doesnt_exist"][0],
+                "CANT_UPDATE_YOURSELF": pages["cant_update_yourself"][0],
+                "FLAIR_UPDATE_FAILED": pages["flair_update_failed"][0],
+                "FLAIR_TEMPLATES": ranged_templates,
+                "SPECIAL_FLAIR_TEMPLATES": special_templates,
+                "FLAIR_LADDER": FlairLadder(ranged_list),
+                "_wiki_pages": pages,
+                "_flair_templates": flair_templates,
+            }
+        )
+
+    def start_polling(self, bot, interval: int) -> None:
+        """Checks the wiki for edits every interval seconds in a background thread."""
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload(bot, self.SUBREDDIT_NAME, include_flair_templates=False)
+                except Exception as ex:
+                    LOGGER.exception(ex)
+
+        threading.Thread(target=poll, daemon=True).start()
+
+    def start_moderator_resync(self, interval: int) -> None:
+        """Re-reads the moderator list every interval seconds, in case the mod log stream missed a change."""
+
+        def resync():
+            while True:
+                time.sleep(interval)
+                try:
+                    with priority(HOUSEKEEPING):
+                        moderators = self._fetch_moderators(self.SUBREDDIT)
+                    added, removed = self.CURRENT_MODS.replace(moderators)
+                    if added or removed:
+                        LOGGER.info(
+                            "Moderator resync for r/%s added %s and removed %s",
+                            self.SUBREDDIT_NAME,
+                            sorted(added),
+                            sorted(removed),
+                        )
+                except Exception as ex:
+                    LOGGER.exception(ex)
+
+        threading.Thread(target=resync, daemon=True).start()
+
+    @staticmethod
+    def _load_workers() -> int:
+        return sint(os.getenv("SETTINGS_LOAD_WORKERS", ""), 12)
+
+    @staticmethod
+    def _timed_fetch(name, fetch, *args):
+        started_at = time.perf_counter()
+        result = fetch(*args)
+        LOGGER.info("Fetched %s in %.2fs", name, time.perf_counter() - started_at)
+        return result
+
+    @staticmethod
+    def _fetch_flair_templates(subreddit) -> list[dict]:
+        return list(subreddit.flair.templates)
+
+    @staticmethod
+    def _fetch_moderators(subreddit) -> set[str]:
+        return {str(mod).lower() for mod in subreddit.moderator()}
+
+    @staticmethod
+    def _fetch_wiki_revisions(subreddit) -> dict[str, str] | None:
+        """Returns the latest revision id of each recently edited bot wiki page, in one request.
+
+        Returns None when the account may not read the revision history,
+        which takes the wiki mod permission.
+        """
+        latest_revisions = {}
+        try:
+            for revision in subreddit.wiki.revisions(limit=100):
+                page_name = revision["page"].name.lower()
+                if page_name.startswith("confirmation-bot/"):
+                    latest_revisions.setdefault(
+                        page_name.split("/", 1)[1], revision["id"]
+                    )
+        except (prawcore.exceptions.NotFound, prawcore.exceptions.Forbidden):
+            LOGGER.info("Can't read the wiki revision history, reloading every page")
+            return None
+        return latest_revisions
+
+    def _open_flair_write_queue(self) -> FlairWriteQueue | None:
+        """Batched flair writes are opt-in since the flair CSV endpoint can't assign a flair template id."""
+        try:
+            window = float(os.getenv("FLAIR_BATCH_WINDOW", "0"))
+        except ValueError:
+            window = 0
+        return FlairWriteQueue(self, window) if window > 0 else None
 
     def load_template(self, template):
         """Loads a template either from local file or Reddit Wiki, returned as a string."""
+        return self._fetch_template_revision(self.SUBREDDIT, template)[0]
+
+    @staticmethod
+    def _fetch_template_revision(subreddit, template) -> tuple[str, str | None]:
+        """Returns the template and its wiki revision id, which is None for the local fallback."""
         try:
-            wiki = self.SUBREDDIT.wiki[f"confirmation-bot/{template}"]
-            return wiki.content_md
+            wiki = subreddit.wiki[f"confirmation-bot/{template}"]
+            return (wiki.content_md, wiki.revision_id)
         except (prawcore.exceptions.NotFound, prawcore.exceptions.Forbidden):
             with open(f"src/mdtemplates/{template}.md", "r", encoding="utf-8") as file:
-                return file.read()
+                return (file.read(), None)
 
-    def _load_flair_templates(self):
-        """Loads flair templates from Reddit, returned as a list."""
-        templates = self.SUBREDDIT.flair.templates
+    def _load_flair_templates(
+        self,
+        subreddit,
+        templates,
+        flair_template_pattern,
+        special_flair_template_pattern,
+        changed_template_ids=None,
+    ):
+        """Sorts flair templates into ranged and non-ranged templates.
+
+        Ranged templates are returned both keyed by range and as a list, since
+        mod only and regular templates can share a range. When
+        changed_template_ids is given, only those templates get their
+        css_class fixed up.
+        """
         flair_templates = {}
         special_templates = {}
+        ranged_templates = []
 
         for template in templates:
-            match = self.FLAIR_TEMPLATE_PATTERN.search(template["text"])
+            match = flair_template_pattern.search(template["text"])
             if match:
                 template["text"] = template["text"].replace(match.group(1), "")
-                flair_templates[(sint(match.group(2), 0), sint(match.group(3), 0))] = (
-                    template
-                )
+                min_count, max_count = sint(match.group(2), 0), sint(match.group(3), 0)
+                flair_templates[(min_count, max_count)] = template
+                ranged_templates.append((min_count, max_count, template))
                 LOGGER.info(
                     f"Loaded flair template with range {match.group(2)} to {match.group(3)}: {template['text']}"
                 )
             else:
-                special_match = self.SPECIAL_FLAIR_TEMPLATE_PATTERN.search(
-                    template["text"]
-                )
+                special_match = special_flair_template_pattern.search(template["text"])
                 if special_match:
-                    if template["css_class"] != template["id"]:
-                        self.SUBREDDIT.flair.templates.update(
+                    if template["css_class"] != template["id"] and (
+                        changed_template_ids is None
+                        or template["id"] in changed_template_ids
+                    ):
+                        subreddit.flair.templates.update(
                             template["id"], css_class=template["id"]
                         )
                     special_templates[template["id"]] = template
                     LOGGER.info(f"Loaded non-ranged flair template: {template['text']}")
-        return (flair_templates, special_templates)
+        return (flair_templates, special_templates, ranged_templates)
@@ -0,0 +1,58 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SettingsSnapshot:
+    """The last settings loaded from Reddit for each subreddit, so a restart can start from them.
+
+    Holds what Settings is built from: the bot account, the wiki pages with
+    their revision ids, the flair templates and the moderators.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS settings_snapshot (
+                subreddit TEXT PRIMARY KEY,
+                saved_at REAL NOT NULL,
+                data TEXT NOT NULL
+            )""")
+        self._db.commit()
+
+    def get(self, subreddit_name: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM settings_snapshot WHERE subreddit = ?",
+                (subreddit_name.lower(),),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(
+        self,
+        subreddit_name: str,
+        me: dict,
+        pages: dict[str, tuple[str, str | None]],
+        flair_templates: list[dict],
+        moderators: set[str],
+    ) -> None:
+        data = json.dumps(
+            {
+                "me": me,
+                "pages": pages,
+                "flair_templates": flair_templates,
+                "moderators": sorted(moderators),
+            }
+        )
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO settings_snapshot VALUES (?, ?, ?)",
+                (subreddit_name.lower(), time.time(), data),
+            )
+            self._db.commit()
+
+
+def open_settings_snapshot() -> SettingsSnapshot:
+    return SettingsSnapshot(os.getenv("BOT_STATE_DB", "bot_state.db"))
@@ -0,0 +1,253 @@
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import zlib
+from collections import deque
+from logger import LOGGER, stop_listeners, use_own_log_file
+
+# seconds the supervisor waits before replacing a worker that died
+RESPAWN_DELAY = 1
+# stands in for a job id on the results queue when a worker has died
+_WORKER_DIED = "worker-died"
+
+
+def shard_for(name: str, shards: int) -> int:
+    """Stable shard index for a username, the same in every process and across restarts."""
+    return zlib.crc32(name.lower().encode("utf-8")) % shards
+
+
+def _run_shard(shard_factory, index: int, inbox, results) -> None:
+    """Worker process loop: handles the messages of one shard, one at a time and in order."""
+    shard = shard_factory(index)
+    while True:
+        message = inbox.get()
+        if message is None:
+            if hasattr(shard, "close"):
+                shard.close()
+            return
+        command, job_id, args = message
+        try:
+            result = getattr(shard, command)(*args)
+        except Exception as ex:
+            LOGGER.exception(ex)
+            result = None
+        if job_id is not None:
+            results.put((job_id, index, result))
+
+
+def _fork_shard(shard_factory, index: int, inbox, results) -> int:
+    """Forks a worker process running _run_shard and returns its pid."""
+    pid = os.fork()
+    if pid:
+        return pid
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    use_own_log_file(f"shard{index}")
+    exit_code = 1
+    try:
+        _run_shard(shard_factory, index, inbox, results)
+        exit_code = 0
+    except BaseException as ex:
+        LOGGER.exception(ex)
+    finally:
+        # os._exit skips atexit, so queued results and log records are written out here
+        results.close()
+        results.join_thread()
+        stop_listeners()
+        os._exit(exit_code)
+
+
+def _run_supervisor(shard_factory, inboxes, results, deaths) -> None:
+    """Parent of every shard worker: starts them and replaces any that dies.
+
+    Runs in a process forked before the bot starts its other threads, so
+    replacement workers are forked from a process where no other thread can
+    be holding a lock. Each death is reported on deaths as (index, exit code).
+    A worker only exits with 0 when the pool stops it.
+    """
+    workers = {
+        _fork_shard(shard_factory, index, inbox, results): index
+        for index, inbox in enumerate(inboxes)
+    }
+
+    def stop_workers(signum, frame):
+        # the pool's process is exiting without stop(), take the workers down with this one
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    try:
+        while workers:
+            pid, status = os.waitpid(-1, 0)
+            index = workers.pop(pid, None)
+            exit_code = os.waitstatus_to_exitcode(status)
+            if index is None or exit_code == 0:
+                continue
+            # logged by the pool's process, which owns the log file
+            deaths.put((index, exit_code))
+            # a worker that fails on start up isn't restarted in a tight loop
+            time.sleep(RESPAWN_DELAY)
+            workers[_fork_shard(shard_factory, index, inboxes[index], results)] = index
+    finally:
+        stop_listeners()
+
+
+class ShardPool:
+    """Spreads confirmations over worker processes by mentioned username.
+
+    shard_factory(index) runs once in each worker process and returns the
+    object that handles that shard's work, so each worker can hold its own
+    Reddit session and flair state. Every username always maps to the same
+    worker and each worker handles its inbox in order, so a user's flair is
+    never read and written by two processes at once. submit() splits a
+    comment's confirmations by shard and calls back with the combined
+    results once every shard involved has answered.
+
+    Workers are forked rather than spawned so they don't re-run main.py's
+    start up (secrets, Reddit login, settings load) before building their own.
+    They are forked by a supervisor process, itself forked when the pool is
+    created, which replaces a worker that dies. The job the dead worker was
+    handling gets None from that shard, and the jobs still in its inbox go
+    to the new worker.
+    """
+
+    def __init__(self, shards: int, shard_factory, max_queued: int = 100):
+        self.SHARDS = shards
+        context = multiprocessing.get_context("fork")
+        self._inboxes = [context.Queue(max_queued) for _ in range(shards)]
+        self._results = context.Queue()
+        deaths = context.SimpleQueue()
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending = {}
+        # job ids sent to each shard and not answered yet, oldest first
+        self._unanswered = [deque() for _ in range(shards)]
+        self._submitted = [0] * shards
+        self._completed = 0
+        self._failed = 0
+        self._respawned = 0
+        self._supervisor = context.Process(
+            target=_run_supervisor,
+            args=(shard_factory, self._inboxes, self._results, deaths),
+            name="shard-supervisor",
+            daemon=True,
+        )
+        self._supervisor.start()
+        threading.Thread(
+            target=self._collect, name="shard-results", daemon=True
+        ).start()
+        threading.Thread(
+            target=self._watch_deaths, args=(deaths,), name="shard-deaths", daemon=True
+        ).start()
+
+    def submit(self, names: list[str], args_for_shard, callback) -> None:
+        """Sends the work for names to their shards.
+
+        args_for_shard(indexes) returns the arguments of the shard's confirm()
+        call for the positions in names it owns. callback receives a list with
+        one result per shard involved, in shard order, once all have answered.
+        A shard that failed or died on the job gives None.
+        """
+        by_shard = {}
+        for position, name in enumerate(names):
+            by_shard.setdefault(shard_for(name, self.SHARDS), []).append(position)
+        job_id = next(self._ids)
+        with self._lock:
+            self._pending[job_id] = (set(by_shard), {}, callback, time.monotonic())
+            for index in by_shard:
+                self._unanswered[index].append(job_id)
+        if not by_shard:
+            self._finish(job_id)
+            return
+        for index, positions in sorted(by_shard.items()):
+            self._submitted[index] += 1
+            # blocks while the shard is backed up, which slows the stream down
+            self._inboxes[index].put(("confirm", job_id, args_for_shard(positions)))
+
+    def broadcast(self, command: str, *args) -> None:
+        """Runs command(*args) on every shard, e.g. to reload settings."""
+        for inbox in self._inboxes:
+            inbox.put((command, None, args))
+
+    def stop(self, timeout: float = 30) -> None:
+        """Lets every shard finish its queued work, then stops the worker processes."""
+        for inbox in self._inboxes:
+            inbox.put(None)
+        # the supervisor exits once every worker has
+        self._supervisor.join(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "shards": self.SHARDS,
+                "submitted": list(self._submitted),
+                "pending": len(self._pending),
+                "completed": self._completed,
+                "failed": self._failed,
+                "respawned": self._respawned,
+            }
+
+    def _collect(self) -> None:
+        while True:
+            try:
+                job_id, index, result = self._results.get()
+            except EOFError:
+                # every process that could send a result has exited
+                return
+            if job_id == _WORKER_DIED:
+                self._fail_oldest(index)
+            else:
+                self._answer(job_id, index, result)
+
+    def _watch_deaths(self, deaths) -> None:
+        while True:
+            index, exit_code = deaths.get()
+            LOGGER.error(
+                "Shard %s exited with code %s, starting a new worker", index, exit_code
+            )
+            # through the results queue, so whatever the worker sent before dying is read first
+            self._results.put((_WORKER_DIED, index, exit_code))
+
+    def _answer(self, job_id, index: int, result) -> None:
+        with self._lock:
+            if job_id in self._unanswered[index]:
+                self._unanswered[index].remove(job_id)
+            if job_id not in self._pending:
+                # the shard answered after it was given up on
+                return
+            waiting_on, results, _, _ = self._pending[job_id]
+            waiting_on.discard(index)
+            results[index] = result
+            done = not waiting_on
+        if done:
+            self._finish(job_id)
+
+    def _fail_oldest(self, index: int) -> None:
+        """Gives up on the job a dead worker was handling."""
+        with self._lock:
+            self._respawned += 1
+            # a shard handles its inbox in order, so the oldest unanswered job is the one it died on
+            job_id = self._unanswered[index][0] if self._unanswered[index] else None
+            if job_id is not None:
+                self._failed += 1
+        if job_id is not None:
+            LOGGER.error("Shard %s gave no result for job %s", index, job_id)
+            self._answer(job_id, index, None)
+
+    def _finish(self, job_id) -> None:
+        with self._lock:
+            _, results, callback, submitted_at = self._pending.pop(job_id)
+            self._completed += 1
+        try:
+            callback([results[index] for index in sorted(results)])
+        except Exception as ex:
+            LOGGER.exception(ex)
+        LOGGER.debug(
+            "Shard job %s finished in %.2fs", job_id, time.monotonic() - submitted_at
+        )
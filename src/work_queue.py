@@ -0,0 +1,104 @@
+import itertools
+import threading
+import time
+from collections import deque, OrderedDict
+from logger import LOGGER
+
+
+class KeyedWorkQueue:
+    """Bounded work queue processed by a pool of worker threads.
+
+    Every item carries a set of keys, e.g. the users a comment mentions. An
+    item only starts once it is the oldest queued item for each of its keys,
+    so items sharing a key never run concurrently or out of order, while
+    unrelated items run in parallel. put() blocks while the queue is full,
+    which slows the stream down instead of dropping work.
+    """
+
+    def __init__(self, workers: int, max_size: int):
+        self.MAX_SIZE = max_size
+        self._condition = threading.Condition()
+        self._ids = itertools.count()
+        self._queued = OrderedDict()
+        self._key_queues = {}
+        self._running = 0
+        self._processed = 0
+        self._failed = 0
+        self._overflows = 0
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+        for index in range(workers):
+            threading.Thread(
+                target=self._work, name=f"worker-{index}", daemon=True
+            ).start()
+
+    def put(self, keys, func, *args, **kwargs) -> None:
+        """Queues func(*args, **kwargs), waiting for room when the queue is full."""
+        with self._condition:
+            if len(self._queued) >= self.MAX_SIZE:
+                self._overflows += 1
+                LOGGER.warning("Work queue full, waiting for workers: %s", self.stats())
+            while len(self._queued) >= self.MAX_SIZE:
+                self._condition.wait()
+            item_id = next(self._ids)
+            keys = frozenset(keys)
+            self._queued[item_id] = (keys, func, args, kwargs, time.monotonic())
+            for key in keys:
+                self._key_queues.setdefault(key, deque()).append(item_id)
+            self._condition.notify_all()
+
+    def join(self) -> None:
+        """Waits until every queued item has been processed."""
+        with self._condition:
+            while self._queued or self._running:
+                self._condition.wait()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "queued": len(self._queued),
+                "running": self._running,
+                "processed": self._processed,
+                "failed": self._failed,
+                "overflows": self._overflows,
+                "last_lag_seconds": self._last_lag,
+                "max_lag_seconds": self._max_lag,
+            }
+
+    def _next_ready(self):
+        for item_id, item in self._queued.items():
+            if all(self._key_queues[key][0] == item_id for key in item[0]):
+                del self._queued[item_id]
+                return item_id, item
+        return None, None
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                item_id, item = self._next_ready()
+                while item is None:
+                    self._condition.wait()
+                    item_id, item = self._next_ready()
+                self._running += 1
+                self._condition.notify_all()
+
+            keys, func, args, kwargs, queued_at = item
+            failed = False
+            try:
+                func(*args, **kwargs)
+            except Exception as ex:
+                failed = True
+                LOGGER.exception(ex)
+
+            with self._condition:
+                for key in keys:
+                    key_queue = self._key_queues[key]
+                    key_queue.popleft()
+                    if not key_queue:
+                        del self._key_queues[key]
+                self._running -= 1
+                self._processed += 1
+                self._failed += failed
+                self._last_lag = time.monotonic() - queued_at
+                self._max_lag = max(self._max_lag, self._last_lag)
+                self._condition.notify_all()
@@ -3,13 +3,20 @@ import pytest
 import praw_bot_wrapper
 import os
 import base64
+import tempfile
 import urllib
 from praw import Reddit
 from betamax import Betamax
 from betamax_helpers import sanitize_cassette
 
 sys.path.append("src")
+os.environ.setdefault("BOT_STATE_DB", ":memory:")
+os.environ.setdefault(
+    "JOURNAL_PATH", os.path.join(tempfile.mkdtemp(), "bot_journal.jsonl")
+)
 from settings import Settings
+from flair_ledger import FlairLedger
+from catchup_checkpoint import CatchupCheckpoint
 from helpers import load_secrets
 
 SUBREDDIT_NAME = os.environ["SUBREDDIT_NAME"]
@@ -59,6 +66,22 @@ with RECORDER.use_cassette("load_settings"):
     SETTINGS = Settings(BOT, SUBREDDIT_NAME)
 
 
+@pytest.fixture(autouse=True)
+def flair_ledger(monkeypatch) -> FlairLedger:
+    # every test starts from an empty ledger, so flair written by one isn't read back by another
+    ledger = FlairLedger(":memory:", SETTINGS.FLAIR_LEDGER.MAX_AGE)
+    monkeypatch.setattr(SETTINGS, "FLAIR_LEDGER", ledger)
+    return ledger
+
+
+@pytest.fixture(autouse=True)
+def catchup_checkpoint(monkeypatch) -> CatchupCheckpoint:
+    # likewise for the catchup checkpoint, so whether catchup walks the thread doesn't depend on test order
+    checkpoint = CatchupCheckpoint(":memory:")
+    monkeypatch.setattr(SETTINGS, "CATCHUP_CHECKPOINT", checkpoint)
+    return checkpoint
+
+
 @pytest.fixture
 def settings() -> Settings:
     return SETTINGS
@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+from praw.models.util import stream_generator
+import adaptive_stream
+from adaptive_stream import AdaptiveStream
+
+
+class FakeListing:
+    """A Reddit listing, newest first, with the before and after cursors of the real one."""
+
+    def __init__(self):
+        self.items = []
+        self.requests = 0
+
+    def add(self, count: int) -> None:
+        start = len(self.items)
+        self.items += [
+            SimpleNamespace(fullname=f"t1_{index}")
+            for index in range(start, start + count)
+        ]
+
+    def __call__(self, limit, params):
+        self.requests += 1
+        names = [item.fullname for item in self.items]
+        if params.get("before"):
+            position = names.index(params["before"])
+            page = self.items[position + 1 : position + 1 + limit]
+        elif params.get("after"):
+            position = names.index(params["after"])
+            page = self.items[max(position - limit, 0) : position]
+        else:
+            page = self.items[-limit:]
+        return list(reversed(page))
+
+
+def names(items) -> list[str]:
+    return [item.fullname for item in items]
+
+
+def test_first_poll_matches_praw():
+    listing = FakeListing()
+    listing.add(30)
+    praw_stream = stream_generator(listing, pause_after=-1)
+    adaptive_stream = AdaptiveStream(listing, "comments")(pause_after=-1)
+
+    assert names(iter(praw_stream.__next__, None)) == names(
+        iter(adaptive_stream.__next__, None)
+    )
+
+
+def test_overflow_without_cursor_pages_back():
+    listing = FakeListing()
+    listing.add(50)
+    stream = AdaptiveStream(listing, "comments")
+    stream.poll()
+    assert stream.poll() == []
+
+    listing.add(250)
+    recovered = stream.poll()
+
+    assert names(recovered) == [f"t1_{index}" for index in range(50, 300)]
+    assert stream.interval == 0
+
+
+def test_burst_after_cursor_catches_up_in_order():
+    listing = FakeListing()
+    listing.add(10)
+    stream = AdaptiveStream(listing, "comments")
+    stream.poll()
+    listing.add(5)
+    assert len(stream.poll()) == 5
+
+    listing.add(150)
+    first, second = stream.poll(), stream.poll()
+
+    assert names(first + second) == [f"t1_{index}" for index in range(15, 165)]
+    # the full poll is followed by another right away, without paging back
+    assert listing.requests == 4
+
+
+def test_interval_follows_arrival_rate(monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(
+        adaptive_stream, "time", SimpleNamespace(monotonic=lambda: clock.now)
+    )
+    listing = FakeListing()
+    listing.add(10)
+    stream = AdaptiveStream(listing, "inbox", min_interval=1, max_interval=60)
+    stream.poll()
+    # 10 items a second, so a quarter of the listing arrives in 2.5 seconds
+    for _ in range(20):
+        clock.now += 1
+        listing.add(10)
+        stream.poll()
+    assert round(stream.interval, 1) == 2.5
+
+    intervals = []
+    for _ in range(15):
+        clock.now += stream.interval
+        stream.poll()
+        intervals.append(stream.interval)
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == 60
+
+
+def test_pause_after_yields_none_when_nothing_is_new():
+    listing = FakeListing()
+    listing.add(3)
+    stream = AdaptiveStream(listing, "comments", min_interval=0, max_interval=0)
+
+    generator = stream(pause_after=0, skip_existing=True)
+
+    assert next(generator) is None
+    listing.add(2)
+    assert names([next(generator), next(generator)]) == ["t1_3", "t1_4"]
@@ -0,0 +1,88 @@
+import copy
+import threading
+import time
+from praw import Reddit
+from api_scheduler import (
+    ApiScheduler,
+    DeferredBatch,
+    ScheduledRequestor,
+    CONFIRMATION,
+    CATCHUP,
+    HOUSEKEEPING,
+)
+
+
+def test_api_scheduler_unknown_budget():
+    scheduler = ApiScheduler()
+    assert scheduler.acquire(HOUSEKEEPING, timeout=0)
+
+
+def test_api_scheduler_keeps_reserve_for_confirmations():
+    scheduler = ApiScheduler()
+    scheduler.update({"x-ratelimit-remaining": "30", "x-ratelimit-reset": "60"})
+    assert not scheduler.acquire(HOUSEKEEPING, timeout=0.01)
+    assert scheduler.acquire(CATCHUP, timeout=0.01)
+    assert scheduler.acquire(CONFIRMATION, timeout=0.01)
+    stats = scheduler.stats()
+    assert stats["remaining"] == 28
+    assert stats["priorities"]["housekeeping"]["sent"] == 0
+    assert stats["priorities"]["confirmation"]["sent"] == 1
+
+
+def test_api_scheduler_waits_for_reset():
+    scheduler = ApiScheduler()
+    scheduler.update({"x-ratelimit-remaining": "0", "x-ratelimit-reset": "0.05"})
+    assert scheduler.acquire(HOUSEKEEPING, timeout=1)
+
+
+def test_scheduled_reddit_can_be_deep_copied():
+    scheduler = ApiScheduler()
+    bot = Reddit(
+        requestor_class=ScheduledRequestor,
+        requestor_kwargs={"scheduler": scheduler},
+        client_id="id",
+        client_secret="secret",
+        user_agent="test",
+    )
+    # praw deep copies listing parameters and form data, which can hold models
+    redditor = copy.deepcopy(bot.redditor("digitalmayhap"))
+    assert redditor._reddit._core._requestor.scheduler is scheduler
+
+
+def test_deferred_batch():
+    batches = []
+    flushed = threading.Event()
+
+    def flush(items):
+        batches.append(items)
+        flushed.set()
+
+    batch = DeferredBatch(flush, 2, 60)
+    batch.add("a")
+    assert batches == []
+    batch.add("b")
+    assert flushed.wait(1)
+    assert batches == [["a", "b"]]
+
+    flushed.clear()
+    batch = DeferredBatch(flush, 25, 0.01)
+    batch.add("c")
+    assert flushed.wait(1)
+    assert batches[-1] == ["c"]
+
+
+def test_deferred_batch_full_batch_doesnt_block_the_caller():
+    release = threading.Event()
+    flushed = threading.Event()
+
+    def flush(items):
+        # stands in for a mark read call waiting on the rate limit
+        release.wait(5)
+        flushed.set()
+
+    batch = DeferredBatch(flush, 1, 60)
+    started_at = time.monotonic()
+    batch.add("a")
+    assert time.monotonic() - started_at < 1
+    release.set()
+    assert flushed.wait(1)
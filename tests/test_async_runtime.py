@@ -0,0 +1,78 @@
+import asyncio
+import async_runtime
+from async_runtime import KeyedTasks, stream_items
+
+
+def test_keyed_tasks_keep_order_per_key_and_overlap_others():
+    async def run():
+        tasks = KeyedTasks(100)
+        events = []
+
+        async def handle(key, index):
+            events.append(("start", key, index))
+            await asyncio.sleep(0.01 * (3 - index % 3))
+            events.append(("end", key, index))
+
+        for index in range(9):
+            await tasks.submit({f"user{index % 3}"}, handle, f"user{index % 3}", index)
+        await tasks.join()
+        return events
+
+    events = asyncio.run(run())
+    for key in ["user0", "user1", "user2"]:
+        starts = [index for kind, k, index in events if kind == "start" and k == key]
+        assert starts == sorted(starts)
+    # the first comment of each user started before any had finished
+    assert [kind for kind, _, _ in events[:3]] == ["start"] * 3
+
+
+def test_keyed_tasks_bound_pending_work():
+    async def run():
+        tasks = KeyedTasks(2)
+        running = []
+        peak = 0
+
+        async def handle():
+            nonlocal peak
+            running.append(1)
+            peak = max(peak, len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        for index in range(6):
+            await tasks.submit({f"user{index}"}, handle)
+        await tasks.join()
+        return peak, tasks.FAILED
+
+    assert asyncio.run(run()) == (2, 0)
+
+
+def test_stream_items_recovers_after_errors(monkeypatch):
+    attempts = []
+    recovered = []
+
+    def stream_factory():
+        attempts.append(1)
+        if len(attempts) <= 2:
+            raise ConnectionError("reddit is down")
+        return iter(["comment1", "comment2", None])
+
+    async def on_recovered(started_at):
+        recovered.append(started_at)
+
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(async_runtime.asyncio, "sleep", no_sleep)
+
+    async def run():
+        items = []
+        async for item in stream_items(stream_factory, on_recovered, 2):
+            items.append(item)
+            if len(items) == 2:
+                break
+        return items
+
+    assert asyncio.run(run()) == ["comment1", "comment2"]
+    assert len(attempts) == 3
+    assert len(recovered) == 1
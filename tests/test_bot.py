@@ -1,12 +1,27 @@
+import asyncio
 import main
+from types import SimpleNamespace
 from helpers import load_secrets
 from settings import Settings
 from betamax import Betamax
 from betamax_helpers import use_recorder
 from pushover import Pushover
-from main import handle_catchup, _should_process_comment, handle_new_mail
+from main import (
+    handle_catchup,
+    _should_process_comment,
+    handle_new_mail,
+    _plan_confirmations,
+    _handle_catchup,
+    _recover_async,
+    _dispatch_comment,
+    _comment_keys,
+    _finish_sharded_confirmation,
+)
+from shard_pool import shard_for
+from async_runtime import KeyedTasks
 from praw import Reddit
 from datetime import datetime, timezone
+import time
 
 
 @use_recorder
@@ -24,8 +39,14 @@ def test_handle_catchup_with_outage(recorder: Betamax, settings: Settings, bot:
     pushover = Pushover(secrets["PUSHOVER_APP_TOKEN"], secrets["PUSHOVER_USER_TOKEN"])
     betamax = Betamax(pushover.SESSION)
     main.PUSHOVER = pushover
+    # catchup after an outage starts from the checkpoint, looking through the subreddit's comments first
+    settings.CATCHUP_CHECKPOINT.mark_processed(
+        settings.SUBREDDIT_NAME, "t3_1bpd27b", "kwv73qk", 1711577117.0
+    )
     with betamax.use_cassette("test_send_pushover_message_outage"):
         handle_catchup(datetime.now(timezone.utc))
+        # notifications are sent in the background, wait for them inside the cassette
+        pushover.close()
 
 
 @use_recorder
@@ -59,3 +80,183 @@ def test_monitor_mail_not_mod(recorder: Betamax, bot: Reddit):
     message = bot.inbox.message("27u1q5o")
     handle_new_mail(message)
     return
+
+
+def test_plan_confirmations():
+    planned = _plan_confirmations(
+        [
+            ("digitalmayhap", "1", "2"),
+            ("YarnSwapper", "0", "1"),
+            ("DigitalMayhap", "3", "x"),
+        ]
+    )
+    assert planned == [("digitalmayhap", 4, 2), ("YarnSwapper", 0, 1)]
+
+
+def test_recover_async_runs_one_catchup_per_outage(monkeypatch):
+    calls = []
+
+    def slow_catchup(started_at):
+        calls.append(started_at)
+        time.sleep(0.05)
+
+    monkeypatch.setattr(main, "handle_catchup", slow_catchup)
+    started_at = datetime.now(timezone.utc)
+
+    async def run():
+        # the comment, inbox and mod log streams all come back from the same outage
+        await asyncio.gather(*(_recover_async(started_at) for _ in range(3)))
+        await _recover_async(started_at)
+
+    asyncio.run(run())
+    assert calls == [started_at, started_at]
+
+
+def test_handle_catchup_finds_failed_comments_behind_processed_ones(
+    monkeypatch, settings: Settings
+):
+    comments = [
+        SimpleNamespace(
+            id=comment_id,
+            link_id="t3_abc",
+            created_utc=created_utc,
+            stickied=False,
+            saved=False,
+        )
+        for comment_id, created_utc in [
+            ("c4", 400.0),
+            ("c3", 300.0),
+            ("c2", 200.0),
+            ("c1", 100.0),
+        ]
+    ]
+    monkeypatch.setattr(main, "iter_root_comments", lambda submission, sort: comments)
+    checkpoint = settings.CATCHUP_CHECKPOINT
+    checkpoint.mark_processed(settings.SUBREDDIT_NAME, "t3_abc", "c1", 100.0)
+    checkpoint.mark_processed(settings.SUBREDDIT_NAME, "t3_abc", "c2", 200.0)
+    # c3 failed during an outage and is still in flight, c4 was processed after it
+    checkpoint.start("t3_abc", "c3", 300.0)
+    checkpoint.abandon("t3_abc", "c3")
+    checkpoint.mark_processed(settings.SUBREDDIT_NAME, "t3_abc", "c4", 400.0)
+
+    found = _handle_catchup(settings, None, checkpoint.get("t3_abc"))
+    assert [comment.id for comment in found] == ["c3"]
+    # without a checkpoint the walk still stops at the first processed comment
+    assert _handle_catchup(settings, None) == []
+
+
+class _FakeComment(SimpleNamespace):
+    def reply(self, body):
+        self.replies.append(body)
+
+
+def test_finish_sharded_confirmation_reports_users_of_a_failed_shard(
+    monkeypatch, settings: Settings
+):
+    monkeypatch.setattr(main, "SHARD_POOL", SimpleNamespace(SHARDS=8))
+    notified = []
+    monkeypatch.setattr(main, "PUSHOVER", SimpleNamespace(notify=notified.append))
+    names = ["alice", "bob", "carol", "dave"]
+    planned = [(name, 1, 0) for name in names]
+    by_shard = {}
+    for name in names:
+        by_shard.setdefault(shard_for(name, 8), []).append(name)
+    failed_shard = min(by_shard)
+    shard_results = [
+        (
+            None
+            if index == failed_shard
+            else [(name, f"{name} updated") for name in shard_names]
+        )
+        for index, shard_names in sorted(by_shard.items())
+    ]
+    comment = _FakeComment(
+        id="c1",
+        link_id="t3_abc",
+        created_utc=100.0,
+        permalink="/r/penpalbotdev/comments/abc/_/c1/",
+        replies=[],
+    )
+
+    _finish_sharded_confirmation(settings, comment, planned, shard_results)
+
+    failed = by_shard[failed_shard]
+    assert comment.replies == [
+        "".join(
+            "\n\n"
+            + (
+                settings.FLAIR_UPDATE_FAILED.format(mentioned_name=name)
+                if name in failed
+                else f"{name} updated"
+            )
+            for name in names
+        )
+    ]
+    assert len(notified) == 1 and all(name in notified[0] for name in failed)
+    assert settings.CATCHUP_CHECKPOINT.is_processed("t3_abc", "c1")
+
+
+def test_dispatch_comment_sends_a_comment_once(monkeypatch, settings: Settings):
+    queued = []
+    monkeypatch.setattr(
+        main,
+        "WORK_QUEUE",
+        SimpleNamespace(put=lambda keys, handler, *args: queued.append(args)),
+    )
+    comment = SimpleNamespace(
+        id="c1",
+        link_id="t3_abc",
+        created_utc=100.0,
+        subreddit=settings.SUBREDDIT_NAME,
+        body="u/alice 1 0",
+    )
+
+    # catchup queues the comment, then the stream comes across it before a worker gets to it
+    _dispatch_comment(comment, is_catchup=True)
+    _dispatch_comment(comment)
+    assert queued == [(comment, True)]
+    # once it's abandoned after a failure, catchup can send it again
+    settings.CATCHUP_CHECKPOINT.abandon("t3_abc", "c1")
+    _dispatch_comment(comment, is_catchup=True)
+    assert len(queued) == 2
+
+
+def test_catchup_comments_wait_behind_live_ones_for_the_same_user(
+    monkeypatch, settings: Settings
+):
+    handled = []
+    monkeypatch.setattr(
+        main,
+        "handle_confirmation_thread_comment",
+        lambda comment, is_catchup=False: handled.append((comment.id, is_catchup)),
+    )
+    live = SimpleNamespace(
+        id="c2",
+        link_id="t3_abc",
+        created_utc=200.0,
+        subreddit=settings.SUBREDDIT_NAME,
+        body="u/alice 1 0",
+    )
+    caught_up = SimpleNamespace(
+        id="c1",
+        link_id="t3_abc",
+        created_utc=100.0,
+        subreddit=settings.SUBREDDIT_NAME,
+        body="u/alice 1 0",
+    )
+
+    async def slow_live(comment):
+        await asyncio.sleep(0.1)
+        handled.append((comment.id, False))
+
+    async def run():
+        tasks = KeyedTasks(10)
+        monkeypatch.setattr(main, "COMMENT_TASKS", tasks)
+        monkeypatch.setattr(main, "EVENT_LOOP", asyncio.get_running_loop())
+        await tasks.submit(_comment_keys(live), slow_live, live)
+        # an outage catchup finds an older comment for alice while the live one runs
+        await asyncio.to_thread(_dispatch_comment, caught_up, True)
+        await tasks.join()
+
+    asyncio.run(run())
+    assert handled == [("c2", False), ("c1", True)]
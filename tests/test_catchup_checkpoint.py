@@ -0,0 +1,59 @@
+from catchup_checkpoint import CatchupCheckpoint
+
+
+def test_catchup_checkpoint_mark_processed():
+    checkpoint = CatchupCheckpoint(":memory:")
+    assert checkpoint.get("t3_abc") == None
+    checkpoint.mark_processed("penpalbotdev", "t3_abc", "c2", 200.0)
+    checkpoint.mark_processed("penpalbotdev", "t3_abc", "c1", 100.0)
+    assert checkpoint.get("t3_abc") == (200.0, "t1_c2")
+    assert checkpoint.is_processed("t3_abc", "c1")
+    assert checkpoint.is_processed("t3_abc", "c2")
+    assert not checkpoint.is_processed("t3_abc", "c3")
+
+
+def test_catchup_checkpoint_prune():
+    checkpoint = CatchupCheckpoint(":memory:")
+    checkpoint.mark_processed("penpalbotdev", "t3_old", "c1", 100.0)
+    checkpoint.mark_processed("penpalbotdev", "t3_new", "c2", 200.0)
+    checkpoint.mark_processed("otherpenpals", "t3_other", "c3", 300.0)
+    checkpoint.prune("PenPalBotDev", "t3_new")
+    assert checkpoint.get("t3_old") == None
+    assert not checkpoint.is_processed("t3_old", "c1")
+    assert checkpoint.is_processed("t3_new", "c2")
+    assert checkpoint.is_processed("t3_other", "c3")
+
+
+def test_catchup_checkpoint_stays_behind_comments_in_flight():
+    checkpoint = CatchupCheckpoint(":memory:")
+    checkpoint.mark_processed("penpalbotdev", "t3_abc", "c1", 100.0)
+    checkpoint.start("t3_abc", "c2", 200.0)
+    checkpoint.start("t3_abc", "c3", 300.0)
+    # c3 finishes first, but c2 is still queued, so catchup must still look past c1
+    checkpoint.mark_processed("penpalbotdev", "t3_abc", "c3", 300.0)
+    assert checkpoint.get("t3_abc") == (100.0, "t1_c1")
+    checkpoint.mark_processed("penpalbotdev", "t3_abc", "c2", 200.0)
+    assert checkpoint.get("t3_abc") == (300.0, "t1_c3")
+
+
+def test_catchup_checkpoint_release():
+    checkpoint = CatchupCheckpoint(":memory:")
+    checkpoint.start("t3_abc", "c1", 100.0)
+    checkpoint.mark_processed("penpalbotdev", "t3_abc", "c2", 200.0)
+    assert checkpoint.get("t3_abc") == None
+    checkpoint.release("t3_abc", "c1")
+    assert checkpoint.get("t3_abc") == (200.0, "t1_c2")
+    assert not checkpoint.is_processed("t3_abc", "c1")
+
+
+def test_catchup_checkpoint_claims_comments_once():
+    checkpoint = CatchupCheckpoint(":memory:")
+    assert checkpoint.start("t3_abc", "c1", 100.0)
+    assert not checkpoint.start("t3_abc", "c1", 100.0)
+    # a failed comment can be claimed again, but the checkpoint stays behind it
+    checkpoint.abandon("t3_abc", "c1")
+    checkpoint.mark_processed("penpalbotdev", "t3_abc", "c2", 200.0)
+    assert checkpoint.get("t3_abc") == None
+    assert checkpoint.start("t3_abc", "c1", 100.0)
+    checkpoint.mark_processed("penpalbotdev", "t3_abc", "c1", 100.0)
+    assert checkpoint.get("t3_abc") == (200.0, "t1_c2")
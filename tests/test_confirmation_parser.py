@@ -0,0 +1,122 @@
+import pytest
+import re
+import time
+import confirmation_parser
+from confirmation_parser import (
+    ConfirmationParser,
+    DEFAULT_CONFIRMATION_PATTERN,
+    UnsafePatternError,
+    check_pattern,
+)
+
+COMMENTS = [
+    "u/digitalmayhap 1 2",
+    "u/DigitalMayhap \\- 1 - 2 and u/YarnSwapper 0 1",
+    "Thanks /u/penpal_1\n\n3\n4",
+    "u/ab 1 2 u/abc 12-34 u/abcd -5 6",
+    "u/name 1 x u/other\t7 \t- \t8",
+    "u/name 1 2 u/dig ١ ٢",
+    "no confirmations here",
+]
+
+
+def test_default_pattern_matches_template():
+    with open(
+        "src/mdtemplates/confirmation_regex_pattern.md", encoding="utf-8"
+    ) as file:
+        assert file.read() == DEFAULT_CONFIRMATION_PATTERN
+
+
+def test_scanner_finds_what_the_regex_finds():
+    parser = ConfirmationParser(DEFAULT_CONFIRMATION_PATTERN)
+    regex = re.compile(DEFAULT_CONFIRMATION_PATTERN)
+    for comment in COMMENTS:
+        assert parser.findall(comment) == regex.findall(comment)
+
+
+def test_scanner_is_fast_on_pathological_comments():
+    parser = ConfirmationParser(DEFAULT_CONFIRMATION_PATTERN)
+    comment = ("u/abc" + " " * 2000 + "1" + " " * 2000) * 2
+    started_at = time.perf_counter()
+    assert parser.findall(comment) == []
+    assert time.perf_counter() - started_at < 0.5
+
+
+def test_caps_body_length_and_matches(monkeypatch, caplog):
+    monkeypatch.setattr(confirmation_parser, "MAX_MATCHES", 3)
+    parser = ConfirmationParser(DEFAULT_CONFIRMATION_PATTERN)
+    assert len(parser.findall("u/user 1 1 " * 10)) == 3
+    assert "dropping the rest" in caplog.text
+    caplog.clear()
+    assert len(parser.findall("u/user 1 1 " * 3)) == 3
+    assert "dropping the rest" not in caplog.text
+
+    monkeypatch.setattr(confirmation_parser, "MAX_BODY_LENGTH", 20)
+    assert parser.findall("x" * 20 + "u/user 1 1") == []
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        r"(a+)+b",
+        r"u/(\s*\w+)*(\d+)",
+        r"(.|\s)*x",
+        r"(\d\s|\w\s)+x",
+        "[uU]/" + DEFAULT_CONFIRMATION_PATTERN[2:],
+        r"u/([a-zA-Z0-9_-]{3,})\s*\s*\s*(\d+)\s+(\d+)",
+        r"(\s+)\s*x",
+        r"\s+ \s+x",
+    ],
+)
+def test_check_pattern_rejects_catastrophic_patterns(pattern):
+    with pytest.raises(UnsafePatternError):
+        check_pattern(pattern)
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        # the default pattern with its whitespace runs made possessive
+        r"u/([a-zA-Z0-9_-]{3,}+)\s++\\?+-?+\s*+(\d++)(?:\s++|\s*+-\s*+)(\d++)",
+        r"u/(\w+)\s+(\d+)\s+(\d+)",
+        r"\d+x\d+",
+        r"(?:ab|cd)+",
+        r"(?>a+)+",
+    ],
+)
+def test_check_pattern_accepts_safe_patterns(pattern):
+    check_pattern(pattern)
+
+
+def test_unsafe_wiki_pattern_falls_back_to_default():
+    parser = ConfirmationParser(r"u/(\w+)(\s*\d+)+")
+    assert parser.REJECTED
+    assert parser.pattern == DEFAULT_CONFIRMATION_PATTERN
+    assert parser.findall("u/digitalmayhap 1 2") == [("digitalmayhap", "1", "2")]
+
+
+def test_polynomial_wiki_pattern_falls_back_to_default():
+    parser = ConfirmationParser("[uU]/" + DEFAULT_CONFIRMATION_PATTERN[2:])
+    assert parser.REJECTED
+    comment = "u/abc" + " " * 10000
+    started_at = time.perf_counter()
+    assert parser.findall(comment) == []
+    assert time.perf_counter() - started_at < 0.5
+
+
+def test_custom_pattern_prefilter_follows_its_literal_text():
+    parser = ConfirmationParser(r"(?i)u/(\w+)\s+(\d+)\s+(\d+)")
+    assert parser.findall("U/one 1 2") == [("one", "1", "2")]
+    parser = ConfirmationParser(r"[uU]/(\w+)\s+(\d+)\s+(\d+)")
+    assert parser.findall("U/one 1 2") == [("one", "1", "2")]
+    assert parser.findall("one 1 2") == []
+
+
+def test_custom_pattern_keeps_findall_shape():
+    parser = ConfirmationParser(r"u/(\w+)\s+(\d+)\s+(\d+)")
+    assert not parser.REJECTED
+    assert parser.findall("u/one 1 2 u/two 3 4") == [
+        ("one", "1", "2"),
+        ("two", "3", "4"),
+    ]
+    assert parser.findall("no mention 1 2") == []
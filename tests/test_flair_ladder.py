@@ -0,0 +1,40 @@
+from flair_ladder import FlairLadder
+
+
+def _template(name, mod_only=False):
+    return {"id": name, "text": name, "mod_only": mod_only}
+
+
+def test_flair_ladder_find():
+    ladder = FlairLadder(
+        [
+            (50, 99, _template("50-99")),
+            (0, 49, _template("0-49")),
+            (0, 99, _template("mod 0-99", True)),
+        ]
+    )
+    assert ladder.PROBLEMS == []
+    assert ladder.find(0, False)["id"] == "0-49"
+    assert ladder.find(49, False)["id"] == "0-49"
+    assert ladder.find(50, False)["id"] == "50-99"
+    assert ladder.find(50, True)["id"] == "mod 0-99"
+    assert ladder.find(100, False) == None
+
+
+def test_flair_ladder_reports_overlaps_and_gaps():
+    ladder = FlairLadder(
+        [
+            (0, 49, _template("0-49")),
+            (40, 60, _template("40-60")),
+            (75, 99, _template("75-99")),
+        ]
+    )
+    assert len(ladder.PROBLEMS) == 2
+    assert ladder.find(45, False)["id"] == "0-49"
+    assert ladder.find(60, False) == None
+    assert ladder.find(80, False)["id"] == "75-99"
+
+
+def test_flair_ladder_empty():
+    ladder = FlairLadder([])
+    assert ladder.find(1, True) == None
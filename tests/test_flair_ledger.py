@@ -0,0 +1,29 @@
+import time
+from flair_ledger import FlairLedger
+
+
+def test_flair_ledger_miss():
+    ledger = FlairLedger(":memory:", 60)
+    assert ledger.get("penpalbotdev", "digitalmayhap") == None
+
+
+def test_flair_ledger_record():
+    ledger = FlairLedger(":memory:", 60)
+    ledger.record("penpalbotdev", "DigitalMayhap", "📧 Emails: 1 | 📬 Letters: 1", "")
+    current_flair = ledger.get("PenPalBotDev", "digitalmayhap")
+    assert current_flair["flair_text"] == "📧 Emails: 1 | 📬 Letters: 1"
+    assert current_flair["flair_css_class"] == ""
+
+
+def test_flair_ledger_stale():
+    ledger = FlairLedger(":memory:", 0)
+    ledger.record("penpalbotdev", "digitalmayhap", "📧 Emails: 1 | 📬 Letters: 1", "")
+    time.sleep(0.01)
+    assert ledger.get("penpalbotdev", "digitalmayhap") == None
+
+
+def test_flair_ledger_forget():
+    ledger = FlairLedger(":memory:", 60)
+    ledger.record("penpalbotdev", "digitalmayhap", "📧 Emails: 1 | 📬 Letters: 1", "")
+    ledger.forget("penpalbotdev", "DIGITALMAYHAP")
+    assert ledger.get("penpalbotdev", "digitalmayhap") == None
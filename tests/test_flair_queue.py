@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+from flair_ledger import FlairLedger
+from flair_queue import FlairWriteQueue
+
+TEMPLATE = {"id": "template", "css_class": ""}
+
+
+def _settings(results=None):
+    calls = []
+
+    def update(flair_list):
+        calls.append(flair_list)
+        return results or [{"ok": True} for _ in flair_list]
+
+    settings = SimpleNamespace(
+        SUBREDDIT_NAME="penpalbotdev",
+        SUBREDDIT=SimpleNamespace(flair=SimpleNamespace(update=update)),
+        FLAIR_LEDGER=FlairLedger(":memory:", 60),
+    )
+    return settings, calls
+
+
+def test_flair_queue_coalesces():
+    settings, calls = _settings()
+    queue = FlairWriteQueue(settings, 60)
+    queue.submit("digitalmayhap", "📧 Emails: 1 | 📬 Letters: 1", TEMPLATE)
+    queue.submit("DigitalMayhap", "📧 Emails: 2 | 📬 Letters: 2", TEMPLATE)
+    queue.submit("YarnSwapper", "📧 Emails: 1 | 📬 Letters: 0", TEMPLATE)
+    assert (
+        queue.pending("digitalmayhap")["flair_text"] == "📧 Emails: 2 | 📬 Letters: 2"
+    )
+    queue.flush()
+    assert len(calls) == 1
+    assert len(calls[0]) == 2
+    assert queue.pending("digitalmayhap") == None
+    assert (
+        settings.FLAIR_LEDGER.get("penpalbotdev", "digitalmayhap")["flair_text"]
+        == "📧 Emails: 2 | 📬 Letters: 2"
+    )
+
+
+def test_flair_queue_after_flush_reports_failures():
+    settings, _ = _settings([{"ok": False}])
+    queue = FlairWriteQueue(settings, 60)
+    reported = []
+    queue.submit("digitalmayhap", "📧 Emails: 1 | 📬 Letters: 1", TEMPLATE)
+    queue.after_flush(reported.append)
+    assert reported == []
+    queue.flush()
+    assert reported == [{"digitalmayhap"}]
+    assert settings.FLAIR_LEDGER.get("penpalbotdev", "digitalmayhap") == None
+
+
+def test_flair_queue_after_flush_when_idle():
+    settings, calls = _settings()
+    queue = FlairWriteQueue(settings, 60)
+    reported = []
+    queue.after_flush(reported.append)
+    assert reported == [set()]
+    assert calls == []
@@ -0,0 +1,168 @@
+import helpers_confirmation
+from types import SimpleNamespace
+from flair_queue import FlairWriteQueue
+from journal import ProcessingJournal
+
+TEMPLATE = {"id": "template-id", "css_class": "", "text": "{E} {L}"}
+
+
+def test_journal_replays_progress(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ProcessingJournal(path, 60)
+    journal.begin(
+        "PenPalBotDev", "abc", [("DigitalMayhap", 1, 2), ("yarnswapper", 0, 1)]
+    )
+    journal.applying(
+        "penpalbotdev", "abc", "DigitalMayhap", "No Flair", "1 2", TEMPLATE
+    )
+    journal.applied("penpalbotdev", "abc", "DigitalMayhap", "updated")
+    journal.applying("penpalbotdev", "abc", "yarnswapper", "0 0", "0 1", TEMPLATE)
+    journal.begin("penpalbotdev", "def", [("digitalmayhap", 1, 0)])
+    journal.finish("penpalbotdev", "def")
+    journal.sync()
+
+    replayed = ProcessingJournal(path, 60)
+    assert [entry["comment"] for entry in replayed.unfinished()] == ["abc"]
+    assert (
+        replayed.user_progress("penpalbotdev", "abc", "digitalmayhap")["reply"]
+        == "updated"
+    )
+    progress = replayed.user_progress("penpalbotdev", "abc", "YarnSwapper")
+    assert progress["op"] == "applying"
+    assert (progress["old"], progress["new"]) == ("0 0", "0 1")
+
+
+def test_journal_compaction_drops_old_finished_comments(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ProcessingJournal(path, 0)
+    journal.begin("penpalbotdev", "done", [("digitalmayhap", 1, 0)])
+    journal.finish("penpalbotdev", "done")
+    journal.begin("penpalbotdev", "open", [("digitalmayhap", 1, 0)])
+    journal.compact()
+
+    with open(path, encoding="utf-8") as file:
+        assert len(file.readlines()) == 1
+    assert journal.get("penpalbotdev", "done") is None
+    assert ProcessingJournal(path, 0).get("penpalbotdev", "open")
+
+
+def test_journal_skips_torn_last_record(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ProcessingJournal(path, 60)
+    journal.begin("penpalbotdev", "abc", [("digitalmayhap", 1, 0)])
+    journal.sync()
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"op": "applied", "subreddit": "penpal')
+    assert ProcessingJournal(path, 60).get("penpalbotdev", "abc")
+
+
+def _settings(journal, flair_write_queue=None):
+    return SimpleNamespace(
+        JOURNAL=journal,
+        FLAIR_WRITE_QUEUE=flair_write_queue,
+        SUBREDDIT_NAME="penpalbotdev",
+        CONFIRMATION_TEMPLATE="{mentioned_name}: {old_flair} -> {new_flair}",
+        FLAIR_UPDATE_FAILED="failed {mentioned_name}",
+    )
+
+
+def test_confirmation_is_not_counted_twice(tmp_path, monkeypatch):
+    journal = ProcessingJournal(str(tmp_path / "journal.jsonl"), 60)
+    settings = _settings(journal)
+    comment = SimpleNamespace(id="abc", author_fullname="t2_author")
+    increments = []
+
+    def increment_flair(settings, redditor, emails, letters, before_write):
+        increments.append(redditor)
+        before_write("1 1", "2 2", TEMPLATE)
+        return ("1 1", "2 2")
+
+    monkeypatch.setattr(
+        helpers_confirmation,
+        "get_redditor",
+        lambda bot, name: SimpleNamespace(fullname="t2_user"),
+    )
+    monkeypatch.setattr(helpers_confirmation, "increment_flair", increment_flair)
+
+    planned = [("digitalmayhap", 1, 1)]
+    first = helpers_confirmation.handle_confirmations(None, settings, comment, planned)
+    again = helpers_confirmation.handle_confirmations(None, settings, comment, planned)
+    assert first == again == [("digitalmayhap", "digitalmayhap: 1 1 -> 2 2")]
+    assert len(increments) == 1
+
+
+def test_interrupted_update_is_finished_from_current_flair(tmp_path, monkeypatch):
+    journal = ProcessingJournal(str(tmp_path / "journal.jsonl"), 60)
+    journal.begin("penpalbotdev", "abc", [("digitalmayhap", 1, 1)])
+    journal.applying("penpalbotdev", "abc", "digitalmayhap", "1 1", "2 2", TEMPLATE)
+    settings = _settings(journal)
+    comment = SimpleNamespace(id="abc", author_fullname="t2_author")
+    written = []
+    current_flair = {"flair_text": "1 1"}
+
+    monkeypatch.setattr(
+        helpers_confirmation,
+        "get_redditor",
+        lambda bot, name: SimpleNamespace(fullname="t2_user"),
+    )
+    monkeypatch.setattr(
+        helpers_confirmation, "get_current_flair", lambda settings, user: current_flair
+    )
+    monkeypatch.setattr(
+        helpers_confirmation,
+        "set_redditor_flair",
+        lambda settings, user, text, template: written.append((text, template["id"])),
+    )
+
+    reply = helpers_confirmation.handle_confirmation(
+        None, settings, comment, ("digitalmayhap", 1, 1)
+    )
+    assert reply == "digitalmayhap: 1 1 -> 2 2"
+    assert written == [("2 2", "template-id")]
+
+    # the write had gone through before the restart
+    journal.applying("penpalbotdev", "abc", "other", "1 1", "2 2", TEMPLATE)
+    current_flair["flair_text"] = "2 2"
+    reply = helpers_confirmation.handle_confirmation(
+        None, settings, comment, ("other", 1, 1)
+    )
+    assert reply == "other: 1 1 -> 2 2"
+    assert len(written) == 1
+
+
+def test_queued_update_is_applied_once_its_batch_is_sent(tmp_path, monkeypatch):
+    journal = ProcessingJournal(str(tmp_path / "journal.jsonl"), 60)
+    results = [{"ok": True}]
+    queue_settings = SimpleNamespace(
+        SUBREDDIT_NAME="penpalbotdev",
+        SUBREDDIT=SimpleNamespace(
+            flair=SimpleNamespace(update=lambda flair_list: results)
+        ),
+        FLAIR_LEDGER=SimpleNamespace(record=lambda *args: None),
+    )
+    queue = FlairWriteQueue(queue_settings, 60)
+    settings = _settings(journal, queue)
+    comment = SimpleNamespace(id="abc", author_fullname="t2_author")
+
+    def increment_flair(settings, redditor, emails, letters, before_write):
+        before_write("1 1", "2 2", TEMPLATE)
+        queue.submit(redditor, "2 2", TEMPLATE)
+        return ("1 1", "2 2")
+
+    monkeypatch.setattr(
+        helpers_confirmation,
+        "get_redditor",
+        lambda bot, name: SimpleNamespace(fullname="t2_user"),
+    )
+    monkeypatch.setattr(helpers_confirmation, "increment_flair", increment_flair)
+
+    helpers_confirmation.handle_confirmations(
+        None, settings, comment, [("digitalmayhap", 1, 1)]
+    )
+    assert journal.user_progress("penpalbotdev", "abc", "digitalmayhap")["op"] == (
+        "applying"
+    )
+    queue.flush()
+    progress = journal.user_progress("penpalbotdev", "abc", "digitalmayhap")
+    assert progress["op"] == "applied"
+    assert progress["reply"] == "digitalmayhap: 1 1 -> 2 2"
@@ -0,0 +1,185 @@
+import io
+import json
+import logging
+import os
+import threading
+import time
+from logger import configure_logger, stop_listeners, use_own_log_file
+
+
+def _logger(name: str) -> logging.Logger:
+    loggr = logging.getLogger(f"test-logger-{name}")
+    loggr.handlers.clear()
+    loggr.filters.clear()
+    loggr.propagate = False
+    return loggr
+
+
+def _close(loggr: logging.Logger) -> None:
+    for handler in loggr.handlers:
+        handler.close()
+
+
+def test_json_lines_carry_structured_fields(tmp_path):
+    path = tmp_path / "log.jsonl"
+    loggr = configure_logger(
+        _logger("json"), str(path), json_lines=True, stream=io.StringIO()
+    )
+    loggr.info(
+        "Updated %s to %s for %s",
+        "0 0",
+        "1 2",
+        "digitalmayhap",
+        extra={"comment_id": "abc", "mentioned_user": "digitalmayhap"},
+    )
+    loggr.info("Bot start up")
+    _close(loggr)
+
+    first, second = [json.loads(line) for line in path.read_text().splitlines()]
+    assert first["message"] == "Updated 0 0 to 1 2 for digitalmayhap"
+    assert (first["comment_id"], first["mentioned_user"]) == ("abc", "digitalmayhap")
+    assert "new_flair" not in first
+    assert second["level"] == "INFO" and "comment_id" not in second
+
+
+def test_sampling_drops_repeats_but_not_warnings(tmp_path):
+    path = tmp_path / "log.txt"
+    loggr = configure_logger(
+        _logger("sampling"), str(path), sample_interval=0.2, stream=io.StringIO()
+    )
+    for index in range(5):
+        loggr.info("Processing new comment %s", index)
+        loggr.warning("Flair update failed for %s", index)
+    time.sleep(0.25)
+    loggr.info("Processing new comment %s", 5)
+    _close(loggr)
+
+    lines = path.read_text().splitlines()
+    assert sum("Processing new comment" in line for line in lines) == 2
+    assert sum("Flair update failed" in line for line in lines) == 5
+    assert lines[-1].endswith("Processing new comment 5 (4 similar messages dropped)")
+
+
+def test_async_mode_writes_from_the_listener(tmp_path):
+    path = tmp_path / "log.txt"
+    stream = io.StringIO()
+    loggr = configure_logger(
+        _logger("async"), str(path), async_mode=True, stream=stream
+    )
+    for index in range(100):
+        loggr.info("Processing new comment %s", index)
+    # stopping the listener, as happens at exit, writes out what is still queued
+    loggr.handlers[0].listener.stop()
+    _close(loggr)
+
+    assert len(path.read_text().splitlines()) == 100
+    assert stream.getvalue().count("\n") == 100
+
+
+class ThreadRecorder:
+    """Formats as the name of the thread that formatted it."""
+
+    def __str__(self):
+        return threading.current_thread().name
+
+
+def test_async_mode_formats_on_the_listener(tmp_path):
+    path = tmp_path / "log.txt"
+    loggr = configure_logger(
+        _logger("formatting"), str(path), async_mode=True, stream=io.StringIO()
+    )
+    loggr.info("Formatted on %s", ThreadRecorder())
+    loggr.handlers[0].listener.stop()
+    _close(loggr)
+
+    assert threading.current_thread().name not in path.read_text()
+
+
+class BlockingStream(io.StringIO):
+    """Holds the parent's listener in its first write, so records pile up in its queue."""
+
+    def __init__(self):
+        super().__init__()
+        self.PARENT = os.getpid()
+        self.release = threading.Event()
+        self.writing = threading.Event()
+
+    def write(self, text):
+        if os.getpid() == self.PARENT:
+            self.writing.set()
+            self.release.wait(10)
+        return super().write(text)
+
+
+def test_async_mode_in_a_forked_child(tmp_path):
+    path = tmp_path / "log.txt"
+    stream = BlockingStream()
+    loggr = configure_logger(
+        _logger("forked"), str(path), async_mode=True, stream=stream
+    )
+    for index in range(10):
+        loggr.info("Parent record %s", index)
+    assert stream.writing.wait(10)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            loggr.info("Child record")
+            # what a shard does before exiting, since os._exit skips atexit
+            stop_listeners()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    stream.release.set()
+    loggr.handlers[0].listener.stop()
+    _close(loggr)
+
+    lines = path.read_text().splitlines()
+    # the child wrote its own record, and none of the parent's it inherited queued
+    assert sum("Child record" in line for line in lines) == 1
+    assert sum("Parent record" in line for line in lines) == 10
+
+
+def test_log_file_rotates_by_size(tmp_path):
+    path = tmp_path / "log.txt"
+    loggr = configure_logger(
+        _logger("rotating"),
+        str(path),
+        max_bytes=1000,
+        backup_count=2,
+        stream=io.StringIO(),
+    )
+    for index in range(200):
+        loggr.info("Processing new comment %s", index)
+    _close(loggr)
+
+    assert sorted(file.name for file in tmp_path.iterdir()) == [
+        "log.txt",
+        "log.txt.1",
+        "log.txt.2",
+    ]
+    assert path.stat().st_size <= 1000
+
+
+def test_forked_process_logs_to_its_own_file(tmp_path):
+    path = tmp_path / "log.txt"
+    loggr = configure_logger(
+        _logger("own-file"),
+        str(path),
+        max_bytes=100000,
+        stream=io.StringIO(),
+    )
+    loggr.info("Parent record")
+    pid = os.fork()
+    if pid == 0:
+        try:
+            use_own_log_file("shard0")
+            loggr.info("Shard record")
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    loggr.info("Parent record")
+    _close(loggr)
+
+    assert path.read_text().count("Parent record") == 2
+    assert "Shard record" not in path.read_text()
+    assert "Shard record" in (tmp_path / "log.txt.shard0").read_text()
@@ -0,0 +1,85 @@
+import urllib.request
+from metrics import Metrics, endpoint_label
+
+
+def test_render_prometheus_text():
+    metrics = Metrics()
+    metrics.inc("confirmations_total", result="updated")
+    metrics.inc("confirmations_total", 2, result="updated")
+    metrics.set("reddit_ratelimit_remaining", 594.0)
+    metrics.observe("stage_duration_seconds", 0.003, stage="parse")
+    metrics.observe("stage_duration_seconds", 0.2, stage="parse")
+    metrics.observe("stage_duration_seconds", 30, stage="parse")
+    hits = iter([4, 7])
+    metrics.derive(
+        "redditor_cache_requests_total", "counter", lambda: next(hits), result="hit"
+    )
+
+    lines = metrics.render().splitlines()
+    assert 'penpal_bot_confirmations_total{result="updated"} 3' in lines
+    assert "# TYPE penpal_bot_confirmations_total counter" in lines
+    assert "penpal_bot_reddit_ratelimit_remaining 594.0" in lines
+    assert 'penpal_bot_redditor_cache_requests_total{result="hit"} 4' in lines
+    assert "# TYPE penpal_bot_stage_duration_seconds histogram" in lines
+    assert (
+        'penpal_bot_stage_duration_seconds_bucket{stage="parse",le="0.005"} 1' in lines
+    )
+    assert (
+        'penpal_bot_stage_duration_seconds_bucket{stage="parse",le="0.25"} 2' in lines
+    )
+    assert (
+        'penpal_bot_stage_duration_seconds_bucket{stage="parse",le="+Inf"} 3' in lines
+    )
+    assert 'penpal_bot_stage_duration_seconds_count{stage="parse"} 3' in lines
+    # derived values are read again on every scrape
+    assert 'penpal_bot_redditor_cache_requests_total{result="hit"} 7' in (
+        metrics.render().splitlines()
+    )
+
+
+def test_timed_records_stage_even_on_error():
+    metrics = Metrics()
+
+    @metrics.timed("get_redditor")
+    def failing_lookup():
+        raise ValueError("boom")
+
+    try:
+        failing_lookup()
+    except ValueError:
+        pass
+    with metrics.time("reply"):
+        pass
+
+    rendered = metrics.render()
+    assert 'penpal_bot_stage_duration_seconds_count{stage="get_redditor"} 1' in rendered
+    assert 'penpal_bot_stage_duration_seconds_count{stage="reply"} 1' in rendered
+
+
+def test_endpoint_label_drops_names_and_ids():
+    assert endpoint_label("https://oauth.reddit.com/api/v1/me") == "/api/v1/me"
+    assert (
+        endpoint_label("https://oauth.reddit.com/r/penpals/api/flairselector/")
+        == "/r/_/api/flairselector"
+    )
+    assert endpoint_label("https://oauth.reddit.com/user/digitalmayhap/about") == (
+        "/user/_/about"
+    )
+    assert (
+        endpoint_label("https://oauth.reddit.com/comments/1b3x9k/march_2024/kt5s9a")
+        == "/comments/_"
+    )
+
+
+def test_serves_metrics_over_http():
+    metrics = Metrics()
+    metrics.inc("confirmations_total", result="failed")
+    server = metrics.serve(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode("utf-8")
+        assert 'penpal_bot_confirmations_total{result="failed"} 1' in body
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+from moderator_cache import ModeratorCache
+
+
+def log_entry(action, mod="penpal-bot", target_author=None):
+    return SimpleNamespace(action=action, mod=mod, target_author=target_author)
+
+
+def test_membership_ignores_case_and_accepts_redditors():
+    mods = ModeratorCache(["DigitalMayhap"])
+    assert "digitalmayhap" in mods
+
+    class Redditor:
+        def __str__(self):
+            return "DIGITALMAYHAP"
+
+    assert Redditor() in mods
+    assert mods == {"digitalmayhap"}
+    assert {"digitalmayhap", "yarnswapper"} - mods == {"yarnswapper"}
+
+
+def test_mod_log_adds_and_removes_moderators():
+    mods = ModeratorCache(["digitalmayhap"])
+
+    assert mods.apply(log_entry("acceptmoderatorinvite", mod="YarnSwapper")) == (
+        "yarnswapper",
+        True,
+    )
+    assert "yarnswapper" in mods
+    assert mods.apply(
+        log_entry("removemoderator", mod="digitalmayhap", target_author="YarnSwapper")
+    ) == ("yarnswapper", False)
+    assert "yarnswapper" not in mods
+    # already the case, or not about moderators
+    assert mods.apply(log_entry("removemoderator", target_author="yarnswapper")) is None
+    assert mods.apply(log_entry("editflair", target_author="digitalmayhap")) is None
+    assert mods == {"digitalmayhap"}
+
+
+def test_replace_reports_differences():
+    mods = ModeratorCache(["digitalmayhap", "yarnswapper"])
+    assert mods.replace(["DigitalMayhap", "penpal_123"]) == (
+        {"penpal_123"},
+        {"yarnswapper"},
+    )
+    assert sorted(mods) == ["digitalmayhap", "penpal_123"]
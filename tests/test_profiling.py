@@ -0,0 +1,60 @@
+import threading
+import time
+import profiling
+
+
+def test_parse_command():
+    assert profiling.parse_command("profile 30") == ("profile", 30)
+    assert profiling.parse_command("MemSnapshot") == ("memsnapshot", 60)
+    assert profiling.parse_command("profile 99999") == ("profile", 600)
+    assert profiling.parse_command("please reload") is None
+
+
+def busy_confirmation_work(stop: threading.Event):
+    while not stop.is_set():
+        sum(index * index for index in range(1000))
+
+
+def test_sample_stacks_finds_busy_function():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_confirmation_work, args=(stop,))
+    worker.start()
+    try:
+        report = profiling.sample_stacks(0.3, interval=0.001)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert "busy_confirmation_work (tests/test_profiling.py:" in report
+    # the test's own thread waits in join/sleep and the idle filter leaves it out
+    assert "test_sample_stacks_finds_busy_function" not in report
+
+
+def test_trace_allocations_reports_sites():
+    held = []
+
+    def allocate():
+        for _ in range(20):
+            held.append(bytearray(100_000))
+            time.sleep(0.01)
+
+    allocator = threading.Thread(target=allocate)
+    allocator.start()
+    report = profiling.trace_allocations(0.5)
+    allocator.join()
+
+    assert "test_profiling.py:" in report.splitlines()[3]
+
+
+def test_only_one_profile_runs_at_a_time():
+    reports = []
+    done = threading.Event()
+
+    def on_report(report):
+        reports.append(report)
+        done.set()
+
+    assert profiling.start("memsnapshot", 1, on_report)
+    assert not profiling.start("profile", 1, on_report)
+    assert done.wait(5)
+    assert reports[0].startswith("Traced allocations for 1 seconds")
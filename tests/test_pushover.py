@@ -1,4 +1,11 @@
+import pytest
+import threading
+import time
+from types import SimpleNamespace
 from betamax import Betamax
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs
 from pushover import Pushover
 from helpers import load_secrets
 
@@ -13,3 +20,86 @@ def test_send_pushover_message():
         )
 
     assert result.status_code == 200
+
+
+class PushoverStandIn(BaseHTTPRequestHandler):
+    """Local stand-in for the Pushover API that records messages and can fail on request."""
+
+    messages = []
+    failures = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if PushoverStandIn.failures:
+            PushoverStandIn.failures -= 1
+            self.send_response(500)
+        else:
+            PushoverStandIn.messages.append(parse_qs(body.decode())["message"][0])
+            self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'{"status": 1}')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def pushover_url():
+    PushoverStandIn.messages = []
+    PushoverStandIn.failures = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PushoverStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/1/messages.json"
+    server.shutdown()
+
+
+def test_notify_coalesces_similar_messages(pushover_url):
+    pushover = Pushover("app", "user", url=pushover_url, window=60)
+    for attempt in range(12):
+        pushover.notify(f"r/penpalbotdev bot exception: error {attempt}")
+    pushover.notify("Bot startup for r/penpalbotdev")
+    pushover.close()
+
+    assert PushoverStandIn.messages == [
+        "r/penpalbotdev bot exception: error 0",
+        "Bot startup for r/penpalbotdev",
+        "r/penpalbotdev bot exception: error 0 (x11 more in the last 1 min)",
+    ]
+
+
+def test_notify_retries_failed_requests(pushover_url):
+    PushoverStandIn.failures = 2
+    pushover = Pushover("app", "user", url=pushover_url, retry_delay=0.01)
+    pushover.notify("Created monthly post for r/penpalbotdev")
+    pushover.close()
+    assert PushoverStandIn.messages == ["Created monthly post for r/penpalbotdev"]
+
+
+def test_notify_doesnt_wait_for_pushover(pushover_url):
+    pushover = Pushover("app", "user", url=pushover_url, timeout=1)
+    with patch.object(
+        pushover,
+        "_post",
+        side_effect=lambda message: time.sleep(0.5) or SimpleNamespace(status_code=200),
+    ):
+        started_at = time.perf_counter()
+        pushover.notify("slow")
+        assert time.perf_counter() - started_at < 0.1
+        pushover.close()
+
+
+def test_notify_coalesces_across_restarts(pushover_url, tmp_path):
+    state_path = str(tmp_path / "pushover_state.json")
+    for _ in range(3):
+        pushover = Pushover("app", "user", url=pushover_url, state_path=state_path)
+        pushover.notify("r/penpalbotdev bot exception: crashed")
+        pushover.close()
+    assert PushoverStandIn.messages == ["r/penpalbotdev bot exception: crashed"]
+
+    pushover = Pushover(
+        "app", "user", url=pushover_url, window=0, state_path=state_path
+    )
+    pushover.close()
+    assert PushoverStandIn.messages[1:] == [
+        "r/penpalbotdev bot exception: crashed (x2 more in the last 0 min)"
+    ]
@@ -1,7 +1,7 @@
 from praw import Reddit
 from betamax import Betamax
 from betamax_helpers import use_recorder
-from helpers_redditor import get_redditor
+from helpers_redditor import get_redditor, RedditorCache
 
 
 @use_recorder
@@ -14,3 +14,36 @@ def test_get_redditor_good(recorder: Betamax, bot: Reddit):
 def test_get_redditor_bad(recorder: Betamax, bot: Reddit):
     redditor = get_redditor(bot, "klasjflkajslkfjaklsjflkasklfdj")
     assert redditor == None
+
+
+def test_redditor_cache_hit(tmp_path):
+    cache = RedditorCache(10, 60, 60, str(tmp_path / "redditors.json"))
+    cache.put("DigitalMayhap", {"name": "digitalmayhap", "id": "abc"})
+    cache.put("klasjflkajslkfjaklsjflkasklfdj", None)
+    assert cache.get("digitalmayhap") == (True, {"name": "digitalmayhap", "id": "abc"})
+    assert cache.get("klasjflkajslkfjaklsjflkasklfdj") == (True, None)
+    assert cache.get("YarnSwapper") == (False, None)
+    assert (cache.HITS, cache.MISSES) == (2, 1)
+
+    cache.save()
+    restored = RedditorCache(10, 60, 60, str(tmp_path / "redditors.json"))
+    assert restored.get("digitalmayhap") == (
+        True,
+        {"name": "digitalmayhap", "id": "abc"},
+    )
+
+
+def test_redditor_cache_expires():
+    cache = RedditorCache(10, 60, -1)
+    cache.put("klasjflkajslkfjaklsjflkasklfdj", None)
+    assert cache.get("klasjflkajslkfjaklsjflkasklfdj") == (False, None)
+
+
+def test_redditor_cache_evicts_oldest():
+    cache = RedditorCache(2, 60, 60)
+    cache.put("a", None)
+    cache.put("b", None)
+    cache.get("a")
+    cache.put("c", None)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, None)
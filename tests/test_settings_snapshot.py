@@ -0,0 +1,153 @@
+import json
+import threading
+import time
+import helpers
+import prawcore
+from types import SimpleNamespace
+from praw import Reddit
+from settings import Settings, WIKI_TEMPLATES
+from settings_snapshot import SettingsSnapshot
+
+FLAIR_TEMPLATES = [
+    {
+        "id": "ranged-id",
+        "text": "0-49:📧 Emails: {E} | 📬 Letters: {L}",
+        "css_class": "",
+        "mod_only": False,
+    }
+]
+
+
+def _pages() -> dict:
+    pages = {
+        template: (f"{template} text", f"{template}-rev") for template in WIKI_TEMPLATES
+    }
+    pages["confirmation_regex_pattern"] = (
+        r"u/([a-zA-Z0-9_-]{3,})\s+\\?-?\s*(\d+)(?:\s+|\s*-\s*)(\d+)",
+        "pattern-rev",
+    )
+    pages["flair_regex"] = (r"(\d+)\D+(\d+)", None)
+    pages["ranged_flair_template_regex"] = (r"^((\d+)-(\d+):)", None)
+    pages["special_flair_template_regex"] = (r"Emails: \{E\}", None)
+    return pages
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "state.db")
+    SettingsSnapshot(path).save(
+        "PenPalBotDev",
+        {"name": "penpal-bot", "id": "abc123"},
+        _pages(),
+        FLAIR_TEMPLATES,
+        {"digitalmayhap", "yarnswapper"},
+    )
+
+    snapshot = SettingsSnapshot(path).get("penpalbotdev")
+    assert snapshot["me"] == {"name": "penpal-bot", "id": "abc123"}
+    assert snapshot["pages"]["outage_recovery"] == [
+        "outage_recovery text",
+        "outage_recovery-rev",
+    ]
+    assert snapshot["moderators"] == ["digitalmayhap", "yarnswapper"]
+    assert SettingsSnapshot(path).get("snailmail") is None
+
+
+def test_fast_start_builds_settings_from_snapshot(tmp_path, monkeypatch):
+    path = str(tmp_path / "state.db")
+    monkeypatch.setenv("BOT_STATE_DB", path)
+    monkeypatch.setenv("JOURNAL_PATH", "")
+    monkeypatch.setenv("FAST_START", "1")
+    SettingsSnapshot(path).save(
+        "faststartdev",
+        {"name": "penpal-bot", "id": "abc123"},
+        _pages(),
+        FLAIR_TEMPLATES,
+        {"digitalmayhap"},
+    )
+    reloaded = []
+    monkeypatch.setattr(
+        Settings,
+        "reload",
+        lambda self, bot, name: reloaded.append(name) or ["Updated moderators"],
+    )
+    # never connects: everything comes from the snapshot
+    bot = Reddit(client_id="id", client_secret="secret", user_agent="test")
+
+    try:
+        settings = Settings(bot, "faststartdev")
+        assert settings.BOT_NAME == "penpal-bot"
+        assert settings.FULLNAME == "t2_abc123"
+        assert settings.CURRENT_MODS == {"digitalmayhap"}
+        assert settings.FLAIR_LADDER.find(10, False)["id"] == "ranged-id"
+        assert settings.CONFIRMATION_PATTERN.findall("u/yarnswapper 1 2") == [
+            ("yarnswapper", "1", "2")
+        ]
+        assert settings.FROM_SNAPSHOT
+        # checking against Reddit waits until the bot starts it, after the shards have forked
+        time.sleep(0.05)
+        assert reloaded == []
+        changed = threading.Event()
+        settings.start_revalidation(bot, changed.set)
+        assert changed.wait(5)
+        assert reloaded == ["faststartdev"]
+    finally:
+        Settings._instances.pop("faststartdev", None)
+
+
+class _WikiWithoutRevisions:
+    """A subreddit wiki whose revision history the bot may not read."""
+
+    def __init__(self, pages: dict):
+        self.PAGES = pages
+
+    def revisions(self, limit):
+        raise prawcore.exceptions.Forbidden(SimpleNamespace(status_code=403))
+
+    def __getitem__(self, name):
+        content, revision_id = self.PAGES[name.split("/", 1)[1]]
+        return SimpleNamespace(content_md=content, revision_id=revision_id)
+
+
+def test_reload_without_revision_history_rereads_every_page(tmp_path, monkeypatch):
+    path = str(tmp_path / "state.db")
+    monkeypatch.setenv("BOT_STATE_DB", path)
+    monkeypatch.setenv("JOURNAL_PATH", "")
+    monkeypatch.setenv("FAST_START", "1")
+    SettingsSnapshot(path).save(
+        "reloaddev",
+        {"name": "penpal-bot", "id": "abc123"},
+        _pages(),
+        FLAIR_TEMPLATES,
+        {"digitalmayhap"},
+    )
+    bot = Reddit(client_id="id", client_secret="secret", user_agent="test")
+
+    try:
+        settings = Settings(bot, "reloaddev")
+        pages = _pages()
+        pages["confirmation_message"] = ("New confirmation message", "message-rev-2")
+        settings.SUBREDDIT = SimpleNamespace(wiki=_WikiWithoutRevisions(pages))
+        assert settings.reload(bot, "reloaddev", include_flair_templates=False) == [
+            "Updated wiki page confirmation-bot/confirmation_message"
+        ]
+        assert settings.CONFIRMATION_TEMPLATE == "New confirmation message"
+    finally:
+        Settings._instances.pop("reloaddev", None)
+
+
+def test_load_secrets_uses_cache_file(tmp_path, monkeypatch):
+    path = tmp_path / "secrets.json"
+    path.write_text(
+        json.dumps(
+            {
+                "penpalbotdev": [time.time() + 60, '{"REDDIT_USERNAME": "cached"}'],
+                "snailmail": [time.time() - 60, '{"REDDIT_USERNAME": "expired"}'],
+            }
+        )
+    )
+    monkeypatch.delenv("DEV", raising=False)
+    monkeypatch.setenv("SECRETS_CACHE_PATH", str(path))
+    monkeypatch.setattr(helpers, "_SECRETS", {})
+
+    assert helpers.load_secrets("penpalbotdev") == {"REDDIT_USERNAME": "cached"}
+    assert helpers._read_secrets_cache("snailmail")[0] < time.time()
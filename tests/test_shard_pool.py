@@ -0,0 +1,98 @@
+import os
+import threading
+import shard_pool
+from shard_pool import ShardPool, shard_for
+
+
+class CountingShard:
+    """Keeps a running total per user, like flair, and reports which process did the work."""
+
+    def __init__(self, index):
+        self.INDEX = index
+        self.totals = {}
+
+    def confirm(self, matches):
+        results = []
+        for name, count in matches:
+            if name == "crash":
+                os._exit(1)
+            self.totals[name] = self.totals.get(name, 0) + count
+            results.append((name, self.totals[name], self.INDEX, os.getpid()))
+        return results
+
+    def fail(self):
+        raise ValueError("shard failure")
+
+
+def test_shard_for_is_stable_and_case_insensitive():
+    assert shard_for("DigitalMayhap", 8) == shard_for("digitalmayhap", 8)
+    assert {shard_for(f"user{index}", 4) for index in range(100)} == {0, 1, 2, 3}
+
+
+def test_shard_pool_routes_users_to_their_shard():
+    pool = ShardPool(3, CountingShard)
+    done = threading.Semaphore(0)
+    results = []
+
+    def collect(shard_results):
+        results.append([row for rows in shard_results for row in rows])
+        done.release()
+
+    names = ["alice", "bob", "carol", "dave"]
+    for _ in range(5):
+        pool.submit(
+            names,
+            lambda positions: ([(names[position], 1) for position in positions],),
+            collect,
+        )
+    for _ in range(5):
+        assert done.acquire(timeout=10)
+    pool.stop()
+
+    assert pool.stats()["completed"] == 5
+    for name in names:
+        rows = [row for result in results for row in result if row[0] == name]
+        # every increment for a user happened in order, in the same process
+        assert [row[1] for row in rows] == [1, 2, 3, 4, 5]
+        assert {row[2] for row in rows} == {shard_for(name, 3)}
+        assert len({row[3] for row in rows}) == 1
+    assert os.getpid() not in {row[3] for result in results for row in result}
+
+
+def test_shard_pool_survives_a_failing_command():
+    pool = ShardPool(1, CountingShard)
+    done = threading.Event()
+    results = []
+
+    def collect(shard_results):
+        results.extend(shard_results)
+        done.set()
+
+    pool._inboxes[0].put(("fail", None, ()))
+    pool.submit(["alice"], lambda positions: ([("alice", 2)],), collect)
+    assert done.wait(10)
+    pool.stop()
+    assert [row[:3] for row in results[0]] == [("alice", 2, 0)]
+
+
+def test_shard_pool_replaces_a_dead_worker(monkeypatch):
+    monkeypatch.setattr(shard_pool, "RESPAWN_DELAY", 0)
+    pool = ShardPool(1, CountingShard)
+    done = threading.Semaphore(0)
+    results = []
+
+    def collect(shard_results):
+        results.append(shard_results)
+        done.release()
+
+    # the worker dies on the first job, the second is still in its inbox
+    pool.submit(["crash"], lambda positions: ([("crash", 1)],), collect)
+    pool.submit(["alice"], lambda positions: ([("alice", 2)],), collect)
+    for _ in range(2):
+        assert done.acquire(timeout=10)
+    pool.stop()
+    assert results[0] == [None]
+    assert [row[:3] for row in results[1][0]] == [("alice", 2, 0)]
+    assert pool.stats()["respawned"] == 1
+    assert pool.stats()["failed"] == 1
+    assert pool.stats()["pending"] == 0
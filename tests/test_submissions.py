@@ -1,5 +1,10 @@
-from helpers_submission import post_monthly_submission, lock_previous_submissions
+from helpers_submission import (
+    post_monthly_submission,
+    lock_previous_submissions,
+    iter_root_comments,
+)
 from betamax import Betamax
+from praw import Reddit
 from settings import Settings
 
 
@@ -18,3 +23,58 @@ def test_monthly_submission_exists(recorder: Betamax, settings: Settings):
 def test_lock_monthly_submissions(recorder: Betamax, settings: Settings):
     with recorder.use_cassette("test_lock_monthly_submissions"):
         lock_previous_submissions(settings)
+
+
+def _thing(kind, **data):
+    return {"kind": kind, "data": data}
+
+
+def test_iter_root_comments_batches_more_children(bot: Reddit, monkeypatch):
+    more_ids = [f"m{index}" for index in range(150)]
+    requests = []
+
+    def get(path, params):
+        requests.append((path, params))
+        return bot._objector.objectify(
+            [
+                {"kind": "Listing", "data": {"children": []}},
+                {
+                    "kind": "Listing",
+                    "data": {
+                        "children": [
+                            _thing("t1", id="c1", parent_id="t3_abc", replies=""),
+                            _thing(
+                                "more",
+                                id="m",
+                                parent_id="t3_abc",
+                                count=150,
+                                children=more_ids,
+                            ),
+                        ]
+                    },
+                },
+            ]
+        )
+
+    def post(path, data):
+        requests.append((path, data))
+        return bot._objector.objectify(
+            {
+                "json": {
+                    "errors": [],
+                    "data": {
+                        "things": [
+                            _thing("t1", id=child, parent_id="t3_abc", replies="")
+                            for child in data["children"].split(",")
+                        ]
+                        + [_thing("t1", id="reply", parent_id="t1_m0", replies="")]
+                    },
+                }
+            }
+        )
+
+    monkeypatch.setattr(bot, "get", get)
+    monkeypatch.setattr(bot, "post", post)
+    comment_ids = [comment.id for comment in iter_root_comments(bot.submission("abc"))]
+    assert comment_ids == ["c1"] + more_ids
+    assert len(requests) == 3
@@ -0,0 +1,68 @@
+import threading
+import time
+from work_queue import KeyedWorkQueue
+
+
+def test_work_queue_keeps_order_per_key():
+    queue = KeyedWorkQueue(4, 100)
+    processed = []
+    lock = threading.Lock()
+
+    def handle(key, index):
+        time.sleep(0.001 * (index % 3))
+        with lock:
+            processed.append((key, index))
+
+    for index in range(30):
+        key = f"user{index % 3}"
+        queue.put({key}, handle, key, index)
+    queue.join()
+
+    for key in ["user0", "user1", "user2"]:
+        indexes = [index for processed_key, index in processed if processed_key == key]
+        assert indexes == sorted(indexes)
+    assert queue.stats()["processed"] == 30
+
+
+def test_work_queue_never_overlaps_shared_keys():
+    queue = KeyedWorkQueue(4, 100)
+    running = set()
+    overlaps = []
+
+    def handle(keys):
+        if running & keys:
+            overlaps.append(keys)
+        running.update(keys)
+        time.sleep(0.002)
+        running.difference_update(keys)
+
+    for index in range(20):
+        keys = {f"user{index % 4}", f"user{(index + 1) % 4}"}
+        queue.put(keys, handle, keys)
+    queue.join()
+    assert overlaps == []
+
+
+def test_work_queue_backpressure():
+    queue = KeyedWorkQueue(1, 1)
+    release = threading.Event()
+    queue.put(set(), release.wait)
+    queue.put(set(), lambda: None)
+    putter = threading.Thread(target=queue.put, args=(set(), lambda: None))
+    putter.start()
+    time.sleep(0.05)
+    assert putter.is_alive()
+    release.set()
+    putter.join(1)
+    queue.join()
+    assert queue.stats()["overflows"] >= 1
+    assert queue.stats()["processed"] == 3
+
+
+def test_work_queue_counts_failures():
+    queue = KeyedWorkQueue(1, 10)
+    queue.put({"user"}, lambda: 1 / 0)
+    queue.put({"user"}, lambda: None)
+    queue.join()
+    assert queue.stats()["failed"] == 1
+    assert queue.stats()["processed"] == 2